@@ -1,18 +1,42 @@
 import tornado.web
 import json
+import time
 import uuid
 from datetime import datetime, timezone
 from orm.db_init import session_scope
+from services.metrics_service import metrics_service
+from services.query_diagnostics_service import query_diagnostics_service
 
 
 class BaseHandler(tornado.web.RequestHandler):
     def set_default_headers(self):
         self.set_header("Content-Type", 'application/json; charset="utf-8"')
         self.set_header("Access-Control-Allow-Origin", "*")
-        self.set_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        self.set_header("Access-Control-Allow-Headers", "Content-Type, Authorization, Idempotency-Key")
         self.set_header("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS, PATCH")
         self.set_header("Access-Control-Allow-Credentials", "true")
 
+    def prepare(self):
+        # Subclasses overriding prepare() call this first, so every request is measured
+        self.request_metrics = metrics_service.start_request(type(self).__name__)
+
+    def finish(self, chunk=None):
+        request_metrics = getattr(self, 'request_metrics', None)
+        if request_metrics is not None:
+            self.set_header("Server-Timing", request_metrics.server_timing(self.request.request_time()))
+        return super().finish(chunk)
+
+    def on_finish(self):
+        request_metrics = getattr(self, 'request_metrics', None)
+        metrics_service.finish_request(
+            type(self).__name__,
+            self.request.method,
+            self.get_status(),
+            self.request.request_time(),
+            request_metrics
+        )
+        query_diagnostics_service.finish_request(type(self).__name__, self.request.method, self.request.path, request_metrics)
+
     def options(self, *args):
         self.set_status(204)
         self.finish()
@@ -21,7 +45,7 @@ class BaseHandler(tornado.web.RequestHandler):
         return session_scope()
     
     def write_success(self, data=None, status_code=200, message=None):
-        """Write successful response in standardized format"""
+        """Write successful response in standardized format, returning the serialized body"""
         self.set_status(status_code)
         if data is None:
             data = {}
@@ -35,7 +59,9 @@ class BaseHandler(tornado.web.RequestHandler):
         if message:
             response["message"] = message
             
-        self.write(json.dumps(response, default=str))
+        body = self.serialize(response)
+        self.write(body)
+        return body
     
     def write_error_response(self, errors, status_code=400, error_code=None, data=None):
         """Write error response in standardized format"""
@@ -55,7 +81,16 @@ class BaseHandler(tornado.web.RequestHandler):
         if error_code:
             response["errorCode"] = error_code
             
-        self.write(json.dumps(response, default=str))
+        self.write(self.serialize(response))
+    
+    def serialize(self, response):
+        """Serialize a response body to JSON, counting the time towards the request's serialization time"""
+        started = time.perf_counter()
+        body = json.dumps(response, default=str)
+        request_metrics = getattr(self, 'request_metrics', None)
+        if request_metrics is not None:
+            request_metrics.serialize_seconds += time.perf_counter() - started
+        return body
     
     def get_json_body(self):
         """Parse JSON body with error handling"""
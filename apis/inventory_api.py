@@ -1,26 +1,124 @@
 import json
+import uuid
 import csv
 import io
 from datetime import datetime, timezone
 from apis.base_handler import BaseHandler
-from orm.controllers.controller_inventory import InventoryController
+from orm.controllers.controller_inventory import InventoryController, InsufficientStockError
+from orm.controllers.controller_stock_alerts import StockAlertController
+from orm.models.model_stock_movements import MovementType
+from orm.models.model_stock_alerts import AlertType
+from orm.models.model_inventory import InventoryStatus
+
+
+MAX_BULK_ADJUSTMENTS = 1000
+MAX_STOCKTAKE_ITEMS = 2000
+
+# Adjustment reasons accepted by the API and the stock movement type each one records
+ADJUSTMENT_REASONS = {
+    'RESTOCK': MovementType.restock,
+    'SALE': MovementType.usage,
+    'WASTE': MovementType.waste,
+    'ADJUSTMENT': MovementType.adjustment
+}
+
+
+def parse_inventory_item_id(value):
+    """Normalize an inventoryItemId to its canonical UUID string, or None if it isn't one"""
+    try:
+        return str(uuid.UUID(value))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def parse_adjustment(data):
+    """Validate an adjustment payload, returning (errors, adjustment) for InventoryController.adjust_stock_bulk"""
+    errors = []
+    adjustment = data.get('adjustment')
+    reason = data.get('reason', 'ADJUSTMENT')
+    reference = data.get('reference') or ''
+
+    if adjustment is None:
+        errors.append("Adjustment amount is required")
+    elif isinstance(adjustment, bool) or not isinstance(adjustment, (int, float)):
+        errors.append("Adjustment amount must be a number")
+    if reason not in ADJUSTMENT_REASONS:
+        errors.append("Invalid reason. Must be one of: RESTOCK, SALE, WASTE, ADJUSTMENT")
+    if errors:
+        return errors, None
+
+    return errors, {
+        'adjustment': adjustment,
+        'movement_type': ADJUSTMENT_REASONS[reason],
+        'reason': f"{reason} {reference}".strip()[:255],
+        'notes': data.get('notes') or None,
+        'cost': data.get('cost'),
+        'supplier': data.get('supplier')
+    }
+
+
+def adjustment_record(movement, reason, reference):
+    """Format a recorded stock movement as an adjustment according to API spec"""
+    return {
+        "id": movement['id'],
+        "inventoryItemId": movement['inventoryItemId'],
+        "previousStock": movement['previousStock'],
+        "newStock": movement['newStock'],
+        "adjustment": movement['quantity'],
+        "reason": reason,
+        "timestamp": movement['createdAt'],
+        "notes": movement['notes'] or '',
+        "reference": reference
+    }
 
 
 class InventoryItemsHandler(BaseHandler):
     def initialize(self):
         self.inventory_controller = InventoryController()
+        self.stock_alert_controller = StockAlertController()
 
     def get(self):
+        status = self.get_argument('status', None)
+        category = self.get_argument('category', None)
+        name = self.get_argument('name', None)
+        # Without limit or offset the whole inventory is returned, as before pagination was added
+        paginate = self.get_argument('limit', None) is not None or self.get_argument('offset', None) is not None
         try:
-            inventory_items = self.inventory_controller.get_inventory_items_by_filters(all=True)
-            inventory_items = inventory_items or {"inventory": []}
+            limit = int(self.get_argument('limit', 50))
+            offset = int(self.get_argument('offset', 0))
+        except ValueError:
+            self.write_error_response(["Limit and offset must be integers"], 400, "VALIDATION_ERROR")
+            return
+
+        if status and status not in [s.value for s in InventoryStatus]:
+            self.write_error_response([f"Invalid status. Must be one of: {', '.join(s.value for s in InventoryStatus)}"], 400, "VALIDATION_ERROR")
+            return
+
+        # Validate limit
+        limit = max(1, min(limit, 200))
+        offset = max(0, offset)
+
+        try:
+            inventory_items = self.inventory_controller.get_inventory_items_by_filters(
+                status=status, category=category, name=name, all=True,
+                start_and_end=(offset, offset + limit) if paginate else None
+            )
+            inventory_items = inventory_items or {"amount": 0, "inventory": []}
+            total_items = inventory_items.get('amount', 0)
             
             # Format response according to API specification
             response_data = {
                 "inventory": inventory_items.get('inventory', []),
-                "lowStockItems": sum(1 for item in inventory_items.get('inventory', []) if item.get('isLowStock')),
-                "totalItems": len(inventory_items.get('inventory', []))
+                "lowStockItems": self.stock_alert_controller.count_open_alerts(name=name, category=category, status=status),
+                "totalItems": total_items
             }
+            if paginate:
+                response_data["pagination"] = {
+                    "total": total_items,
+                    "limit": limit,
+                    "offset": offset,
+                    "hasMore": offset + limit < total_items
+                }
             
             self.write_success(response_data, message="Inventory retrieved successfully")
         except Exception as e:
@@ -46,6 +144,21 @@ class InventoryItemsHandler(BaseHandler):
             self.write_error_response(["Failed to create inventory item"], 500, "INTERNAL_ERROR")
 
 
+class InventoryChangesHandler(BaseHandler):
+    def initialize(self):
+        self.inventory_controller = InventoryController()
+
+    def get(self):
+        """Inventory items changed since ?since=<syncToken>, or a full snapshot without one"""
+        try:
+            changes = self.inventory_controller.get_inventory_item_changes(self.get_argument('since', None))
+            self.write_success(changes, message="Inventory changes retrieved successfully")
+        except ValueError as e:
+            self.write_error_response([str(e)], 400, "INVALID_SYNC_TOKEN")
+        except Exception as e:
+            self.write_error_response(["Failed to retrieve inventory changes"], 500, "INTERNAL_ERROR")
+
+
 class InventoryItemHandler(BaseHandler):
     def initialize(self):
         self.inventory_controller = InventoryController()
@@ -93,59 +206,180 @@ class InventoryAdjustHandler(BaseHandler):
         if data is None:
             return
 
-        adjustment = data.get('adjustment')
-        reason = data.get('reason', 'ADJUSTMENT')
-        notes = data.get('notes', '')
-        reference = data.get('reference', '')
-
-        if adjustment is None:
-            self.write_error_response(["Adjustment amount is required"], 400, "VALIDATION_ERROR")
-            return
-
-        if reason not in ['RESTOCK', 'SALE', 'WASTE', 'ADJUSTMENT']:
-            self.write_error_response(["Invalid reason. Must be one of: RESTOCK, SALE, WASTE, ADJUSTMENT"], 400, "VALIDATION_ERROR")
+        errors, adjustment = parse_adjustment(data)
+        if errors:
+            self.write_error_response(errors, 400, "VALIDATION_ERROR")
             return
 
         try:
-            # Get current inventory item
-            current_item = self.inventory_controller.get_inventory_items_by_filters(id=id)
-            if not current_item:
+            result = self.inventory_controller.adjust_stock(id, staff_id=data.get('staffId'), **adjustment)
+            if not result:
                 self.write_error_response(["Inventory item not found"], 404, "NOT_FOUND")
                 return
 
-            previous_stock = current_item.get('currentStock', 0)
-            new_stock = previous_stock + adjustment
+            response_data = {
+                "inventory": result['inventory'],
+                "adjustment": adjustment_record(result['movement'], data.get('reason', 'ADJUSTMENT'), data.get('reference', ''))
+            }
 
-            if new_stock < 0:
-                self.write_error_response(["Adjustment would result in negative stock"], 400, "INVALID_ADJUSTMENT")
-                return
+            self.write_success(response_data, message="Stock adjusted successfully")
 
-            # Update inventory
-            updated_inventory = self.inventory_controller.update_inventory_item(id, currentStock=new_stock)
-            
-            # Create adjustment record (would be stored in database in real implementation)
-            adjustment_record = {
-                "id": f"adj-{datetime.now(timezone.utc).isoformat()}",
-                "previousStock": previous_stock,
-                "newStock": new_stock,
-                "adjustment": adjustment,
-                "reason": reason,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "notes": notes,
-                "reference": reference
-            }
+        except InsufficientStockError:
+            self.write_error_response(["Adjustment would result in negative stock"], 400, "INVALID_ADJUSTMENT")
+        except Exception as e:
+            self.write_error_response(["Failed to adjust stock"], 500, "INTERNAL_ERROR")
+
+
+class InventoryBulkAdjustHandler(BaseHandler):
+    def initialize(self):
+        self.inventory_controller = InventoryController()
+
+    def post(self):
+        """
+        Apply up to MAX_BULK_ADJUSTMENTS stock adjustments atomically.
+
+        If any item is unknown or would go below zero, nothing is changed.
+        """
+        data = self.get_json_body()
+        if data is None:
+            return
+
+        adjustments = data.get('adjustments')
+        if not isinstance(adjustments, list) or not adjustments:
+            self.write_error_response(["Adjustments are required"], 400, "VALIDATION_ERROR")
+            return
+        if len(adjustments) > MAX_BULK_ADJUSTMENTS:
+            self.write_error_response([f"At most {MAX_BULK_ADJUSTMENTS} adjustments can be applied at once"], 400, "VALIDATION_ERROR")
+            return
 
+        errors = []
+        parsed = []
+        seen = set()
+        for index, item in enumerate(adjustments):
+            if not isinstance(item, dict):
+                errors.append(f"Adjustment {index + 1}: must be an object")
+                continue
+            inventory_item_id = parse_inventory_item_id(item.get('inventoryItemId'))
+            item_errors, adjustment = parse_adjustment(item)
+            if not item.get('inventoryItemId'):
+                item_errors.insert(0, "inventoryItemId is required")
+            elif inventory_item_id is None:
+                item_errors.insert(0, "inventoryItemId must be a valid UUID")
+            elif inventory_item_id in seen:
+                item_errors.insert(0, "inventory item is listed more than once")
+            errors.extend(f"Adjustment {index + 1}: {error}" for error in item_errors)
+            if not item_errors:
+                seen.add(inventory_item_id)
+                adjustment['inventory_item_id'] = inventory_item_id
+                parsed.append(adjustment)
+
+        if errors:
+            self.write_error_response(errors, 400, "VALIDATION_ERROR")
+            return
+
+        try:
+            result = self.inventory_controller.adjust_stock_bulk(parsed, staff_id=data.get('staffId'))
             response_data = {
-                "inventory": updated_inventory,
-                "adjustment": adjustment_record
+                "inventory": result['inventory'],
+                "adjustments": [
+                    adjustment_record(movement, item.get('reason', 'ADJUSTMENT'), item.get('reference', ''))
+                    for movement, item in zip(result['movements'], adjustments)
+                ]
             }
-
             self.write_success(response_data, message="Stock adjusted successfully")
 
+        except InsufficientStockError as e:
+            self.write_error_response(["Adjustment would result in negative stock"], 400, "INVALID_ADJUSTMENT",
+                                      data={"inventoryItemIds": e.inventory_item_ids})
+        except LookupError as e:
+            self.write_error_response([str(e)], 404, "NOT_FOUND")
         except Exception as e:
             self.write_error_response(["Failed to adjust stock"], 500, "INTERNAL_ERROR")
 
 
+class InventoryStocktakeHandler(BaseHandler):
+    def initialize(self):
+        self.inventory_controller = InventoryController()
+
+    def post(self):
+        """
+        Close a stock take by applying the whole count sheet at once.
+
+        Every counted item is set to its counted stock and the variances are returned.
+        If any item is unknown, nothing is changed.
+        """
+        data = self.get_json_body()
+        if data is None:
+            return
+
+        counts = data.get('counts')
+        if not isinstance(counts, list) or not counts:
+            self.write_error_response(["Counts are required"], 400, "VALIDATION_ERROR")
+            return
+        if len(counts) > MAX_STOCKTAKE_ITEMS:
+            self.write_error_response([f"A stock take can contain at most {MAX_STOCKTAKE_ITEMS} items"], 400, "VALIDATION_ERROR")
+            return
+
+        errors = []
+        parsed = []
+        seen = set()
+        for index, count in enumerate(counts):
+            raw_item_id = count.get('inventoryItemId') if isinstance(count, dict) else None
+            inventory_item_id = parse_inventory_item_id(raw_item_id)
+            counted_stock = count.get('countedStock') if isinstance(count, dict) else None
+            if not raw_item_id:
+                errors.append(f"Count {index + 1}: inventoryItemId is required")
+            elif inventory_item_id is None:
+                errors.append(f"Count {index + 1}: inventoryItemId must be a valid UUID")
+            elif inventory_item_id in seen:
+                errors.append(f"Count {index + 1}: inventory item is listed more than once")
+            elif isinstance(counted_stock, bool) or not isinstance(counted_stock, (int, float)) or counted_stock < 0:
+                errors.append(f"Count {index + 1}: countedStock must be a non-negative number")
+            else:
+                seen.add(inventory_item_id)
+                parsed.append({'inventory_item_id': inventory_item_id, 'counted_stock': counted_stock})
+
+        if errors:
+            self.write_error_response(errors, 400, "VALIDATION_ERROR")
+            return
+
+        try:
+            variances = self.inventory_controller.apply_stocktake(parsed, staff_id=data.get('staffId'), notes=data.get('notes'))
+            response_data = {
+                "variances": variances,
+                "summary": {
+                    "itemsCounted": len(variances),
+                    "itemsWithVariance": sum(1 for v in variances if v['variance'] != 0),
+                    "totalVarianceCost": round(sum(v['varianceCost'] for v in variances), 2)
+                }
+            }
+            self.write_success(response_data, message="Stock take applied successfully")
+
+        except LookupError as e:
+            self.write_error_response([str(e)], 404, "NOT_FOUND")
+        except Exception as e:
+            self.write_error_response(["Failed to apply stock take"], 500, "INTERNAL_ERROR")
+
+
+class InventoryAlertsHandler(BaseHandler):
+    def initialize(self):
+        self.stock_alert_controller = StockAlertController()
+
+    def get(self):
+        alert_type = self.get_argument('type', None)
+        include_resolved = self.get_argument('includeResolved', 'false').lower() == 'true'
+
+        if alert_type and alert_type not in [t.value for t in AlertType]:
+            self.write_error_response([f"Invalid type. Must be one of: {', '.join(t.value for t in AlertType)}"], 400, "VALIDATION_ERROR")
+            return
+
+        try:
+            alerts = self.stock_alert_controller.get_stock_alerts(alert_type=alert_type, include_resolved=include_resolved)
+            self.write_success({"alerts": alerts, "total": len(alerts)}, message="Stock alerts retrieved successfully")
+        except Exception as e:
+            self.write_error_response(["Failed to retrieve stock alerts"], 500, "INTERNAL_ERROR")
+
+
 class InventoryExportHandler(BaseHandler):
     def initialize(self):
         self.inventory_controller = InventoryController()
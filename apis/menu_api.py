@@ -1,10 +1,17 @@
+import csv
+import io
 import json
 import os
 from decouple import config
 from apis.base_handler import BaseHandler
+from apis.upload_api import StreamingUploadHandler, MULTIPART_OVERHEAD_BYTES
 from orm.controllers.controller_menu import MenuController
+from services.menu_cache_service import menu_cache_service
 
 UPLOAD_DIR = config('UPLOAD_DIR', default='uploads')
+MAX_IMPORT_ROWS = config('MENU_IMPORT_MAX_ROWS', default=10000, cast=int)
+MAX_IMPORT_BYTES = config('MENU_IMPORT_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+MAX_SEARCH_RESULTS = 50
 
 class MenuItemsHandler(BaseHandler):
     def initialize(self):
@@ -13,11 +20,21 @@ class MenuItemsHandler(BaseHandler):
             os.makedirs(UPLOAD_DIR)
 
     def get(self):
-        menu_items = self.menu_controller.get_menu_items_by_filters(all=True)
-        if menu_items:
-            self.write_success(menu_items)
+        # Served from the in-memory catalog; tills revalidate with If-None-Match
+        catalog = menu_cache_service.get_catalog()
+        self.set_header("Etag", catalog['etag'])
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Menu-Version", str(catalog['version']))
+        self.set_header("Vary", "Accept-Encoding")
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        if 'gzip' in self.request.headers.get("Accept-Encoding", ""):
+            self.set_header("Content-Encoding", "gzip")
+            self.write(catalog['gzip_body'])
         else:
-            self.write_success({"menu_items": [], "amount": 0})
+            self.write(catalog['body'])
 
     def post(self):
         # Handle both JSON and form data
@@ -94,6 +111,51 @@ class MenuItemsHandler(BaseHandler):
             self.write_error_response(["Failed to create menu item"], 500, "INTERNAL_ERROR")
 
 
+class MenuItemChangesHandler(BaseHandler):
+    def initialize(self):
+        self.menu_controller = MenuController()
+
+    def get(self):
+        """Menu items changed since ?since=<syncToken>, or a full snapshot without one"""
+        try:
+            changes = self.menu_controller.get_menu_item_changes(self.get_argument('since', None))
+            self.write_success(changes, message="Menu changes retrieved successfully")
+        except ValueError as e:
+            self.write_error_response([str(e)], 400, "INVALID_SYNC_TOKEN")
+        except Exception as e:
+            self.write_error_response(["Failed to retrieve menu changes"], 500, "INTERNAL_ERROR")
+
+
+class MenuItemSearchHandler(BaseHandler):
+    def initialize(self):
+        self.menu_controller = MenuController()
+
+    def get(self):
+        """Ranked menu search for ?q=, e.g. the till's typeahead; ?category= and ?includeInactive=true narrow or widen it"""
+        term = self.get_argument('q', '').strip()
+        if not term:
+            self.write_error_response(["q is required"], 400, "VALIDATION_ERROR")
+            return
+        try:
+            limit = int(self.get_argument('limit', 10))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_SEARCH_RESULTS:
+            self.write_error_response([f"limit must be between 1 and {MAX_SEARCH_RESULTS}"], 400, "VALIDATION_ERROR")
+            return
+
+        try:
+            results = self.menu_controller.search_menu_items(
+                term,
+                limit=limit,
+                category=self.get_argument('category', None),
+                include_inactive=self.get_argument('includeInactive', 'false').lower() == 'true'
+            )
+            self.write_success({"query": term, "results": results, "amount": len(results)})
+        except Exception as e:
+            self.write_error_response(["Failed to search menu items"], 500, "INTERNAL_ERROR")
+
+
 class MenuItemHandler(BaseHandler):
     def initialize(self):
         self.menu_controller = MenuController()
@@ -203,141 +265,101 @@ class MenuItemHandler(BaseHandler):
             self.write_error_response(["Failed to delete menu item"], 500, "INTERNAL_ERROR")
 
 
-class MenuItemsBulkImportHandler(BaseHandler):
+class MenuItemsBulkImportHandler(StreamingUploadHandler):
+    """Import menu items from a CSV file, which is spooled to disk as it arrives and read from there"""
+
     def initialize(self):
-        self.menu_controller = MenuController()
+        super().initialize()
+        self.max_file_size = MAX_IMPORT_BYTES
+        self.max_files = 1
+        self.max_body_size = self.max_file_size + MULTIPART_OVERHEAD_BYTES
+
+    def parse_rows(self, csv_file, error_details):
+        """Validate CSV rows as they are read from the binary file, returning the rows to import"""
+        rows = []
+        seen = {}
+        reader = csv.DictReader(io.TextIOWrapper(csv_file, encoding='utf-8-sig', newline=''))
+        for row_num, row in enumerate(reader, 1):
+            if row_num > MAX_IMPORT_ROWS:
+                error_details.append({"row": row_num, "error": f"Only the first {MAX_IMPORT_ROWS} rows are imported", "data": ""})
+                break
+
+            data = ','.join(v for v in row.values() if isinstance(v, str))
+            name = (row.get('name') or '').strip()
+            size = (row.get('size_name') or '').strip() or 'Regular'
+            category = (row.get('category') or '').strip() or 'General'
+            try:
+                price = float(row.get('size_price') or 0)
+            except ValueError:
+                price = 0
+
+            if not name or price <= 0:
+                error = "Name and valid price are required"
+            elif len(name) > 100 or len(size) > 50 or len(category) > 50:
+                error = "Name must be 100 characters or less, size and category 50 or less"
+            elif price > 9999.99:
+                error = "Price cannot exceed 9999.99"
+            elif (name.lower(), size.lower()) in seen:
+                error = f"Duplicate of row {seen[(name.lower(), size.lower())]}"
+            else:
+                error = None
+
+            if error:
+                error_details.append({"row": row_num, "error": error, "data": data})
+                continue
+
+            seen[(name.lower(), size.lower())] = row_num
+            rows.append({
+                'row': row_num,
+                'name': name,
+                'size': size,
+                'price': price,
+                'category': category,
+                'description': (row.get('description') or '').strip() or None
+            })
+        return rows
 
     def post(self):
+        if not self.finish_stream():
+            return
+
         # Check if file was uploaded
-        if not self.request.files or 'file' not in self.request.files:
+        csv_parts = [part for part in self.parser.files if part['name'] == 'file']
+        if not csv_parts:
             self.write_error_response(["CSV file is required"], 400, "VALIDATION_ERROR")
             return
+        if csv_parts[0]['too_large']:
+            self.write_error_response(
+                [f"CSV file too large. Maximum {MAX_IMPORT_BYTES // (1024 * 1024)}MB allowed."], 413, "REQUEST_TOO_LARGE"
+            )
+            return
 
         # Get form parameters
-        skip_duplicates = self.get_body_argument('skipDuplicates', 'true').lower() == 'true'
-        update_existing = self.get_body_argument('updateExisting', 'false').lower() == 'true'
+        update_existing = self.parser.fields.get('updateExisting', 'false').lower() == 'true'
+        dry_run = self.parser.fields.get('dryRun', 'false').lower() == 'true'
 
         try:
-            file_info = self.request.files['file'][0]
-            csv_content = file_info['body'].decode('utf-8')
-            
-            # Parse CSV
-            import csv
-            import io
-            
-            reader = csv.DictReader(io.StringIO(csv_content))
-            
-            imported = 0
-            skipped = 0
-            errors = 0
             error_details = []
-            
-            for row_num, row in enumerate(reader, 1):
-                try:
-                    name = row.get('name', '').strip()
-                    description = row.get('description', '').strip()
-                    category = row.get('category', 'General').strip()
-                    size_name = row.get('size_name', 'Regular').strip()
-                    size_price = float(row.get('size_price', 0))
-                    size_volume = row.get('size_volume', '').strip()
-                    allergens = row.get('allergens', '').strip()
-                    calories = int(row.get('calories', 0)) if row.get('calories') else 0
-
-                    if not name or size_price <= 0:
-                        error_details.append({
-                            "row": row_num,
-                            "error": "Name and valid price are required",
-                            "data": ','.join(row.values())
-                        })
-                        errors += 1
-                        continue
-
-                    # Check for existing item
-                    existing_item = None
-                    if skip_duplicates or update_existing:
-                        # Look for existing item by name and size
-                        existing_items = self.menu_controller.get_menu_items_by_filters(all=True)
-                        if existing_items and 'menu_items' in existing_items:
-                            existing_item = next((
-                                item for item in existing_items['menu_items'] 
-                                if item['name'].lower() == name.lower() and item['size'].lower() == size_name.lower()
-                            ), None)
-                    
-                    if existing_item:
-                        if update_existing:
-                            # Update existing item
-                            update_data = {
-                                'description': description,
-                                'category': category,
-                                'price': size_price,
-                                'calories': calories
-                            }
-                            if allergens:
-                                update_data['allergens'] = allergens
-                            if size_volume:
-                                update_data['size_volume'] = size_volume
-                                
-                            updated_item = self.menu_controller.update_menu_item(existing_item['id'], **update_data)
-                            if updated_item:
-                                imported += 1
-                            else:
-                                error_details.append({
-                                    "row": row_num,
-                                    "error": "Failed to update existing item",
-                                    "data": f"{name} - {size_name}"
-                                })
-                                errors += 1
-                        else:
-                            # Skip duplicate
-                            skipped += 1
-                    else:
-                        # Create new item
-                        try:
-                            new_item = self.menu_controller.create_menu_item(
-                                name=name,
-                                size=size_name,
-                                price=size_price,
-                                description=description,
-                                category=category,
-                                calories=calories,
-                                allergens=allergens if allergens else None,
-                                size_volume=size_volume if size_volume else None,
-                                is_active=True,
-                                sort_order=0
-                            )
-                            if new_item:
-                                imported += 1
-                            else:
-                                error_details.append({
-                                    "row": row_num,
-                                    "error": "Failed to create menu item",
-                                    "data": f"{name} - {size_name}"
-                                })
-                                errors += 1
-                        except Exception as create_error:
-                            error_details.append({
-                                "row": row_num,
-                                "error": f"Creation error: {str(create_error)}",
-                                "data": f"{name} - {size_name}"
-                            })
-                            errors += 1
-
-                except Exception as e:
-                    error_details.append({
-                        "row": row_num,
-                        "error": str(e),
-                        "data": ','.join(row.values()) if row else ""
-                    })
-                    errors += 1
+            try:
+                with open(csv_parts[0]['path'], 'rb') as csv_file:
+                    rows = self.parse_rows(csv_file, error_details)
+            except (UnicodeDecodeError, csv.Error) as e:
+                self.write_error_response([f"Invalid CSV file: {e}"], 400, "VALIDATION_ERROR")
+                return
+
+            result = self.menu_controller.bulk_import_menu_items(rows, update_existing=update_existing, dry_run=dry_run)
 
             response_data = {
-                "imported": imported,
-                "skipped": skipped,
-                "errors": errors,
-                "details": error_details
+                "imported": len(result['created']) + len(result['updated']),
+                "created": len(result['created']),
+                "updated": len(result['updated']),
+                "skipped": len(result['skipped']),
+                "errors": len(error_details),
+                "details": error_details,
+                "dryRun": dry_run
             }
 
-            self.write_success(response_data, message="Bulk import completed")
+            self.write_success(response_data, message="Bulk import dry run completed" if dry_run else "Bulk import completed")
 
         except Exception as e:
             self.write_error_response(["Failed to process bulk import"], 500, "INTERNAL_ERROR")
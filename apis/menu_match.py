@@ -0,0 +1,132 @@
+import os
+import re
+import unicodedata
+from collections import defaultdict
+
+# Filename spellings of the sizes used on menu items
+SIZE_ALIASES = {
+    's': 'small', 'sm': 'small', 'sml': 'small', 'small': 'small',
+    'm': 'medium', 'med': 'medium', 'medium': 'medium',
+    'l': 'large', 'lg': 'large', 'lrg': 'large', 'large': 'large',
+    'reg': 'regular', 'regular': 'regular'
+}
+MIN_MATCH_SCORE = 0.5
+MAX_CANDIDATES = 3
+
+
+def normalize_tokens(text):
+    """Lowercase ASCII word tokens of a name or filename, e.g. 'Café-Latte_2' -> ['cafe', 'latte', '2']"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.findall(r'[a-z0-9]+', text)
+
+
+def trigrams(tokens):
+    padded = f"  {' '.join(tokens)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MenuMatchIndex:
+    """
+    Index of menu items for matching image filenames to them
+
+    Items are grouped by normalized name, with their sizes as keys, and the
+    groups are indexed by word token and by character trigram. A filename is
+    scored against the groups sharing a token or trigram with it only, so a
+    lookup costs about the same with ten menu items as with thousands. Build it
+    once per request and match every file against it.
+    """
+
+    def __init__(self, menu_items):
+        self.groups = []  # {'name', 'tokens', 'trigrams', 'sizes': {size: item}}
+        self._token_postings = defaultdict(set)
+        self._trigram_postings = defaultdict(set)
+
+        groups_by_key = {}
+        for item in menu_items:
+            tokens = normalize_tokens(item['name'])
+            key = ' '.join(tokens)
+            if not key:
+                continue
+            if key not in groups_by_key:
+                groups_by_key[key] = len(self.groups)
+                self.groups.append({'name': item['name'], 'tokens': set(tokens), 'trigrams': trigrams(tokens), 'sizes': {}})
+            size = ' '.join(normalize_tokens(item.get('size') or ''))
+            self.groups[groups_by_key[key]]['sizes'][size] = item
+
+        self.sizes = {size for group in self.groups for size in group['sizes']}
+        for group_id, group in enumerate(self.groups):
+            for token in group['tokens']:
+                self._token_postings[token].add(group_id)
+            for trigram in group['trigrams']:
+                self._trigram_postings[trigram].add(group_id)
+
+    def match(self, filename, limit=MAX_CANDIDATES):
+        """
+        Rank the menu items a filename could be an image of
+
+        A size in the filename ('latte_large.jpg', 'Latte-L.png') restricts the
+        match to that size; without one, every size of the matched item is a
+        candidate.
+
+        Returns:
+            list: Up to limit candidates, best first, each with 'name', 'score'
+                and the matching 'items'
+        """
+        tokens = normalize_tokens(os.path.splitext(filename)[0])
+        if not tokens:
+            return []
+
+        # Read trailing/embedded size words as sizes, but also try the whole name
+        # in case the size word is part of the item's name
+        readings = [(tokens, None)]
+        sizes = [SIZE_ALIASES.get(token, token) for token in tokens if SIZE_ALIASES.get(token, token) in self.sizes]
+        if sizes:
+            name_tokens = [token for token in tokens if SIZE_ALIASES.get(token, token) not in self.sizes]
+            if name_tokens:
+                readings.append((name_tokens, sizes[-1]))
+
+        best = {}
+        for name_tokens, size in readings:
+            for group_id, score in self._score(name_tokens).items():
+                items = self._items_for_size(self.groups[group_id], size)
+                if items and score >= MIN_MATCH_SCORE and score > best.get(group_id, (0, None))[0]:
+                    best[group_id] = (score, items)
+
+        ranked = sorted(best.items(), key=lambda entry: (-entry[1][0], self.groups[entry[0]]['name']))
+        return [
+            {'name': self.groups[group_id]['name'], 'score': round(score, 3), 'items': items}
+            for group_id, (score, items) in ranked[:limit]
+        ]
+
+    def _score(self, tokens):
+        query_tokens = set(tokens)
+        query_trigrams = trigrams(tokens)
+
+        shared_trigrams = defaultdict(int)
+        for trigram in query_trigrams:
+            for group_id in self._trigram_postings.get(trigram, ()):
+                shared_trigrams[group_id] += 1
+        candidates = set(shared_trigrams)
+        for token in query_tokens:
+            candidates |= self._token_postings.get(token, set())
+
+        scores = {}
+        for group_id in candidates:
+            group = self.groups[group_id]
+            if query_tokens == group['tokens']:
+                scores[group_id] = 1.0
+                continue
+            # Dice coefficient over trigrams tolerates typos and missing letters
+            dice = 2 * shared_trigrams[group_id] / (len(query_trigrams) + len(group['trigrams']))
+            # Token overlap, boosted when one name contains the other ('latte' / 'caffe latte')
+            overlap = len(query_tokens & group['tokens']) / len(query_tokens | group['tokens'])
+            if overlap and (query_tokens <= group['tokens'] or group['tokens'] <= query_tokens):
+                overlap = max(overlap, 0.75)
+            scores[group_id] = max(dice, overlap)
+        return scores
+
+    def _items_for_size(self, group, size):
+        if size is None:
+            return list(group['sizes'].values())
+        item = group['sizes'].get(size)
+        return [item] if item else []
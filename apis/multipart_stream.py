@@ -0,0 +1,189 @@
+import hashlib
+import os
+import tempfile
+from email.message import Message
+from email.utils import collapse_rfc2231_value
+from tornado.httputil import HTTPHeaders
+
+MAX_PART_HEADER_BYTES = 16 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class MultipartError(ValueError):
+    """Raised when a multipart/form-data body is malformed or over its limits"""
+
+
+class MultipartStreamParser:
+    """
+    Incremental multipart/form-data parser for @stream_request_body handlers
+
+    Chunks are fed as they arrive. File parts are written straight to a spool
+    file, so only one chunk of the body is held in memory at a time; a part
+    growing past max_file_size is flagged and the rest of it discarded.
+    Plain fields are kept in memory, up to MAX_FIELD_BYTES each.
+
+    on_file(part) is called as soon as each file part is complete, with a dict
+    holding its 'name', 'filename', 'content_type', 'path', 'size', 'sha256'
+    hex digest and 'too_large' flag. Spool files still present when cleanup()
+    runs are removed, so handlers take ownership of a part by moving its file
+    elsewhere.
+    """
+
+    def __init__(self, content_type, spool_dir, max_file_size, max_files=None, on_file=None):
+        message = Message()
+        message['Content-Type'] = content_type or ''
+        boundary = message.get_param('boundary')
+        if message.get_content_type() != 'multipart/form-data' or not boundary:
+            raise MultipartError("Expected a multipart/form-data body")
+
+        boundary = collapse_rfc2231_value(boundary).encode('latin-1')
+        self.spool_dir = spool_dir
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.on_file = on_file
+        self.fields = {}
+        self.files = []
+        self._delimiter = b'--' + boundary
+        self._next_delimiter = b'\r\n--' + boundary
+        self._buffer = bytearray()
+        self._state = 'preamble'
+        self._part = None
+        self._field_value = None
+        self._spool = None
+        self._digest = None
+
+    def feed(self, chunk):
+        """Parse the next chunk of the body"""
+        self._buffer += chunk
+        while True:
+            if self._state == 'preamble':
+                index = self._buffer.find(self._delimiter)
+                if index < 0:
+                    del self._buffer[:-len(self._delimiter)]
+                    return
+                del self._buffer[:index + len(self._delimiter)]
+                self._state = 'delimiter'
+
+            elif self._state == 'delimiter':
+                if len(self._buffer) < 2:
+                    return
+                if self._buffer[:2] == b'--':
+                    self._state = 'done'
+                elif self._buffer[:2] == b'\r\n':
+                    del self._buffer[:2]
+                    self._state = 'headers'
+                else:
+                    raise MultipartError("Malformed multipart boundary")
+
+            elif self._state == 'headers':
+                index = self._buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(self._buffer) > MAX_PART_HEADER_BYTES:
+                        raise MultipartError("Multipart part headers too large")
+                    return
+                headers = HTTPHeaders.parse(self._buffer[:index].decode('utf-8', 'replace'))
+                del self._buffer[:index + 4]
+                self._start_part(headers)
+                self._state = 'body'
+
+            elif self._state == 'body':
+                index = self._buffer.find(self._next_delimiter)
+                if index < 0:
+                    # Keep enough bytes to recognise a delimiter split across chunks
+                    keep = len(self._next_delimiter) - 1
+                    if len(self._buffer) > keep:
+                        self._write(self._buffer[:-keep])
+                        del self._buffer[:-keep]
+                    return
+                self._write(self._buffer[:index])
+                del self._buffer[:index + len(self._next_delimiter)]
+                self._end_part()
+                self._state = 'delimiter'
+
+            else:
+                self._buffer.clear()
+                return
+
+    def finish(self):
+        """Check the body ended with the closing boundary"""
+        if self._state != 'done':
+            raise MultipartError("Incomplete multipart body")
+
+    def cleanup(self):
+        """Close and remove any spool files no handler took ownership of"""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        paths = [part['path'] for part in self.files]
+        if self._part and self._part.get('path'):
+            paths.append(self._part['path'])
+        for path in paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def _start_part(self, headers):
+        message = Message()
+        message['Content-Disposition'] = headers.get('Content-Disposition', '')
+        name = message.get_param('name', header='content-disposition')
+        if name is None:
+            raise MultipartError("Multipart part without a name")
+        name = collapse_rfc2231_value(name)
+        filename = message.get_filename()
+
+        if filename is None:
+            self._part = {'name': name}
+            self._field_value = bytearray()
+            return
+
+        if self.max_files is not None and len(self.files) >= self.max_files:
+            raise MultipartError(f"Too many files. Maximum {self.max_files} allowed.")
+        self._spool = tempfile.NamedTemporaryFile(dir=self.spool_dir, prefix='upload_', delete=False)
+        self._digest = hashlib.sha256()
+        self._part = {
+            'name': name,
+            'filename': filename,
+            'content_type': headers.get('Content-Type', 'application/octet-stream'),
+            'path': self._spool.name,
+            'size': 0,
+            'sha256': None,
+            'too_large': False
+        }
+
+    def _write(self, data):
+        if not data:
+            return
+        part = self._part
+        if self._field_value is not None:
+            if len(self._field_value) + len(data) > MAX_FIELD_BYTES:
+                raise MultipartError(f"Form field {part['name']} too large")
+            self._field_value += data
+            return
+
+        part['size'] += len(data)
+        if part['too_large']:
+            return
+        if part['size'] > self.max_file_size:
+            # Stop storing it straight away; the part is reported as too large
+            part['too_large'] = True
+            self._spool.close()
+            self._spool = None
+            os.remove(part['path'])
+            return
+        self._spool.write(data)
+        self._digest.update(data)
+
+    def _end_part(self):
+        part, self._part = self._part, None
+        if self._field_value is not None:
+            self.fields[part['name']] = self._field_value.decode('utf-8', 'replace')
+            self._field_value = None
+            return
+
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+            part['sha256'] = self._digest.hexdigest()
+        self._digest = None
+        self.files.append(part)
+        if self.on_file:
+            self.on_file(part)
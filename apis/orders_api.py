@@ -1,8 +1,48 @@
 import json
 from datetime import datetime, timezone
 from apis.base_handler import BaseHandler
-from orm.controllers.controller_orders import OrderController
+from orm.controllers.controller_orders import OrderController, ORDER_CREATE_SCOPE
 from services.printer_service import printer_service
+from services.idempotency_service import idempotency_service
+
+
+MAX_BATCH_ORDERS = 500
+
+
+def validate_order_payload(data):
+    """Validate required order fields according to API spec, returning a list of errors"""
+    errors = []
+    if not data.get('items'):
+        errors.append("Order items are required")
+    if data.get('subtotal') is None:
+        errors.append("Subtotal is required")
+    if data.get('taxAmount') is None:
+        errors.append("Tax amount is required") 
+    if data.get('total') is None:
+        errors.append("Total is required")
+    if not data.get('paymentMethod'):
+        errors.append("Payment method is required")
+    return errors
+
+
+def build_order_data(data):
+    """Map an API order payload onto OrderController.create_order arguments"""
+    total = data.get('total')
+    return {
+        'user_id': data.get('createdBy', 'system'),
+        'subtotal': data.get('subtotal'),
+        'tax_amount': data.get('taxAmount'),
+        'total_amount': total,
+        'discount_amount': data.get('discountAmount', 0),
+        'discount_reason': data.get('discountReason'),
+        'status': 'completed',  # Use correct enum value
+        'payment_method': data.get('paymentMethod'),
+        'amount_paid': data.get('amountPaid', total),
+        'change_given': data.get('changeGiven', 0),
+        'customer_name': data.get('customerName'),
+        'order_notes': data.get('orderNotes'),
+        'items': data.get('items', [])  # Pass the items to the controller
+    }
 
 
 class OrdersHandler(BaseHandler):
@@ -63,48 +103,40 @@ class OrdersHandler(BaseHandler):
         total = data.get('total')
         payment_method = data.get('paymentMethod')
 
-        errors = []
-        if not items:
-            errors.append("Order items are required")
-        if subtotal is None:
-            errors.append("Subtotal is required")
-        if tax_amount is None:
-            errors.append("Tax amount is required") 
-        if total is None:
-            errors.append("Total is required")
-        if not payment_method:
-            errors.append("Payment method is required")
-
+        errors = validate_order_payload(data)
+        idempotency_key = self.request.headers.get('Idempotency-Key')
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+            errors.append("Idempotency-Key must be between 1 and 255 characters")
         if errors:
             self.write_error_response(errors, 400, "VALIDATION_ERROR")
             return
 
+        # A retry of a request that already completed gets the original response
+        if idempotency_key:
+            stored_response = idempotency_service.get_response(ORDER_CREATE_SCOPE, idempotency_key)
+            if stored_response:
+                status_code, body = stored_response
+                self.set_status(status_code)
+                self.set_header("Idempotent-Replayed", "true")
+                self.write(body)
+                return
+
         try:
             # Create order using the controller
-            order_data = {
-                'user_id': data.get('createdBy', 'system'),
-                'subtotal': subtotal,
-                'tax_amount': tax_amount,
-                'total_amount': total,
-                'discount_amount': data.get('discountAmount', 0),
-                'discount_reason': data.get('discountReason'),
-                'status': 'completed',  # Use correct enum value
-                'payment_method': payment_method,
-                'amount_paid': data.get('amountPaid', total),
-                'change_given': data.get('changeGiven', 0),
-                'customer_name': data.get('customerName'),
-                'order_notes': data.get('orderNotes'),
-                'items': items  # Pass the items to the controller
-            }
-
-            new_order = self.order_controller.create_order(**order_data)
+            new_order = self.order_controller.create_order(idempotency_key=idempotency_key, **build_order_data(data))
             
             if not new_order:
                 self.write_error_response(["Failed to create order"], 500, "INTERNAL_ERROR")
                 return
             
-            # Print receipt automatically
-            print_result = printer_service.print_receipt(new_order, reprint=False)
+            replayed = new_order.get('replayed', False)
+            if replayed:
+                # The first request is still finishing; never print the receipt twice
+                self.set_header("Idempotent-Replayed", "true")
+                print_result = {'success': True, 'printed': False, 'printer_type': 'skipped', 'mock': False}
+            else:
+                # Print receipt automatically
+                print_result = printer_service.print_receipt(new_order, reprint=False)
             
             # Format response according to API specification
             order_response = {
@@ -126,7 +158,7 @@ class OrdersHandler(BaseHandler):
                     "createdAt": new_order.get('created_at', datetime.now(timezone.utc).isoformat()),
                     "completedAt": datetime.now(timezone.utc).isoformat()
                 },
-                "inventoryUpdated": True,
+                "inventoryUpdated": new_order.get('inventory_updated', False),
                 "receiptGenerated": print_result.get('success', False),
                 "printResult": {
                     "printed": print_result.get('printed', False),
@@ -136,12 +168,88 @@ class OrdersHandler(BaseHandler):
                 }
             }
 
-            self.write_success(order_response, 201, "Order created successfully")
+            body = self.write_success(order_response, 201, "Order created successfully")
+            if idempotency_key and not replayed:
+                idempotency_service.store_response(ORDER_CREATE_SCOPE, idempotency_key, 201, body)
 
         except Exception as e:
             self.write_error_response([f"Failed to create order - {e}"], 500, "INTERNAL_ERROR")
 
 
+class OrdersBatchHandler(BaseHandler):
+    """Ingest orders queued by a till while it was offline"""
+
+    def initialize(self):
+        self.order_controller = OrderController()
+
+    def post(self):
+        """
+        Create up to MAX_BATCH_ORDERS orders in one transaction.
+        
+        Each order carries a client-generated 'clientReference'; replaying a batch
+        returns the already-created orders as duplicates instead of inserting them again.
+        Receipts are not printed, as the till already printed them while offline.
+        """
+        data = self.get_json_body()
+        if data is None:
+            return
+
+        orders = data.get('orders')
+        if not isinstance(orders, list) or not orders:
+            self.write_error_response(["Orders are required"], 400, "VALIDATION_ERROR")
+            return
+        if len(orders) > MAX_BATCH_ORDERS:
+            self.write_error_response([f"A batch can contain at most {MAX_BATCH_ORDERS} orders"], 400, "VALIDATION_ERROR")
+            return
+
+        results = [None] * len(orders)
+        valid_indexes = []
+        valid_orders = []
+        for index, order in enumerate(orders):
+            if not isinstance(order, dict):
+                results[index] = {"index": index, "clientReference": None, "status": "failed",
+                                  "orderId": None, "orderNumber": None, "errors": ["Order must be an object"]}
+                continue
+
+            client_reference = order.get('clientReference')
+            errors = validate_order_payload(order)
+            if not client_reference or not isinstance(client_reference, str):
+                errors.append("Client reference is required")
+            elif len(client_reference) > 255:
+                errors.append("Client reference must be 255 characters or less")
+
+            if errors:
+                results[index] = {"index": index, "clientReference": client_reference, "status": "failed",
+                                  "orderId": None, "orderNumber": None, "errors": errors}
+                continue
+
+            order_data = build_order_data(order)
+            order_data['client_reference'] = client_reference
+            valid_indexes.append(index)
+            valid_orders.append(order_data)
+
+        try:
+            if valid_orders:
+                created = self.order_controller.create_orders_batch(valid_orders)
+                for index, result in zip(valid_indexes, created):
+                    result['index'] = index
+                    results[index] = result
+
+            response_data = {
+                "results": results,
+                "summary": {
+                    "received": len(orders),
+                    "created": sum(1 for r in results if r['status'] == 'created'),
+                    "duplicates": sum(1 for r in results if r['status'] == 'duplicate'),
+                    "failed": sum(1 for r in results if r['status'] == 'failed')
+                }
+            }
+            self.write_success(response_data, message="Order batch processed")
+
+        except Exception as e:
+            self.write_error_response([f"Failed to process order batch - {e}"], 500, "INTERNAL_ERROR")
+
+
 class OrderHandler(BaseHandler):
     def initialize(self):
         self.order_controller = OrderController()
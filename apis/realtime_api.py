@@ -0,0 +1,83 @@
+import json
+import tornado.websocket
+from tornado.iostream import StreamClosedError
+from services.realtime_service import realtime_service, TOPICS
+
+
+class RealtimeHandler(tornado.websocket.WebSocketHandler):
+    """
+    WebSocket hub for live updates.
+
+    Clients pick topics with ?topics=orders.created,alerts.new or by sending
+    {"action": "subscribe" | "unsubscribe", "topics": [...]}, and receive
+    {"topic", "data", "timestamp"} messages as events are committed.
+    """
+
+    def check_origin(self, origin):
+        # Same policy as the REST API, which allows any origin
+        return True
+
+    def open(self):
+        self.pending_messages = 0
+        topics = [t for t in self.get_argument('topics', '').split(',') if t]
+        self.send_json({"type": "subscribed", "topics": realtime_service.subscribe(self, topics)})
+
+    def on_message(self, message):
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            self.send_json({"type": "error", "errors": ["Invalid JSON message"]})
+            return
+
+        action = data.get('action') if isinstance(data, dict) else None
+        topics = data.get('topics', []) if isinstance(data, dict) else []
+        if not isinstance(topics, list):
+            topics = []
+
+        if action == 'subscribe':
+            unknown = [t for t in topics if t not in TOPICS]
+            self.send_json({"type": "subscribed", "topics": realtime_service.subscribe(self, topics),
+                            "errors": [f"Unknown topic: {t}" for t in unknown]})
+        elif action == 'unsubscribe':
+            realtime_service.unsubscribe(self, topics)
+            self.send_json({"type": "unsubscribed", "topics": topics})
+        elif action == 'ping':
+            self.send_json({"type": "pong"})
+        else:
+            self.send_json({"type": "error", "errors": ["Action must be one of: subscribe, unsubscribe, ping"]})
+
+    def on_close(self):
+        realtime_service.unsubscribe(self)
+
+    def send_json(self, data):
+        return self.send(json.dumps(data, default=str))
+
+    def send(self, message):
+        """
+        Queue a message, dropping the client if too many are still unflushed
+
+        Returns:
+            bool: True if the message was queued
+        """
+        if self.ws_connection is None or self.ws_connection.is_closing():
+            realtime_service.unsubscribe(self)
+            return False
+        if self.pending_messages >= realtime_service.max_pending_messages:
+            realtime_service.unsubscribe(self)
+            self.close(1008, "Slow consumer")
+            return False
+
+        try:
+            future = self.write_message(message)
+        except (tornado.websocket.WebSocketClosedError, StreamClosedError):
+            realtime_service.unsubscribe(self)
+            return False
+
+        self.pending_messages += 1
+        future.add_done_callback(self._message_flushed)
+        return True
+
+    def _message_flushed(self, future):
+        self.pending_messages -= 1
+        if future.exception() is not None:
+            realtime_service.unsubscribe(self)
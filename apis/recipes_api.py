@@ -0,0 +1,65 @@
+from apis.base_handler import BaseHandler
+from orm.controllers.controller_recipes import RecipeController
+
+
+class MenuItemRecipeHandler(BaseHandler):
+    """Bill of materials linking a menu item to the inventory it consumes"""
+
+    def initialize(self):
+        self.recipe_controller = RecipeController()
+
+    def get(self, id):
+        try:
+            recipe = self.recipe_controller.get_recipe(id)
+            if recipe is None:
+                self.write_error_response(["Menu item not found"], 404, "NOT_FOUND")
+                return
+            self.write_success({"menuItemId": id, "ingredients": recipe}, message="Recipe retrieved successfully")
+        except Exception as e:
+            self.write_error_response(["Failed to retrieve recipe"], 500, "INTERNAL_ERROR")
+
+    def put(self, id):
+        data = self.get_json_body()
+        if data is None:
+            return
+
+        ingredients = data.get('ingredients')
+        errors = []
+        if not isinstance(ingredients, list):
+            errors.append("Ingredients must be a list")
+            ingredients = []
+
+        parsed = []
+        seen = set()
+        for index, ingredient in enumerate(ingredients):
+            inventory_item_id = ingredient.get('inventoryItemId') if isinstance(ingredient, dict) else None
+            if not inventory_item_id:
+                errors.append(f"Ingredient {index + 1}: inventoryItemId is required")
+                continue
+            if inventory_item_id in seen:
+                errors.append(f"Ingredient {index + 1}: inventory item is listed more than once")
+                continue
+            try:
+                quantity = float(ingredient.get('quantity'))
+            except (ValueError, TypeError):
+                quantity = None
+            if quantity is None or quantity <= 0:
+                errors.append(f"Ingredient {index + 1}: quantity must be a positive number")
+                continue
+            seen.add(inventory_item_id)
+            parsed.append({'inventory_item_id': inventory_item_id, 'quantity': quantity})
+
+        if errors:
+            self.write_error_response(errors, 422, "VALIDATION_ERROR")
+            return
+
+        try:
+            recipe = self.recipe_controller.set_recipe(id, parsed)
+            if recipe is None:
+                self.write_error_response(["Menu item not found"], 404, "NOT_FOUND")
+                return
+            self.write_success({"menuItemId": id, "ingredients": recipe}, message="Recipe updated successfully")
+        except ValueError as e:
+            self.write_error_response([str(e)], 422, "VALIDATION_ERROR")
+        except Exception as e:
+            self.write_error_response(["Failed to update recipe"], 500, "INTERNAL_ERROR")
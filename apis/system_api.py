@@ -1,25 +1,30 @@
 import json
+import jwt
 from datetime import datetime, timezone
 from apis.base_handler import BaseHandler
+from apis.auth_api import JWT_SECRET, JWT_ALGORITHM, user_controller
+from services.health_service import health_service
+from services.metrics_service import metrics_service
+from services.query_diagnostics_service import query_diagnostics_service
 
 
 class HealthHandler(BaseHandler):
-    def get(self):
+    async def get(self):
         """Health check endpoint - no authentication required"""
         try:
-            # In a real implementation, these would check actual service status
+            report = await health_service.readiness()
+            checks = report['checks']
             health_data = {
-                "status": "healthy",
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "status": "healthy" if report['status'] == 'ok' else "degraded" if report['ready'] else "unhealthy",
+                "timestamp": report['timestamp'],
                 "services": {
-                    "database": "connected",
-                    "printer": "ready", 
-                    "email": "configured"
+                    "database": "connected" if checks['database']['status'] == 'ok' else "error",
+                    "printer": "ready" if checks['printer']['status'] == 'ok' else checks['printer']['status'],
+                    "email": "configured" if checks['email']['status'] == 'ok' else "not configured"
                 },
                 "version": "1.0.0"
             }
-
-            self.write_success(health_data)
+            self.write_success(health_data, status_code=200 if report['ready'] else 503)
 
         except Exception as e:
             # Even health check should not expose internal errors
@@ -38,6 +43,66 @@ class HealthHandler(BaseHandler):
             self.write(json.dumps(error_data, default=str))
 
 
+class HealthLiveHandler(BaseHandler):
+    def get(self):
+        """Liveness probe - the process is up, without checking its dependencies"""
+        self.write_success(health_service.liveness())
+
+
+class HealthReadyHandler(BaseHandler):
+    async def get(self):
+        """Readiness probe - 503 when the database is unreachable or the connection pool is saturated"""
+        report = await health_service.readiness()
+        self.write_success(report, 200 if report['ready'] else 503)
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        """Request metrics in the Prometheus text format - no authentication required"""
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(metrics_service.render())
+
+
+class QueryDiagnosticsHandler(BaseHandler):
+    def require_admin(self):
+        """Check the bearer token belongs to an active user with system.settings permission, writing the error if not"""
+        auth_header = self.request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            self.write_error_response(["Authorization token required"], 401, "TOKEN_REQUIRED")
+            return False
+        try:
+            payload = jwt.decode(auth_header.split(' ')[1], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            self.write_error_response(["Token has expired"], 401, "TOKEN_EXPIRED")
+            return False
+        except jwt.InvalidTokenError:
+            self.write_error_response(["Invalid token"], 401, "INVALID_TOKEN")
+            return False
+
+        user = user_controller.get_users_by_filters(id=payload.get('user_id'))
+        if not user or not user.get('isActive'):
+            self.write_error_response(["Invalid token"], 401, "INVALID_TOKEN")
+            return False
+        permissions = user_controller.get_user_permissions(user['id'])
+        if '*' not in permissions and 'system.settings' not in permissions:
+            self.write_error_response(["Insufficient permissions"], 403, "FORBIDDEN")
+            return False
+        return True
+
+    def get(self):
+        """Slow queries and repeated (N+1) queries seen by this process - requires admin permissions"""
+        if not self.require_admin():
+            return
+        self.write_success(query_diagnostics_service.get_report())
+
+    def delete(self):
+        """Clear the collected query diagnostics - requires admin permissions"""
+        if not self.require_admin():
+            return
+        query_diagnostics_service.reset()
+        self.write_success(message="Query diagnostics cleared")
+
+
 class SettingsHandler(BaseHandler):
     def get(self):
         """Get system settings - requires authentication and permissions"""
@@ -1,31 +1,141 @@
 import os
-import uuid
+import re
+import asyncio
 import mimetypes
-from PIL import Image
+from collections import OrderedDict
 import tornado.web
 from decouple import config
 from apis.base_handler import BaseHandler
+from apis.multipart_stream import MultipartStreamParser, MultipartError
+from apis.menu_match import MenuMatchIndex
 from orm.controllers.controller_menu import MenuController
+from services.image_service import image_service, read_manifest, choose_variant, variants_dir_for
 
-class ImageUploadHandler(BaseHandler):
-    """Handle image uploads for menu items"""
+# Room for the multipart boundaries, part headers and form fields around the files
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Stored images are named after their sha256 digest, so their content never changes
+CONTENT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+IMMUTABLE_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+
+def variant_urls(filename, manifest):
+    """Public URLs of the variants listed in a manifest"""
+    if not manifest:
+        return []
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return [
+        {
+            "url": f"/uploads/variants/{stem}/{variant['filename']}",
+            "width": variant['width'],
+            "height": variant['height'],
+            "format": variant['format'],
+            "bytes": variant['bytes']
+        }
+        for variant in manifest['variants']
+    ]
+
+
+@tornado.web.stream_request_body
+class StreamingUploadHandler(BaseHandler):
+    """
+    Base handler for multipart uploads that are streamed to disk
+
+    Tornado would otherwise buffer the whole request in memory before the
+    handler runs. Here the body is parsed as it arrives and every file is
+    spooled to uploads/tmp, so memory use doesn't grow with the request size.
+    Requests whose Content-Length is over the limit are refused before any of
+    the body is read, and on_file() is called as soon as each file is complete.
+    """
     
     def initialize(self):
         self.menu_controller = MenuController()
         self.upload_dir = config('UPLOAD_DIR', default='uploads')
         self.max_file_size = 10 * 1024 * 1024  # 10MB
+        self.max_files = None
+        self.max_body_size = self.max_file_size + MULTIPART_OVERHEAD_BYTES
         self.allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+        self.parser = None
+        self.stream_error = None
         
         # Create upload directory if it doesn't exist
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(os.path.join(self.upload_dir, 'menu_items'), exist_ok=True)
         os.makedirs(os.path.join(self.upload_dir, 'thumbnails'), exist_ok=True)
+        os.makedirs(os.path.join(self.upload_dir, 'tmp'), exist_ok=True)
+    
+    def prepare(self):
+        super().prepare()
+        if self.request.method != 'POST':
+            return
+        
+        self.request.connection.set_max_body_size(self.max_body_size)
+        content_length = self.request.headers.get('Content-Length', '')
+        if content_length.isdigit() and int(content_length) > self.max_body_size:
+            self.write_error_response(
+                [f"Request too large. Maximum {self.max_body_size // (1024 * 1024)}MB allowed."], 
+                413, 
+                "REQUEST_TOO_LARGE"
+            )
+            self.finish()
+            return
+        
+        try:
+            self.parser = MultipartStreamParser(
+                self.request.headers.get('Content-Type'),
+                os.path.join(self.upload_dir, 'tmp'),
+                self.max_file_size,
+                max_files=self.max_files,
+                on_file=self.on_file
+            )
+        except MultipartError as e:
+            self.stream_error = str(e)
+    
+    def data_received(self, chunk):
+        if self.parser is None or self.stream_error:
+            return
+        try:
+            self.parser.feed(chunk)
+        except MultipartError as e:
+            # Keep reading the body without storing it, then report the error from post()
+            self.stream_error = str(e)
+    
+    def on_file(self, part):
+        """Called with each file part as soon as it has been received"""
+    
+    def finish_stream(self):
+        """Check the streamed body was complete, writing an error response if not"""
+        if not self.stream_error:
+            try:
+                self.parser.finish()
+            except MultipartError as e:
+                self.stream_error = str(e)
+        if self.stream_error:
+            self.write_error_response([self.stream_error], 400, "VALIDATION_ERROR")
+            return False
+        return True
+    
+    def on_finish(self):
+        super().on_finish()
+        if self.parser is not None:
+            self.parser.cleanup()
+    
+    def on_connection_close(self):
+        if self.parser is not None:
+            self.parser.cleanup()
+
+
+class ImageUploadHandler(StreamingUploadHandler):
+    """Handle image uploads for menu items"""
     
     async def post(self):
         """Upload image for a menu item"""
         try:
+            if not self.finish_stream():
+                return
+            
             # Get menu item ID
-            menu_item_id = self.get_argument('menu_item_id', None)
+            menu_item_id = self.parser.fields.get('menu_item_id') or self.get_query_argument('menu_item_id', None)
             if not menu_item_id:
                 self.write_error_response(
                     ["menu_item_id is required"], 
@@ -46,7 +156,8 @@ class ImageUploadHandler(BaseHandler):
                 return
             
             # Get uploaded file
-            if 'image' not in self.request.files:
+            image_parts = [part for part in self.parser.files if part['name'] == 'image']
+            if not image_parts:
                 self.write_error_response(
                     ["No image file provided"], 
                     400, 
@@ -54,12 +165,11 @@ class ImageUploadHandler(BaseHandler):
                 )
                 return
             
-            file_info = self.request.files['image'][0]
-            filename = file_info['filename']
-            file_body = file_info['body']
+            part = image_parts[0]
+            filename = part['filename']
             
             # Validate file size
-            if len(file_body) > self.max_file_size:
+            if part['too_large']:
                 self.write_error_response(
                     ["File size too large. Maximum 10MB allowed."], 
                     400, 
@@ -77,20 +187,12 @@ class ImageUploadHandler(BaseHandler):
                 )
                 return
             
-            # Generate unique filename
-            unique_filename = f"{menu_item_id}_{uuid.uuid4().hex[:8]}{file_ext}"
-            file_path = os.path.join(self.upload_dir, 'menu_items', unique_filename)
-            
-            # Save original image
-            with open(file_path, 'wb') as f:
-                f.write(file_body)
-            
-            # Create thumbnail
-            thumbnail_path = self._create_thumbnail(file_path, unique_filename)
+            # Store the image under its content hash, creating its thumbnail and variants off the IOLoop
+            stored = await image_service.store_upload(part['path'], part['sha256'], file_ext)
             
             # Update menu item with image URL
-            image_url = f"/uploads/menu_items/{unique_filename}"
-            thumbnail_url = f"/uploads/thumbnails/{unique_filename}" if thumbnail_path else None
+            image_url = f"/uploads/menu_items/{stored['filename']}"
+            thumbnail_url = f"/uploads/thumbnails/{stored['filename']}" if stored['thumbnail_path'] else None
             
             updated_item = self.menu_controller.update_menu_item(
                 menu_item_id, 
@@ -100,11 +202,13 @@ class ImageUploadHandler(BaseHandler):
             if updated_item:
                 response_data = {
                     "menu_item_id": menu_item_id,
-                    "filename": unique_filename,
+                    "filename": stored['filename'],
                     "original_filename": filename,
                     "image_url": image_url,
                     "thumbnail_url": thumbnail_url,
-                    "file_size": len(file_body),
+                    "variants": variant_urls(stored['filename'], stored['manifest']),
+                    "deduplicated": stored['deduplicated'],
+                    "file_size": part['size'],
                     "menu_item": {
                         "id": updated_item['id'],
                         "name": updated_item['name'],
@@ -114,12 +218,7 @@ class ImageUploadHandler(BaseHandler):
                 }
                 self.write_success(response_data, message="Image uploaded successfully")
             else:
-                # Clean up uploaded file if database update failed
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                if thumbnail_path and os.path.exists(thumbnail_path):
-                    os.remove(thumbnail_path)
-                
+                # The stored files may be shared; the garbage collector removes them if unreferenced
                 self.write_error_response(
                     ["Failed to update menu item with image"], 
                     500, 
@@ -132,31 +231,118 @@ class ImageUploadHandler(BaseHandler):
                 500, 
                 "UPLOAD_ERROR"
             )
+
+
+class ImageServeHandler(tornado.web.StaticFileHandler):
+    """
+    Serve uploaded images with proper headers
+
+    Requests for an original menu item image get its best responsive variant
+    instead: the narrowest one at least ?w= pixels wide, in AVIF or WebP when the
+    Accept header allows it and JPEG otherwise. ?original=true serves the upload
+    as it is.
+
+    Files named after their content hash, and URLs versioned with ?v=, are
+    cached by clients for a year without revalidation. Small files such as
+    thumbnails and variants are kept in an in-memory LRU, and when
+    IMAGE_ACCEL_REDIRECT_PREFIX is set the file itself is left for the reverse
+    proxy in front of the server to send, via X-Accel-Redirect.
+    """
     
-    def _create_thumbnail(self, original_path, filename):
-        """Create thumbnail version of uploaded image"""
+    memory_cache_max_bytes = config('IMAGE_MEMORY_CACHE_MB', default=32, cast=int) * 1024 * 1024
+    memory_cache_max_file_bytes = config('IMAGE_MEMORY_CACHE_MAX_FILE_KB', default=256, cast=int) * 1024
+    accel_redirect_prefix = config('IMAGE_ACCEL_REDIRECT_PREFIX', default='')
+    _memory_cache = OrderedDict()  # (absolute path, mtime, size) -> content
+    _memory_cache_bytes = 0
+    
+    async def get(self, path, include_body=True):
+        if path.startswith('menu_items/') and self.get_argument('original', 'false').lower() != 'true':
+            path = self._variant_path(path)
+        if self.accel_redirect_prefix:
+            self._accel_redirect(path)
+            return
+        await super().get(path, include_body)
+
+    def _accel_redirect(self, path):
+        # Same validation and headers as StaticFileHandler.get(), without reading the file
+        self.path = self.parse_url_path(path)
+        absolute_path = self.get_absolute_path(self.root, self.path)
+        self.absolute_path = self.validate_absolute_path(self.root, absolute_path)
+        if self.absolute_path is None:
+            return
+        self.modified = self.get_modified_time()
+        self.set_headers()
+        self.set_header("X-Accel-Redirect", self.accel_redirect_prefix.rstrip('/') + '/' + self.path)
+
+    @classmethod
+    def get_content(cls, abspath, start=None, end=None):
+        content = cls._get_cached_content(abspath)
+        if content is None:
+            return super().get_content(abspath, start, end)
+        return content[start:end]
+
+    @classmethod
+    def _get_cached_content(cls, abspath):
         try:
-            thumbnail_filename = filename
-            thumbnail_path = os.path.join(self.upload_dir, 'thumbnails', thumbnail_filename)
-            
-            with Image.open(original_path) as img:
-                # Convert to RGB if necessary (for PNG with transparency)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Create thumbnail (300x300 max, maintaining aspect ratio)
-                img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-                
-            return thumbnail_path
-        except Exception as e:
-            print(f"Failed to create thumbnail: {str(e)}")
+            stat = os.stat(abspath)
+        except OSError:
+            return None
+        if stat.st_size > cls.memory_cache_max_file_bytes or stat.st_size > cls.memory_cache_max_bytes:
             return None
 
+        key = (abspath, stat.st_mtime_ns, stat.st_size)
+        content = cls._memory_cache.get(key)
+        if content is not None:
+            cls._memory_cache.move_to_end(key)
+            return content
+
+        with open(abspath, 'rb') as f:
+            content = f.read()
+        cls._memory_cache[key] = content
+        cls._memory_cache_bytes += len(content)
+        while cls._memory_cache_bytes > cls.memory_cache_max_bytes:
+            _, evicted = cls._memory_cache.popitem(last=False)
+            cls._memory_cache_bytes -= len(evicted)
+        return content
+
+    def _variant_path(self, path):
+        filename = os.path.basename(path)
+        variants_dir = variants_dir_for(self.root, filename)
+        manifest = read_manifest(variants_dir)
+        if not manifest:
+            return path  # Uploaded before variants existed, or processing failed
+
+        try:
+            width = int(self.get_argument('w'))
+        except (tornado.web.MissingArgumentError, ValueError):
+            width = None
+        variant = choose_variant(manifest, width, self.request.headers.get('Accept', ''))
+        if not variant:
+            return path
+
+        # The response now depends on the Accept header as well as the URL
+        self.set_header("Vary", "Accept")
+        return f"variants/{os.path.basename(variants_dir)}/{variant['filename']}"
+
+    @staticmethod
+    def is_content_addressed(path):
+        """Whether a path is a stored image, thumbnail or variant named after its content hash"""
+        parts = path.replace(os.sep, '/').split('/')
+        names = [os.path.splitext(parts[-1])[0]] + parts[-2:-1]
+        return any(CONTENT_HASH_PATTERN.match(name) for name in names)
+
+    def is_immutable(self, path):
+        return self.is_content_addressed(path) or 'v' in self.request.arguments
+
+    def get_cache_time(self, path, modified, mime_type):
+        if self.is_immutable(path):
+            return IMMUTABLE_CACHE_SECONDS
+        return super().get_cache_time(path, modified, mime_type)
+
+    def set_extra_headers(self, path):
+        if self.is_immutable(path):
+            self.set_header("Cache-Control", f"public, max-age={IMMUTABLE_CACHE_SECONDS}, immutable")
 
-class ImageServeHandler(tornado.web.StaticFileHandler):
-    """Serve uploaded images with proper headers"""
-    
     def set_default_headers(self):
         super().set_default_headers()
         # Add CORS headers for images - support both common frontend ports
@@ -170,25 +356,46 @@ class ImageServeHandler(tornado.web.StaticFileHandler):
         self.set_header("Access-Control-Allow-Methods", "GET, OPTIONS")
 
 
-class BulkImageUploadHandler(BaseHandler):
-    """Handle bulk image uploads with automatic menu item matching"""
+class BulkImageUploadHandler(StreamingUploadHandler):
+    """
+    Handle bulk image uploads with automatic menu item matching
+
+    Each file is matched and processed as soon as it has been received, while
+    the rest of the batch is still uploading; the matched menu items are
+    updated once the whole batch is in.
+    """
     
     def initialize(self):
-        self.menu_controller = MenuController()
-        self.upload_dir = config('UPLOAD_DIR', default='uploads')
-        self.max_file_size = 10 * 1024 * 1024  # 10MB per file
-        self.allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-        
-        # Create upload directory if it doesn't exist
-        os.makedirs(self.upload_dir, exist_ok=True)
-        os.makedirs(os.path.join(self.upload_dir, 'menu_items'), exist_ok=True)
-        os.makedirs(os.path.join(self.upload_dir, 'thumbnails'), exist_ok=True)
+        super().initialize()
+        self.max_files = config('UPLOAD_MAX_BULK_FILES', default=200, cast=int)
+        self.max_body_size = config('UPLOAD_MAX_BULK_BYTES', default=500 * 1024 * 1024, cast=int)
+        self.match_index = None
+        self.tasks = []
     
+    def on_file(self, part):
+        if self.match_index is None:
+            # Index all menu items once for matching every file of the batch
+            menu_data = self.menu_controller.get_menu_items_by_filters(all=True)
+            self.match_index = MenuMatchIndex(menu_data['menu_items'] if menu_data else [])
+        # Processing starts right away; image_service bounds how many files run at once
+        self.tasks.append(asyncio.ensure_future(self._process_single_file(part, self.match_index)))
+
+    def on_connection_close(self):
+        # Nobody is left to receive the results
+        for task in self.tasks:
+            task.cancel()
+        super().on_connection_close()
+
     async def post(self):
         """Upload multiple images and match them to menu items by filename"""
         try:
+            # Wait for the files already being processed, even if the rest of the body was bad
+            outcomes = await asyncio.gather(*self.tasks, return_exceptions=True)
+            if not self.finish_stream():
+                return
+            
             # Get all uploaded files
-            if not self.request.files:
+            if not self.parser.files:
                 self.write_error_response(
                     ["No files provided"], 
                     400, 
@@ -199,26 +406,27 @@ class BulkImageUploadHandler(BaseHandler):
             results = []
             errors = []
             
-            # Get all menu items for matching
-            menu_data = self.menu_controller.get_menu_items_by_filters(all=True)
-            menu_items = menu_data['menu_items'] if menu_data else []
-            menu_items_dict = {item['name'].lower().replace(' ', '_'): item for item in menu_items}
+            for part, result in zip(self.parser.files, outcomes):
+                if isinstance(result, Exception):
+                    errors.append({
+                        'success': False,
+                        'filename': part['filename'],
+                        'error': str(result)
+                    })
+                elif result['success']:
+                    results.append(result)
+                else:
+                    errors.append(result)
             
-            # Process each uploaded file
-            for field_name, file_list in self.request.files.items():
-                for file_info in file_list:
-                    try:
-                        result = await self._process_single_file(file_info, menu_items_dict)
-                        if result['success']:
-                            results.append(result)
-                        else:
-                            errors.append(result)
-                    except Exception as e:
-                        errors.append({
-                            'success': False,
-                            'filename': file_info['filename'],
-                            'error': str(e)
-                        })
+            # Update menu items with their image URL. Files matched to a single size go last,
+            # so they win over a file matched to every size of the same item.
+            for result in sorted(results, key=lambda result: -len(result['menu_item_ids'])):
+                updated_ids = self.menu_controller.set_menu_item_images(result['menu_item_ids'], result['image_url'])
+                if not updated_ids:
+                    # The stored files may be shared; the garbage collector removes them if unreferenced
+                    result.update(success=False, error='Failed to update menu item in database')
+            errors.extend(result for result in results if not result['success'])
+            results = [result for result in results if result['success']]
             
             response_data = {
                 'uploaded': len(results),
@@ -243,13 +451,12 @@ class BulkImageUploadHandler(BaseHandler):
                 "BULK_UPLOAD_ERROR"
             )
     
-    async def _process_single_file(self, file_info, menu_items_dict):
+    async def _process_single_file(self, part, match_index):
         """Process a single uploaded file"""
-        filename = file_info['filename']
-        file_body = file_info['body']
+        filename = part['filename']
         
         # Validate file size
-        if len(file_body) > self.max_file_size:
+        if part['too_large']:
             return {
                 'success': False,
                 'filename': filename,
@@ -265,88 +472,45 @@ class BulkImageUploadHandler(BaseHandler):
                 'error': f'Invalid file type. Allowed: {", ".join(self.allowed_extensions)}'
             }
         
-        # Try to match filename to menu item
-        base_name = os.path.splitext(filename)[0].lower().replace(' ', '_').replace('-', '_')
-        
-        # Try exact match first
-        menu_item = menu_items_dict.get(base_name)
-        
-        # If no exact match, try partial matching
-        if not menu_item:
-            for item_name, item in menu_items_dict.items():
-                if base_name in item_name or item_name in base_name:
-                    menu_item = item
-                    break
-        
-        if not menu_item:
+        # Match the filename to a menu item; without a size in the name, every size gets the image
+        candidates = [
+            {
+                'name': candidate['name'],
+                'score': candidate['score'],
+                'menu_item_ids': [item['id'] for item in candidate['items']],
+                'sizes': [item['size'] for item in candidate['items']]
+            }
+            for candidate in match_index.match(filename)
+        ]
+        if not candidates:
             return {
                 'success': False,
                 'filename': filename,
                 'error': 'No matching menu item found'
             }
+        best = candidates[0]
         
-        # Generate unique filename
-        unique_filename = f"{menu_item['id']}_{uuid.uuid4().hex[:8]}{file_ext}"
-        file_path = os.path.join(self.upload_dir, 'menu_items', unique_filename)
-        
-        # Save original image
-        with open(file_path, 'wb') as f:
-            f.write(file_body)
+        # Store the image under its content hash; files repeated in the batch are processed once
+        stored = await image_service.store_upload(part['path'], part['sha256'], file_ext)
         
-        # Create thumbnail
-        thumbnail_path = self._create_thumbnail(file_path, unique_filename)
+        image_url = f"/uploads/menu_items/{stored['filename']}"
+        thumbnail_url = f"/uploads/thumbnails/{stored['filename']}" if stored['thumbnail_path'] else None
         
-        # Update menu item with image URL
-        image_url = f"/uploads/menu_items/{unique_filename}"
-        thumbnail_url = f"/uploads/thumbnails/{unique_filename}" if thumbnail_path else None
-        
-        updated_item = self.menu_controller.update_menu_item(
-            menu_item['id'], 
-            image_url=image_url
-        )
-        
-        if updated_item:
-            return {
-                'success': True,
-                'filename': filename,
-                'menu_item_id': menu_item['id'],
-                'menu_item_name': menu_item['name'],
-                'image_url': image_url,
-                'thumbnail_url': thumbnail_url,
-                'file_size': len(file_body)
-            }
-        else:
-            # Clean up uploaded file if database update failed
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            if thumbnail_path and os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-            
-            return {
-                'success': False,
-                'filename': filename,
-                'error': 'Failed to update menu item in database'
-            }
-    
-    def _create_thumbnail(self, original_path, filename):
-        """Create thumbnail version of uploaded image"""
-        try:
-            thumbnail_filename = filename
-            thumbnail_path = os.path.join(self.upload_dir, 'thumbnails', thumbnail_filename)
-            
-            with Image.open(original_path) as img:
-                # Convert to RGB if necessary (for PNG with transparency)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Create thumbnail (300x300 max, maintaining aspect ratio)
-                img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-                
-            return thumbnail_path
-        except Exception as e:
-            print(f"Failed to create thumbnail: {str(e)}")
-            return None
+        # The menu items are updated by post() once the whole batch is in
+        return {
+            'success': True,
+            'filename': filename,
+            'menu_item_id': best['menu_item_ids'][0],
+            'menu_item_ids': best['menu_item_ids'],
+            'menu_item_name': best['name'],
+            'match_score': best['score'],
+            'candidates': candidates,
+            'image_url': image_url,
+            'thumbnail_url': thumbnail_url,
+            'variants': variant_urls(stored['filename'], stored['manifest']),
+            'deduplicated': stored['deduplicated'],
+            'file_size': part['size']
+        }
 
 
 class ImageManagementHandler(BaseHandler):
@@ -371,7 +535,11 @@ class ImageManagementHandler(BaseHandler):
                     'category': item['category'],
                     'imageUrl': item.get('imageUrl'),
                     'hasImage': bool(item.get('imageUrl')),
-                    'thumbnailUrl': item['imageUrl'].replace('/menu_items/', '/thumbnails/') if item.get('imageUrl') else None
+                    'thumbnailUrl': item['imageUrl'].replace('/menu_items/', '/thumbnails/') if item.get('imageUrl') else None,
+                    'variants': variant_urls(
+                        os.path.basename(item['imageUrl']),
+                        read_manifest(variants_dir_for(self.upload_dir, os.path.basename(item['imageUrl'])))
+                    ) if item.get('imageUrl') else []
                 }
                 items_data.append(item_data)
             
@@ -413,20 +581,8 @@ class ImageManagementHandler(BaseHandler):
                 )
                 return
             
-            # Remove image files if they exist
-            if menu_item.get('imageUrl'):
-                # Remove original image
-                image_filename = os.path.basename(menu_item['imageUrl'])
-                image_path = os.path.join(self.upload_dir, 'menu_items', image_filename)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-                
-                # Remove thumbnail
-                thumbnail_path = os.path.join(self.upload_dir, 'thumbnails', image_filename)
-                if os.path.exists(thumbnail_path):
-                    os.remove(thumbnail_path)
-            
-            # Update menu item to remove image URL
+            # Update menu item to remove image URL; the files may be shared with other
+            # menu items, so the garbage collector removes them once nothing references them
             updated_item = self.menu_controller.update_menu_item(item_id, image_url=None)
             
             if updated_item:
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Benchmark Runner for CafePOS Backend
+Drives the hot endpoints of a running server with concurrent async clients
+and writes p50/p95/p99 latency and throughput per scenario to a JSON file,
+so results can be compared between commits
+
+Seed a realistic dataset first:
+    python seed_test_data.py --orders 300000
+
+Then, with the server running:
+    python benchmarks/run_benchmarks.py --concurrency 20 --duration 30
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/<earlier run>.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SERVER_TIMING_DB = re.compile(r'db;dur=([0-9.]+)')
+
+
+class Scenario:
+    """One endpoint to benchmark; request() builds the next request to send"""
+
+    def __init__(self, name, request):
+        self.name = name
+        self.request = request
+
+
+def build_scenarios(base_url, menu_items, pin, dashboard_days):
+    def create_order():
+        lines = []
+        for item in random.sample(menu_items, k=min(len(menu_items), random.randint(1, 3))):
+            quantity = random.randint(1, 2)
+            lines.append({
+                "productId": item['id'],
+                "productName": item['name'],
+                "size": item['size'],
+                "price": item['price'],
+                "quantity": quantity
+            })
+        subtotal = round(sum(line['price'] * line['quantity'] for line in lines), 2)
+        tax = round(subtotal * 0.1, 2)
+        return HTTPRequest(f"{base_url}/orders", method='POST', body=json.dumps({
+            "items": lines,
+            "subtotal": subtotal,
+            "taxAmount": tax,
+            "total": round(subtotal + tax, 2),
+            "paymentMethod": random.choice(("card", "cash"))
+        }), headers={"Content-Type": "application/json"})
+
+    def list_orders():
+        return HTTPRequest(f"{base_url}/orders?limit=50&offset={random.randrange(0, 1000, 50)}")
+
+    def menu_catalog():
+        return HTTPRequest(f"{base_url}/menu_items", headers={"Accept-Encoding": "gzip"}, decompress_response=False)
+
+    def pin_login():
+        return HTTPRequest(f"{base_url}/auth/login", method='POST', body=json.dumps({"pinCode": pin}),
+                           headers={"Content-Type": "application/json"})
+
+    end_date = datetime.now(timezone.utc).date()
+    start_date = end_date - timedelta(days=dashboard_days)
+
+    def sales_dashboard():
+        return HTTPRequest(f"{base_url}/sales/dashboard?start_date={start_date}&end_date={end_date}")
+
+    return [
+        Scenario('orders_create', create_order),
+        Scenario('orders_list', list_orders),
+        Scenario('menu_items', menu_catalog),
+        Scenario('pin_login', pin_login),
+        Scenario('sales_dashboard', sales_dashboard)
+    ]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def run_scenario(client, scenario, concurrency, duration, warmup):
+    """Send requests from concurrency workers for warmup + duration seconds, recording after the warmup"""
+    latencies = []
+    db_times = []
+    statuses = {}
+    errors = 0
+    loop_time = IOLoop.current().time
+    started = loop_time()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker():
+        nonlocal errors
+        while loop_time() < deadline:
+            request = scenario.request()
+            request_started = time.perf_counter()
+            response = await client.fetch(request, raise_error=False)
+            latency = time.perf_counter() - request_started
+            if loop_time() < measure_from:
+                continue
+            latencies.append(latency)
+            statuses[str(response.code)] = statuses.get(str(response.code), 0) + 1
+            if response.code >= 400 or response.code == 599:
+                errors += 1
+            match = SERVER_TIMING_DB.search(response.headers.get('Server-Timing', '')) if response.headers else None
+            if match:
+                db_times.append(float(match.group(1)))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = loop_time() - measure_from
+
+    latencies.sort()
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'statusCodes': statuses,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        'latencyMs': {
+            'mean': to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': to_ms(percentile(latencies, 0.50)),
+            'p95': to_ms(percentile(latencies, 0.95)),
+            'p99': to_ms(percentile(latencies, 0.99)),
+            'max': to_ms(latencies[-1] if latencies else None)
+        },
+        'dbMsMean': round(sum(db_times) / len(db_times), 2) if db_times else None
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline):
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('startedAt')}):")
+    for name, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or not previous['latencyMs']['p95'] or not result['latencyMs']['p95']:
+            continue
+        p95_change = (result['latencyMs']['p95'] / previous['latencyMs']['p95'] - 1) * 100
+        rps_change = (result['rps'] / previous['rps'] - 1) * 100 if previous['rps'] else 0
+        print(f"  {name:<16} p95 {p95_change:+6.1f}%   rps {rps_change:+6.1f}%")
+
+
+async def main(args):
+    AsyncHTTPClient.configure(None, max_clients=args.concurrency)
+    client = AsyncHTTPClient()
+    base_url = args.base_url.rstrip('/')
+
+    response = await client.fetch(f"{base_url}/menu_items", raise_error=False)
+    if response.code != 200:
+        print(f"Could not load the menu from {base_url}: {response.code}")
+        sys.exit(1)
+    menu_items = [
+        {'id': item['id'], 'name': item['name'], 'size': item['size'], 'price': float(item['price'])}
+        for item in json.loads(response.body)['data']['menu_items']
+    ]
+    if not menu_items:
+        print("The menu is empty; run seed_test_data.py first")
+        sys.exit(1)
+
+    scenarios = build_scenarios(base_url, menu_items, args.pin, args.dashboard_days)
+    if args.scenarios:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.scenarios]
+
+    results = {
+        'commit': git_commit(),
+        'startedAt': datetime.now(timezone.utc).isoformat(),
+        'baseUrl': base_url,
+        'concurrency': args.concurrency,
+        'durationSeconds': args.duration,
+        'scenarios': {}
+    }
+    for scenario in scenarios:
+        print(f"Running {scenario.name} for {args.duration}s with {args.concurrency} clients...")
+        result = await run_scenario(client, scenario, args.concurrency, args.duration, args.warmup)
+        results['scenarios'][scenario.name] = result
+        latency = result['latencyMs']
+        print(f"  {result['rps']} req/s, p50 {latency['p50']}ms, p95 {latency['p95']}ms, "
+              f"p99 {latency['p99']}ms, {result['errors']} errors")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CafePOS hot endpoints")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8880')
+    parser.add_argument('--concurrency', type=int, default=20, help="concurrent clients per scenario")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds per scenario")
+    parser.add_argument('--warmup', type=float, default=3, help="unmeasured seconds before each scenario")
+    parser.add_argument('--pin', default='3456', help="PIN of a seeded user, for the login scenario")
+    parser.add_argument('--dashboard-days', type=int, default=30, help="date range of the sales dashboard requests")
+    parser.add_argument('--scenarios', nargs='*', help="run only these scenarios")
+    parser.add_argument('--output', help="results file, by default benchmarks/results/<time>-<commit>.json")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    IOLoop.current().run_sync(lambda: main(parser.parse_args()))
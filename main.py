@@ -3,19 +3,23 @@ import tornado.web
 import asyncio
 import logging
 
-from apis.menu_api import MenuItemsHandler, MenuItemHandler, MenuItemsBulkImportHandler
-from apis.inventory_api import InventoryItemsHandler, InventoryItemHandler, InventoryAdjustHandler, InventoryExportHandler
+from apis.menu_api import MenuItemsHandler, MenuItemChangesHandler, MenuItemSearchHandler, MenuItemHandler, MenuItemsBulkImportHandler
+from apis.recipes_api import MenuItemRecipeHandler
+from apis.inventory_api import InventoryItemsHandler, InventoryChangesHandler, InventoryItemHandler, InventoryAdjustHandler, InventoryBulkAdjustHandler, InventoryStocktakeHandler, InventoryAlertsHandler, InventoryExportHandler
 from apis.roles_api import RolesHandler, RoleHandler
 from apis.users_api import UsersHandler, UserHandler
-from apis.orders_api import OrdersHandler, OrderHandler, OrderRefundHandler, OrderReprintReceiptHandler
+from apis.orders_api import OrdersHandler, OrdersBatchHandler, OrderHandler, OrderRefundHandler, OrderReprintReceiptHandler
 from apis.order_items_api import OrderItemsHandler, OrderItemHandler
 from apis.alerts_api import AlertsHandler, AlertHandler
 from apis.auth_api import AuthLoginHandler, AuthLogoutHandler, AuthMeHandler, AuthRefreshHandler, AuthValidateSessionHandler, AuthPasswordResetRequestHandler, AuthValidateResetTokenHandler, AuthPasswordResetConfirmHandler
 from apis.reports_api import SalesDashboardHandler, DailySalesHandler, EmailDailySummaryHandler, TestEmailHandler
-from apis.system_api import HealthHandler, SettingsHandler
+from apis.system_api import HealthHandler, HealthLiveHandler, HealthReadyHandler, MetricsHandler, QueryDiagnosticsHandler, SettingsHandler
 from apis.upload_api import ImageUploadHandler, ImageServeHandler, BulkImageUploadHandler, ImageManagementHandler
 from apis.printer_api import PrinterTestHandler, PrinterStatusHandler
+from apis.realtime_api import RealtimeHandler
 from services.scheduler_service import scheduler_service
+from services.event_bus import event_bus
+from services.image_service import image_service
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -35,13 +39,20 @@ def make_app():
         
         # Menu items
         (r"/menu_items", MenuItemsHandler),
+        (r"/menu_items/changes", MenuItemChangesHandler),
+        (r"/menu_items/search", MenuItemSearchHandler),
         (r"/menu_items/([0-9a-fA-F-]+)", MenuItemHandler),
         (r"/menu_items/bulk-import", MenuItemsBulkImportHandler),
+        (r"/menu_items/([0-9a-fA-F-]+)/recipe", MenuItemRecipeHandler),
 
         # Inventory
         (r"/inventory", InventoryItemsHandler),
+        (r"/inventory/changes", InventoryChangesHandler),
         (r"/inventory/([0-9a-fA-F-]+)", InventoryItemHandler),
         (r"/inventory/([0-9a-fA-F-]+)/adjust", InventoryAdjustHandler),
+        (r"/inventory/adjust", InventoryBulkAdjustHandler),
+        (r"/inventory/stocktake", InventoryStocktakeHandler),
+        (r"/inventory/alerts", InventoryAlertsHandler),
         (r"/inventory/export", InventoryExportHandler),
 
         # Roles
@@ -54,6 +65,7 @@ def make_app():
 
         # Orders and Order Items
         (r"/orders", OrdersHandler),
+        (r"/orders/batch", OrdersBatchHandler),
         (r"/orders/([0-9a-fA-F-]+)", OrderHandler),
         (r"/orders/([0-9a-fA-F-]+)/refund", OrderRefundHandler),
         (r"/orders/([0-9a-fA-F-]+)/reprint-receipt", OrderReprintReceiptHandler),
@@ -81,19 +93,32 @@ def make_app():
         (r"/printer/test", PrinterTestHandler),
         (r"/printer/status", PrinterStatusHandler),
 
+        # Realtime
+        (r"/ws", RealtimeHandler),
+
         # System
         (r"/health", HealthHandler),
+        (r"/health/live", HealthLiveHandler),
+        (r"/health/ready", HealthReadyHandler),
+        (r"/metrics", MetricsHandler),
+        (r"/diagnostics/queries", QueryDiagnosticsHandler),
         (r"/settings", SettingsHandler),
     ])
 
 
 async def start_services():
+    # Listen for changes committed by every worker before anything subscribes to them
+    event_bus.start()
+
     # Start the scheduler service for daily email reports
     await scheduler_service.start()
     print("Daily email scheduler started")
 
 
 if __name__ == "__main__":
+    # Image workers are forked, so start them before the server opens its socket or starts threads
+    image_service.start()
+
     app = make_app()
     app.listen(8880)
 
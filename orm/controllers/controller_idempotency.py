@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from orm.db_init import session_scope
+from orm.models.model_idempotency_keys import IdempotencyKey
+
+
+class IdempotencyController:
+    def claim_key(self, session, scope, key, resource_id):
+        """
+        Claim an idempotency key inside the caller's transaction
+
+        Returns:
+            bool: True if the key was new, False if another request already claimed it
+        """
+        claimed = session.execute(
+            pg_insert(IdempotencyKey).values(
+                scope=scope,
+                key=key,
+                resource_id=resource_id
+            ).on_conflict_do_nothing().returning(IdempotencyKey.key)
+        ).first()
+        return claimed is not None
+
+    def release_key(self, session, scope, key):
+        """Delete a claimed key inside the caller's transaction, so it can be claimed again"""
+        session.query(IdempotencyKey).filter(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key
+        ).delete(synchronize_session=False)
+
+    def purge_expired(self, ttl):
+        """Delete keys claimed longer than ttl (a timedelta) ago, returning how many were removed"""
+        with session_scope() as session:
+            # created_at is naive UTC; an aware value would be compared in the session's time zone
+            return session.query(IdempotencyKey).filter(
+                IdempotencyKey.created_at < datetime.now(timezone.utc).replace(tzinfo=None) - ttl
+            ).delete(synchronize_session=False)
+
+    def get_idempotency_key(self, scope, key):
+        with session_scope() as session:
+            record = session.query(IdempotencyKey).filter(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key
+            ).first()
+            return None if record is None else self.idempotency_key_format(record)
+
+    def store_response(self, scope, key, response_status, response_body):
+        with session_scope() as session:
+            updated = session.query(IdempotencyKey).filter(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key
+            ).update({
+                IdempotencyKey.response_status: response_status,
+                IdempotencyKey.response_body: response_body
+            }, synchronize_session=False)
+        return updated > 0
+
+    def idempotency_key_format(self, record):
+        return {
+            'scope': record.scope,
+            'key': record.key,
+            'resourceId': str(record.resource_id) if record.resource_id else None,
+            'responseStatus': record.response_status,
+            'responseBody': record.response_body,
+            'createdAt': record.created_at.isoformat() if record.created_at else None
+        }
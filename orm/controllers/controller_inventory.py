@@ -1,11 +1,32 @@
 import uuid
+from decimal import Decimal
 from datetime import datetime, timezone
+from sqlalchemy import insert, update, values, column, case, Numeric, Boolean
+from sqlalchemy.dialects.postgresql import UUID
 
 from orm.db_init import session_scope
-from orm.models.model_inventory import InventoryItem
+from orm.models.model_inventory import InventoryItem, InventoryStatus
+from orm.models.model_stock_movements import StockMovement, MovementType
+from orm.controllers.controller_users import UserController
+from orm.controllers.controller_stock_alerts import StockAlertController
+from orm.controllers.controller_sync import SyncController
+from services.event_bus import event_bus
+
+
+class InsufficientStockError(ValueError):
+    """Raised when an adjustment would take an inventory item below zero stock"""
+
+    def __init__(self, inventory_item_ids):
+        self.inventory_item_ids = inventory_item_ids
+        super().__init__(f"Adjustment would result in negative stock for: {', '.join(inventory_item_ids)}")
 
 
 class InventoryController:
+    def __init__(self):
+        self.user_controller = UserController()
+        self.stock_alert_controller = StockAlertController()
+        self.sync_controller = SyncController()
+
     def create_inventory_item(self, name, category, current_stock, min_stock_level=10, max_stock_level=100, unit="pieces", 
                              cost_per_unit=0, supplier=None, last_restocked=None, expiry_date=None, barcode=None, 
                              description=None, location=None):
@@ -28,11 +49,15 @@ class InventoryController:
                 location=location
             )
             session.add(new_inventory_item)
+            session.flush()
+            self.stock_alert_controller.evaluate_items(session, [inventory_item_id])
+            self._publish_changed(session, [inventory_item_id], 'create')
         return self.get_inventory_items_by_filters(id=inventory_item_id)
 
-    def get_inventory_items_by_filters(self, id=None, name=None, category=None, all=False, start_and_end=None):
+    def get_inventory_items_by_filters(self, id=None, name=None, category=None, status=None, all=False, start_and_end=None):
         with session_scope() as session:
             query = session.query(InventoryItem)
+            query = query.order_by(InventoryItem.name.asc(), InventoryItem.id.asc())
 
             if id:
                 query = query.filter(InventoryItem.id == id)
@@ -40,6 +65,11 @@ class InventoryController:
                 query = query.filter(InventoryItem.name.ilike(f'%{name}%'))
             if category:
                 query = query.filter(InventoryItem.category == category)
+            if status:
+                query = query.filter(InventoryItem.status == status)
+                if status == InventoryStatus.low_stock.value:
+                    # Implied by the status, spelled out so the partial below-minimum index can be used
+                    query = query.filter(InventoryItem.current_stock <= InventoryItem.min_stock_level)
 
             if all:
                 total = query.count()
@@ -53,6 +83,10 @@ class InventoryController:
                 inventory_item = query.first()
                 return None if inventory_item is None else self.inventory_item_format(inventory_item)
 
+    def get_inventory_item_changes(self, since_token=None):
+        """Get inventory items changed or deleted since a sync token, see SyncController.get_changes"""
+        return self.sync_controller.get_changes(InventoryItem, 'inventory_items', self.inventory_item_format, since_token)
+
     def update_inventory_item(self, inventory_item_id, **fields):
         with session_scope() as session:
             inventory_item = session.query(InventoryItem).filter(InventoryItem.id == inventory_item_id).first()
@@ -61,14 +95,237 @@ class InventoryController:
             for key, value in fields.items():
                 if hasattr(inventory_item, key) and value is not None:
                     setattr(inventory_item, key, value)
+            session.flush()
+            self.stock_alert_controller.evaluate_items(session, [inventory_item.id])
+            self._publish_changed(session, [inventory_item.id], 'update')
             return self.inventory_item_format(inventory_item)
 
+    def adjust_stock(self, inventory_item_id, adjustment, movement_type=MovementType.adjustment,
+                     reason="Manual adjustment", staff_id=None, notes=None, cost=None, supplier=None):
+        """
+        Atomically change the stock of an inventory item and record the movement
+
+        Returns:
+            dict: {'inventory': ..., 'movement': ...}, or None if the inventory item doesn't exist
+
+        Raises:
+            InsufficientStockError: If the adjustment would result in negative stock
+        """
+        try:
+            result = self.adjust_stock_bulk([{
+                'inventory_item_id': inventory_item_id,
+                'adjustment': adjustment,
+                'movement_type': movement_type,
+                'reason': reason,
+                'notes': notes,
+                'cost': cost,
+                'supplier': supplier
+            }], staff_id=staff_id)
+        except LookupError:
+            return None
+        return {'inventory': result['inventory'][0], 'movement': result['movements'][0]}
+
+    def adjust_stock_bulk(self, adjustments, staff_id=None):
+        """
+        Atomically apply many stock adjustments in one transaction
+
+        The rows are locked in id order first, like stock takes and sale consumption do, so
+        transactions touching overlapping items queue up instead of deadlocking. All items
+        are then changed by a single UPDATE ... FROM (VALUES ...) whose WHERE clause rejects
+        any row that would go below zero, and the stock movements are written with one bulk
+        insert. Either every adjustment is applied or none is.
+
+        Args:
+            adjustments (list): Dicts with 'inventory_item_id', 'adjustment' and optionally
+                                'movement_type', 'reason', 'notes', 'cost' and 'supplier'
+            staff_id (str): User recorded on the movements, defaults to the system user
+
+        Returns:
+            dict: {'inventory': [...], 'movements': [...]} in the order of the adjustments
+
+        Raises:
+            LookupError: If an inventory item doesn't exist
+            InsufficientStockError: If an adjustment would result in negative stock
+        """
+        item_ids = []
+        for adjustment in adjustments:
+            try:
+                item_ids.append(str(uuid.UUID(str(adjustment['inventory_item_id']))))
+            except ValueError:
+                raise LookupError(f"Inventory items not found: {adjustment['inventory_item_id']}")
+        if len(set(item_ids)) != len(item_ids):
+            raise ValueError("Each inventory item can only be adjusted once per request")
+
+        with session_scope() as session:
+            staff_id = self.user_controller.resolve_staff_id(session, staff_id)
+            now = datetime.now(timezone.utc)
+
+            # Lock in a fixed order; the UPDATE below would lock rows in whatever order the planner picks
+            session.query(InventoryItem.id).filter(
+                InventoryItem.id.in_(item_ids)
+            ).order_by(InventoryItem.id).with_for_update().all()
+
+            deltas = values(
+                column('inventory_item_id', UUID(as_uuid=True)),
+                column('adjustment', Numeric(10, 3)),
+                column('restocked', Boolean),
+                name='deltas'
+            ).data([
+                (uuid.UUID(item_id), adjustment['adjustment'],
+                 adjustment.get('movement_type', MovementType.adjustment) == MovementType.restock)
+                for item_id, adjustment in zip(item_ids, adjustments)
+            ])
+            updated = {
+                str(item.id): item for item in session.scalars(
+                    update(InventoryItem)
+                    .where(InventoryItem.id == deltas.c.inventory_item_id)
+                    .where(InventoryItem.current_stock + deltas.c.adjustment >= 0)
+                    .values(
+                        current_stock=InventoryItem.current_stock + deltas.c.adjustment,
+                        last_restocked=case((deltas.c.restocked, now), else_=InventoryItem.last_restocked),
+                        updated_at=now
+                    )
+                    .returning(InventoryItem)
+                    .execution_options(synchronize_session=False)
+                ).all()
+            }
+
+            if len(updated) < len(item_ids):
+                rejected = [item_id for item_id in item_ids if item_id not in updated]
+                existing = {
+                    str(item_id) for (item_id,) in session.query(InventoryItem.id).filter(
+                        InventoryItem.id.in_(rejected)
+                    ).all()
+                }
+                missing = [item_id for item_id in rejected if item_id not in existing]
+                if missing:
+                    raise LookupError(f"Inventory items not found: {', '.join(missing)}")
+                raise InsufficientStockError(rejected)
+
+            movement_rows = []
+            for item_id, adjustment in zip(item_ids, adjustments):
+                quantity = Decimal(str(adjustment['adjustment']))
+                new_stock = updated[item_id].current_stock
+                movement_rows.append({
+                    'id': uuid.uuid4(),
+                    'inventory_item_id': uuid.UUID(item_id),
+                    'type': adjustment.get('movement_type', MovementType.adjustment),
+                    'quantity': quantity,
+                    'previous_stock': new_stock - quantity,
+                    'new_stock': new_stock,
+                    'reason': adjustment.get('reason') or "Manual adjustment",
+                    'staff_id': staff_id,
+                    'cost': adjustment.get('cost'),
+                    'supplier': adjustment.get('supplier'),
+                    'notes': adjustment.get('notes'),
+                    'created_at': now
+                })
+            movements = session.scalars(
+                insert(StockMovement).returning(StockMovement, sort_by_parameter_order=True), movement_rows
+            ).all()
+            self.stock_alert_controller.evaluate_items(session, item_ids)
+            self._publish_changed(session, item_ids, 'adjustment')
+
+            return {
+                'inventory': [self.inventory_item_format(updated[item_id]) for item_id in item_ids],
+                'movements': [self.stock_movement_format(movement) for movement in movements]
+            }
+
+    def apply_stocktake(self, counts, staff_id=None, notes=None):
+        """
+        Set the stock of many inventory items to their counted quantities in one transaction
+
+        The counted rows are locked with one SELECT ... FOR UPDATE, written with one
+        UPDATE ... FROM (VALUES ...) and every non-zero variance is recorded with one
+        bulk insert of adjustment movements.
+
+        Args:
+            counts (list): Dicts with 'inventory_item_id' and 'counted_stock'
+            staff_id (str): User who performed the count, defaults to the system user
+            notes (str): Notes stored on every movement of the stock take
+
+        Returns:
+            list: Variance per counted item, in the order of the counts
+
+        Raises:
+            LookupError: If an inventory item doesn't exist
+        """
+        try:
+            item_ids = [str(uuid.UUID(str(count['inventory_item_id']))) for count in counts]
+        except ValueError:
+            raise LookupError("Inventory items not found: invalid inventory item id")
+        if len(set(item_ids)) != len(item_ids):
+            raise ValueError("Each inventory item can only be counted once per stock take")
+
+        with session_scope() as session:
+            staff_id = self.user_controller.resolve_staff_id(session, staff_id)
+            now = datetime.now(timezone.utc)
+
+            current = {
+                str(item.id): item for item in session.query(
+                    InventoryItem.id, InventoryItem.name, InventoryItem.unit,
+                    InventoryItem.current_stock, InventoryItem.cost_per_unit
+                ).filter(InventoryItem.id.in_(item_ids)).order_by(InventoryItem.id).with_for_update().all()
+            }
+            missing = [item_id for item_id in item_ids if item_id not in current]
+            if missing:
+                raise LookupError(f"Inventory items not found: {', '.join(missing)}")
+
+            counted = [Decimal(str(count['counted_stock'])) for count in counts]
+            counted_values = values(
+                column('inventory_item_id', UUID(as_uuid=True)),
+                column('counted_stock', Numeric(10, 3)),
+                name='counted'
+            ).data([(uuid.UUID(item_id), stock) for item_id, stock in zip(item_ids, counted)])
+            session.execute(
+                update(InventoryItem)
+                .where(InventoryItem.id == counted_values.c.inventory_item_id)
+                .values(current_stock=counted_values.c.counted_stock, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+
+            variances = []
+            movement_rows = []
+            for item_id, counted_stock in zip(item_ids, counted):
+                item = current[item_id]
+                variance = counted_stock - item.current_stock
+                variances.append({
+                    'inventoryItemId': item_id,
+                    'name': item.name,
+                    'unit': item.unit,
+                    'previousStock': float(item.current_stock),
+                    'countedStock': float(counted_stock),
+                    'variance': float(variance),
+                    'varianceCost': round(float(variance * item.cost_per_unit), 2)
+                })
+                if variance != 0:
+                    movement_rows.append({
+                        'id': uuid.uuid4(),
+                        'inventory_item_id': uuid.UUID(item_id),
+                        'type': MovementType.adjustment,
+                        'quantity': variance,
+                        'previous_stock': item.current_stock,
+                        'new_stock': counted_stock,
+                        'reason': "Stock take",
+                        'staff_id': staff_id,
+                        'notes': notes,
+                        'created_at': now
+                    })
+            if movement_rows:
+                session.execute(insert(StockMovement), movement_rows)
+            self.stock_alert_controller.evaluate_items(session, item_ids)
+            self._publish_changed(session, item_ids, 'stocktake')
+
+            return variances
+
     def delete_inventory_item(self, inventory_item_id):
         with session_scope() as session:
             inventory_item = session.query(InventoryItem).filter(InventoryItem.id == inventory_item_id).first()
             if not inventory_item:
                 return False
             session.delete(inventory_item)
+            self.sync_controller.record_deletion(session, 'inventory_items', inventory_item.id)
+            self._publish_changed(session, [inventory_item_id], 'delete')
         return True
 
     def inventory_item_format(self, inventory_item):
@@ -91,3 +348,26 @@ class InventoryController:
             'createdAt': inventory_item.created_at.isoformat(),
             'updatedAt': inventory_item.updated_at.isoformat()
         }
+
+    def _publish_changed(self, session, inventory_item_ids, source):
+        event_bus.emit(session, 'inventory.changed', {
+            'inventoryItemIds': [str(item_id) for item_id in inventory_item_ids],
+            'source': source
+        })
+
+    def stock_movement_format(self, movement):
+        return {
+            'id': str(movement.id),
+            'inventoryItemId': str(movement.inventory_item_id),
+            'type': movement.type.value,
+            'quantity': float(movement.quantity),
+            'previousStock': float(movement.previous_stock),
+            'newStock': float(movement.new_stock),
+            'reason': movement.reason,
+            'staffId': str(movement.staff_id),
+            'cost': float(movement.cost) if movement.cost is not None else None,
+            'supplier': movement.supplier,
+            'referenceOrderId': str(movement.reference_order_id) if movement.reference_order_id else None,
+            'notes': movement.notes,
+            'createdAt': movement.created_at.isoformat() if movement.created_at else None
+        }
@@ -1,11 +1,24 @@
 import uuid
 from datetime import datetime, timezone
+from sqlalchemy import func, insert, update, values, column, text, case, or_, literal, String, Numeric
+from sqlalchemy.dialects.postgresql import UUID
 
+from orm import db_init
 from orm.db_init import session_scope
 from orm.models.model_menu import MenuItem
+from orm.controllers.controller_sync import SyncController
+from services.event_bus import event_bus
+
+
+def escape_like(term):
+    """Escape LIKE wildcards so a search term matches literally"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 
 class MenuController:
+    def __init__(self):
+        self.sync_controller = SyncController()
+
     def create_menu_item(self, name, size, price, category='General', description=None, image_url=None, is_active=True, sort_order=0):
         with session_scope() as session:
             menu_item_id = str(uuid.uuid4())
@@ -21,6 +34,7 @@ class MenuController:
                 sort_order=sort_order
             )
             session.add(new_menu_item)
+            event_bus.emit(session, 'menu.changed', {'menuItemIds': [menu_item_id], 'source': 'create'})
         return self.get_menu_items_by_filters(id=menu_item_id)
 
     def get_menu_items_by_filters(self, id=None, name=None, size=None, is_active=None, all=False, start_and_end=None):
@@ -49,6 +63,59 @@ class MenuController:
                 menu_item = query.first()
                 return None if menu_item is None else self.menu_item_format(menu_item)
 
+    def search_menu_items(self, term, limit=10, category=None, include_inactive=False):
+        """
+        Search menu items by name, category and description, best matches first
+
+        An exact name ranks first and a name prefix next, which serves the till's
+        typeahead from the ix_menu_items_name_prefix index. With pg_trgm installed,
+        the rest are ranked by trigram word similarity, so misspellings still match;
+        without it they fall back to substring matching.
+
+        Returns:
+            list: Formatted menu items, each with its search 'score'
+        """
+        term = term.strip().lower()
+        prefix = f"{escape_like(term)}%"
+        contains = f"%{escape_like(term)}%"
+        name = func.lower(MenuItem.name)
+        exact_or_prefix = case((name == term, 3.0), (name.like(prefix, escape='\\'), 2.0), else_=0.0)
+        in_description = MenuItem.description.ilike(contains, escape='\\')
+
+        if db_init.trigram_search_enabled:
+            # %> and % are the similarity operators the GIN trigram indexes serve
+            matches = or_(
+                name.like(prefix, escape='\\'),
+                MenuItem.name.op('%>')(term),
+                MenuItem.category.op('%')(term),
+                in_description
+            )
+            score = exact_or_prefix + func.greatest(
+                func.word_similarity(literal(term), MenuItem.name),
+                func.similarity(literal(term), MenuItem.category) * 0.5,
+                case((in_description, 0.3), else_=0.0)
+            )
+        else:
+            matches = or_(name.like(contains, escape='\\'), MenuItem.category.ilike(contains, escape='\\'), in_description)
+            score = exact_or_prefix + case(
+                (name.like(contains, escape='\\'), 1.0),
+                (MenuItem.category.ilike(contains, escape='\\'), 0.5),
+                else_=0.3
+            )
+
+        with session_scope() as session:
+            query = session.query(MenuItem, score.label('score')).filter(matches)
+            if category:
+                query = query.filter(MenuItem.category == category)
+            if not include_inactive:
+                query = query.filter(MenuItem.is_active.is_(True))
+            rows = query.order_by(score.desc(), MenuItem.name.asc(), MenuItem.sort_order.asc()).limit(limit).all()
+            return [{**self.menu_item_format(item), 'score': round(float(item_score), 3)} for item, item_score in rows]
+
+    def get_menu_item_changes(self, since_token=None):
+        """Get menu items changed or deleted since a sync token, see SyncController.get_changes"""
+        return self.sync_controller.get_changes(MenuItem, 'menu_items', self.menu_item_format, since_token)
+
     def update_menu_item(self, menu_item_id, fields=None, **kwargs):
         with session_scope() as session:
             menu_item = session.query(MenuItem).filter(MenuItem.id == menu_item_id).first()
@@ -60,16 +127,124 @@ class MenuController:
             for key, value in update_fields.items():
                 if hasattr(menu_item, key):
                     setattr(menu_item, key, value)
+            event_bus.emit(session, 'menu.changed', {'menuItemIds': [str(menu_item.id)], 'source': 'update'})
             return self.menu_item_format(menu_item)
 
+    def set_menu_item_images(self, menu_item_ids, image_url):
+        """Point several menu items at one image in a single statement, returning the ids updated"""
+        with session_scope() as session:
+            updated_ids = [str(menu_item_id) for menu_item_id in session.execute(
+                update(MenuItem).where(MenuItem.id.in_(menu_item_ids)).values(image_url=image_url).returning(MenuItem.id)
+            ).scalars()]
+            if updated_ids:
+                event_bus.emit(session, 'menu.changed', {'menuItemIds': updated_ids, 'source': 'update'})
+            return updated_ids
+
+    def bulk_import_menu_items(self, rows, update_existing=False, dry_run=False):
+        """
+        Create or update many menu items in one transaction
+
+        Existing items are matched on case-insensitive (name, size) with a single
+        query, new items are written with one bulk INSERT and existing ones with one
+        UPDATE ... FROM (VALUES ...). Concurrent imports are serialized.
+
+        Args:
+            rows (list): Dicts with 'name', 'size', 'price', 'category' and 'description'
+            update_existing (bool): Update matching items instead of skipping them
+            dry_run (bool): Work out what would change without writing anything
+
+        Returns:
+            dict: 'created', 'updated' and 'skipped' lists of {'index', 'id', 'name', 'size'}
+        """
+        result = {'created': [], 'updated': [], 'skipped': []}
+        with session_scope() as session:
+            if not dry_run:
+                session.execute(text("SELECT pg_advisory_xact_lock(hashtext('menu_items.bulk_import'))"))
+
+            existing = {
+                (name, size): menu_item_id for menu_item_id, name, size in session.query(
+                    MenuItem.id, func.lower(MenuItem.name), func.lower(MenuItem.size)
+                ).all()
+            }
+
+            now = datetime.now(timezone.utc)
+            insert_rows = []
+            update_rows = []
+            for index, row in enumerate(rows):
+                key = (row['name'].lower(), row['size'].lower())
+                entry = {'index': index, 'name': row['name'], 'size': row['size']}
+                if key in existing:
+                    entry['id'] = str(existing[key])
+                    if update_existing:
+                        update_rows.append((existing[key], row['price'], row['category'], row['description']))
+                        result['updated'].append(entry)
+                    else:
+                        result['skipped'].append(entry)
+                    continue
+
+                menu_item_id = uuid.uuid4()
+                existing[key] = menu_item_id
+                entry['id'] = str(menu_item_id)
+                insert_rows.append({
+                    'id': menu_item_id,
+                    'name': row['name'],
+                    'size': row['size'],
+                    'price': row['price'],
+                    'category': row['category'],
+                    'description': row['description'],
+                    'is_active': True,
+                    'sort_order': 0,
+                    'created_at': now,
+                    'updated_at': now
+                })
+                result['created'].append(entry)
+
+            if dry_run:
+                return result
+
+            if insert_rows:
+                session.execute(insert(MenuItem), insert_rows)
+            if update_rows:
+                imported = values(
+                    column('id', UUID(as_uuid=True)),
+                    column('price', Numeric(10, 2)),
+                    column('category', String(50)),
+                    column('description', String),
+                    name='imported'
+                ).data(update_rows)
+                session.execute(
+                    update(MenuItem)
+                    .where(MenuItem.id == imported.c.id)
+                    .values(price=imported.c.price, category=imported.c.category,
+                            description=imported.c.description, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+
+            changed_ids = [entry['id'] for entry in result['created'] + result['updated']]
+            if changed_ids:
+                event_bus.emit(session, 'menu.changed', {'menuItemIds': changed_ids, 'source': 'import'})
+        return result
+
     def delete_menu_item(self, menu_item_id):
         with session_scope() as session:
             menu_item = session.query(MenuItem).filter(MenuItem.id == menu_item_id).first()
             if not menu_item:
                 return False
             session.delete(menu_item)
+            self.sync_controller.record_deletion(session, 'menu_items', menu_item.id)
+            event_bus.emit(session, 'menu.changed', {'menuItemIds': [str(menu_item_id)], 'source': 'delete'})
         return True
 
+    def get_image_reference_counts(self):
+        """Count the menu items referencing each image URL; shared images appear once with their count"""
+        with session_scope() as session:
+            return dict(
+                session.query(MenuItem.image_url, func.count(MenuItem.id))
+                .filter(MenuItem.image_url.isnot(None))
+                .group_by(MenuItem.image_url)
+                .all()
+            )
+
     def menu_item_format(self, menu_item):
         return {
             'id': str(menu_item.id),
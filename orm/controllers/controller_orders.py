@@ -1,136 +1,345 @@
 import uuid
+from collections import defaultdict
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, insert, select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from orm.db_init import session_scope
-from orm.models.model_orders import Order, PaymentMethod, OrderStatus
+from orm.models.model_orders import Order, PaymentMethod, OrderStatus, order_number_seq
 from orm.models.model_order_items import OrderItem
 from orm.models.model_menu import MenuItem
-from orm.models.model_users import User, UserRole
+from orm.models.model_users import User
+from orm.models.model_idempotency_keys import IdempotencyKey
+from orm.controllers.controller_users import UserController
+from orm.controllers.controller_idempotency import IdempotencyController
+from orm.controllers.controller_recipes import RecipeController
+from services.event_bus import event_bus
+
+ORDER_CREATE_SCOPE = 'orders.create'
+ORDER_BATCH_SCOPE = 'orders.batch'
 
 
 class OrderController:
-    def _get_or_create_system_user(self, session):
-        """Get or create a system user for orders without valid staff_id"""
-        # Try to find an existing admin user
-        system_user = session.query(User).filter(User.username == 'admin').first()
-        if system_user:
-            return str(system_user.id)
-        
-        # Try to find any admin user
-        system_user = session.query(User).filter(User.role == UserRole.admin).first()
-        if system_user:
-            return str(system_user.id)
-            
-        # Create a system user if none exists
-        system_user_id = str(uuid.uuid4())
-        new_user = User(
-            id=system_user_id,
-            username='system',
-            first_name='System',
-            last_name='User',
-            email='system@cafepos.com',
-            role=UserRole.admin,
-            password_hash='system',  # Placeholder
-            is_active=True
+    def __init__(self):
+        self.user_controller = UserController()
+        self.idempotency_controller = IdempotencyController()
+        self.recipe_controller = RecipeController()
+
+    def _order_number_prefix(self):
+        # Format: ORD + YYMMDD + sequence (3+6+6 = 15 chars, max 20)
+        return f"ORD{datetime.now().strftime('%y%m%d')}"  # Use 2-digit year
+
+    def _order_number_expression(self):
+        """SQL expression drawing the next order number from order_number_seq inside the INSERT"""
+        # Zero-padded to 6 digits and widened past 999999, matching _next_order_numbers
+        return func.concat(
+            self._order_number_prefix(),
+            func.to_char(order_number_seq.next_value(), 'FM99999999000000')
         )
-        session.add(new_user)
-        return system_user_id
-    
-    def create_order(self, user_id=None, staff_id=None, subtotal=None, tax=None, tax_amount=None, total=None, total_amount=None, 
-                    discount_amount=0.0, discount_reason=None, status="completed", payment_method="cash", 
-                    cash_received=0.0, change_given=0.0, amount_paid=None, change_amount=None, 
-                    customer_name=None, order_notes=None, items=None, **kwargs):
+
+    def _next_order_numbers(self, session, count):
+        """Allocate count order numbers with a single round trip"""
+        prefix = self._order_number_prefix()
+        counters = session.scalars(
+            select(order_number_seq.next_value()).select_from(func.generate_series(1, count))
+        ).all()
+        return [f"{prefix}{counter:06d}" for counter in sorted(counters)]
+
+    def _order_values(self, order_id, order_number, staff_id, subtotal=None, tax=None, tax_amount=None, total=None,
+                      total_amount=None, discount_amount=0.0, status="completed", payment_method="cash",
+                      cash_received=0.0, change_given=0.0, amount_paid=None, change_amount=None,
+                      customer_name=None, order_notes=None, **kwargs):
+        """Map the accepted field name variations onto Order column values"""
+        return {
+            'id': order_id,
+            'order_number': order_number,
+            'staff_id': staff_id,
+            'subtotal': subtotal,
+            'tax_amount': tax_amount or tax,
+            'total_amount': total_amount or total,
+            'discount_amount': discount_amount,
+            'payment_method': PaymentMethod(payment_method) if isinstance(payment_method, str) else payment_method,
+            'cash_received': amount_paid if payment_method == 'cash' else cash_received,
+            'change_amount': change_amount or change_given,
+            'status': OrderStatus(status) if isinstance(status, str) else status,
+            'customer_name': customer_name,
+            'notes': order_notes
+        }
+
+    def _order_item_values(self, order_id, item_data):
+        """Map a till line item onto OrderItem column values, or None if it can't be stored"""
+        # Skip items without valid menu_item_id for now
+        menu_item_id = item_data.get('productId')
+        if not menu_item_id:
+            return None
+
+        quantity = int(item_data.get('quantity', 1))
+        unit_price = float(item_data.get('price', 0))
+        return {
+            'id': str(uuid.uuid4()),
+            'order_id': order_id,
+            'menu_item_id': menu_item_id,
+            'menu_item_name': item_data.get('productName', 'Unknown Item'),
+            'menu_item_size': item_data.get('size', 'Regular'),
+            'unit_price': unit_price,
+            'quantity': quantity,
+            'line_total': quantity * unit_price,
+            'notes': item_data.get('notes', '')
+        }
+
+    def create_order(self, user_id=None, staff_id=None, items=None, idempotency_key=None, **fields):
+        """
+        Create an order and its items, formatting the response from the inserted rows
+        
+        The staff lookup is folded into the INSERT and the stored order comes back through
+        RETURNING, so no read-after-write query is needed.
+        
+        When an idempotency_key is given it is claimed in the same transaction; if another
+        request already claimed it, that request's order is returned with 'replayed' set.
+        A key whose order no longer exists (deleted since) is released and claimed afresh.
+        """
         with session_scope() as session:
             order_id = str(uuid.uuid4())
-            
-            # Generate order number (max 20 chars)
-            # Format: ORD-YYMMDD-XXXX (4+6+1+4+1 = 16 chars)
-            date_str = datetime.now().strftime('%y%m%d')  # Use 2-digit year
-            order_suffix = str(order_id).replace('-', '')[:4].upper()  # Remove dashes, take 4 chars
-            order_number = f"ORD{date_str}{order_suffix}"  # Total: 3+6+4 = 13 chars
+
+            if idempotency_key and not self.idempotency_controller.claim_key(
+                    session, ORDER_CREATE_SCOPE, idempotency_key, order_id):
+                existing_order = session.query(Order).options(joinedload(Order.order_items)).join(
+                    IdempotencyKey, IdempotencyKey.resource_id == Order.id
+                ).filter(
+                    IdempotencyKey.scope == ORDER_CREATE_SCOPE,
+                    IdempotencyKey.key == idempotency_key
+                ).first()
+                if existing_order is not None:
+                    return {**self.order_format(existing_order), 'replayed': True}
+                # The claiming transaction has committed (the INSERT waited for it), so the key is stale
+                self.idempotency_controller.release_key(session, ORDER_CREATE_SCOPE, idempotency_key)
+                self.idempotency_controller.claim_key(session, ORDER_CREATE_SCOPE, idempotency_key, order_id)
+
+            order_number = self._order_number_expression()
             
             # Handle field name variations
             final_staff_id = staff_id or user_id
-            final_tax = tax_amount or tax
-            final_total = total_amount or total
-            final_change = change_amount or change_given
-            final_cash = amount_paid if payment_method == 'cash' else cash_received
+            system_user_id = self.user_controller.get_or_create_system_user(session)
             
-            # Handle staff_id - if it's not a valid UUID, try to find user or create a default one
+            # Unknown or invalid staff ids fall back to the system user inside the INSERT itself
             try:
-                if final_staff_id:
-                    # Try to parse as UUID
-                    uuid.UUID(final_staff_id)
-                    
-                    # Check if user exists
-                    existing_user = session.query(User).filter(User.id == final_staff_id).first()
-                    if not existing_user:
-                        # User doesn't exist, use system user or create one
-                        final_staff_id = self._get_or_create_system_user(session)
-                else:
-                    # No staff_id provided, use system user
-                    final_staff_id = self._get_or_create_system_user(session)
-            except (ValueError, TypeError):
-                # Invalid UUID format, use system user
-                final_staff_id = self._get_or_create_system_user(session)
-            
-            # Handle enum values
-            final_payment_method = PaymentMethod(payment_method) if isinstance(payment_method, str) else payment_method
-            final_status = OrderStatus(status) if isinstance(status, str) else status
-            
-            new_order = Order(
-                id=order_id,
-                order_number=order_number,
-                staff_id=final_staff_id,
-                subtotal=subtotal,
-                tax_amount=final_tax,
-                total_amount=final_total,
-                discount_amount=discount_amount,
-                payment_method=final_payment_method,
-                cash_received=final_cash,
-                change_amount=final_change,
-                status=final_status,
-                customer_name=customer_name,
-                notes=order_notes
-            )
-            session.add(new_order)
+                final_staff_id = func.coalesce(
+                    select(User.id).where(User.id == uuid.UUID(final_staff_id)).scalar_subquery(),
+                    uuid.UUID(system_user_id)
+                )
+            except (ValueError, TypeError, AttributeError):
+                final_staff_id = system_user_id
             
-            # Add order items if provided
+            # Build order items if provided
+            item_rows = []
             if items and isinstance(items, list):
                 for item_data in items:
-                    # Skip items without valid menu_item_id for now
-                    menu_item_id = item_data.get('productId')
-                    if not menu_item_id:
-                        continue
-                        
                     try:
-                        quantity = int(item_data.get('quantity', 1))
-                        unit_price = float(item_data.get('price', 0))
-                        line_total = quantity * unit_price
-                        
-                        order_item = OrderItem(
-                            id=str(uuid.uuid4()),
-                            order_id=order_id,
-                            menu_item_id=menu_item_id,
-                            menu_item_name=item_data.get('productName', 'Unknown Item'),
-                            menu_item_size=item_data.get('size', 'Regular'),
-                            unit_price=unit_price,
-                            quantity=quantity,
-                            line_total=line_total,
-                            notes=item_data.get('notes', '')
-                        )
-                        session.add(order_item)
+                        item_values = self._order_item_values(order_id, item_data)
+                        if item_values:
+                            item_rows.append(item_values)
                     except Exception as e:
                         # Skip this item if there's an error
                         print(f"Error adding order item: {e}")
                         continue
-                    
-        return self.get_orders_by_filters(id=order_id)
+            
+            order_values = self._order_values(order_id, order_number, final_staff_id, **fields)
+            new_order = session.scalars(insert(Order).values(**order_values).returning(Order)).one()
+            if item_rows:
+                session.execute(insert(OrderItem), item_rows)
+            
+            # Decrement the ingredients of what was sold in the same transaction
+            touched_inventory_ids = self.recipe_controller.consume_ingredients(session, [{
+                'order_id': order_id,
+                'order_number': new_order.order_number,
+                'staff_id': new_order.staff_id,
+                'items': [(row['menu_item_id'], row['quantity']) for row in item_rows]
+            }])
+            
+            # The items were just written, so attach them without another SELECT
+            set_committed_value(new_order, 'order_items', [OrderItem(**values) for values in item_rows])
+            order = self.order_format(new_order)
+            order['inventory_updated'] = bool(touched_inventory_ids)
+            event_bus.emit(session, 'orders.created', order)
+            return order
+
+    def create_orders_batch(self, orders):
+        """
+        Create many orders in a single transaction, idempotent on each order's client reference
+        
+        Args:
+            orders (list): Order dicts using create_order's field names plus 'client_reference'
+            
+        Returns:
+            list: One result dict per input order, in input order, with status
+                  'created', 'duplicate' or 'failed'
+        """
+        results = [None] * len(orders)
+
+        with session_scope() as session:
+            references = [order['client_reference'] for order in orders]
+
+            # Orders already replayed by an earlier (possibly interrupted) sync
+            existing = {
+                row.key: row for row in session.query(
+                    IdempotencyKey.key, Order.id, Order.order_number
+                ).join(Order, Order.id == IdempotencyKey.resource_id).filter(
+                    IdempotencyKey.scope == ORDER_BATCH_SCOPE,
+                    IdempotencyKey.key.in_(references)
+                ).all()
+            }
+
+            # Resolve every referenced staff member with one query
+            candidate_staff_ids = set()
+            for order in orders:
+                staff_id = order.get('staff_id') or order.get('user_id')
+                try:
+                    candidate_staff_ids.add(str(uuid.UUID(staff_id)))
+                except (ValueError, TypeError, AttributeError):
+                    continue
+            known_staff_ids = {
+                str(user_id) for (user_id,) in session.query(User.id).filter(User.id.in_(candidate_staff_ids)).all()
+            } if candidate_staff_ids else set()
+            system_user_id = None
+
+            # Resolve every referenced menu item the same way; orders referencing unknown ones fail on their own
+            candidate_menu_item_ids = set()
+            for order in orders:
+                for item in order.get('items') or []:
+                    try:
+                        candidate_menu_item_ids.add(str(uuid.UUID(str(item.get('productId')))))
+                    except (ValueError, TypeError, AttributeError):
+                        continue
+            known_menu_item_ids = {
+                str(menu_item_id) for (menu_item_id,) in session.query(MenuItem.id).filter(
+                    MenuItem.id.in_(candidate_menu_item_ids)
+                ).all()
+            } if candidate_menu_item_ids else set()
+
+            order_rows = []
+            item_rows = []
+            key_rows = []
+            pending = {}
+
+            for index, order in enumerate(orders):
+                reference = order['client_reference']
+                if reference in existing:
+                    row = existing[reference]
+                    results[index] = self._batch_result(index, reference, 'duplicate', str(row.id), row.order_number)
+                    continue
+                if reference in pending:
+                    first_index = pending[reference]
+                    results[index] = self._batch_result(index, reference, 'duplicate', order_rows[first_index]['id'])
+                    continue
+
+                staff_id = order.get('staff_id') or order.get('user_id')
+                try:
+                    staff_id = str(uuid.UUID(staff_id))
+                except (ValueError, TypeError, AttributeError):
+                    staff_id = None
+                if staff_id not in known_staff_ids:
+                    if system_user_id is None:
+                        system_user_id = self.user_controller.get_or_create_system_user(session)
+                    staff_id = system_user_id
+
+                unknown_products = []
+                for item in order.get('items') or []:
+                    product_id = item.get('productId') if isinstance(item, dict) else None
+                    if not product_id:
+                        continue
+                    try:
+                        known = str(uuid.UUID(str(product_id))) in known_menu_item_ids
+                    except ValueError:
+                        known = False
+                    if not known:
+                        unknown_products.append(str(product_id))
+                if unknown_products:
+                    results[index] = self._batch_result(
+                        index, reference, 'failed', errors=[f"Unknown menu item: {product_id}" for product_id in unknown_products]
+                    )
+                    continue
+
+                order_id = str(uuid.uuid4())
+
+                try:
+                    fields = {k: v for k, v in order.items() if k not in ('client_reference', 'staff_id', 'user_id', 'items')}
+                    # Numbers are allocated once the batch's new orders are known
+                    order_values = self._order_values(order_id, None, staff_id, **fields)
+                    order_item_rows = [
+                        values for values in (self._order_item_values(order_id, item) for item in order.get('items') or [])
+                        if values
+                    ]
+                except (ValueError, TypeError) as e:
+                    results[index] = self._batch_result(index, reference, 'failed', errors=[str(e)])
+                    continue
+
+                pending[reference] = len(order_rows)
+                order_rows.append(order_values)
+                item_rows.extend(order_item_rows)
+                key_rows.append({'scope': ORDER_BATCH_SCOPE, 'key': reference, 'resource_id': order_id})
+                results[index] = self._batch_result(index, reference, 'created', order_id)
+
+            if key_rows:
+                # Claim the keys first so a concurrent replay of the same orders can't double-insert
+                claimed = set(session.scalars(
+                    pg_insert(IdempotencyKey).on_conflict_do_nothing().returning(IdempotencyKey.key),
+                    key_rows
+                ).all())
+                if len(claimed) < len(key_rows):
+                    lost_ids = {row['resource_id'] for row in key_rows if row['key'] not in claimed}
+                    order_rows = [row for row in order_rows if row['id'] not in lost_ids]
+                    item_rows = [row for row in item_rows if row['order_id'] not in lost_ids]
+                    for index, result in enumerate(results):
+                        if result['status'] == 'created' and result['orderId'] in lost_ids:
+                            results[index] = self._batch_result(index, result['clientReference'], 'duplicate')
+
+            if order_rows:
+                order_numbers = {}
+                for row, order_number in zip(order_rows, self._next_order_numbers(session, len(order_rows))):
+                    row['order_number'] = order_number
+                    order_numbers[row['id']] = order_number
+                for result in results:
+                    if result['orderId'] in order_numbers:
+                        result['orderNumber'] = order_numbers[result['orderId']]
+                session.execute(insert(Order), order_rows)
+            if item_rows:
+                session.execute(insert(OrderItem), item_rows)
+
+                sold_items = defaultdict(list)
+                for row in item_rows:
+                    sold_items[row['order_id']].append((row['menu_item_id'], row['quantity']))
+                self.recipe_controller.consume_ingredients(session, [{
+                    'order_id': row['id'],
+                    'order_number': row['order_number'],
+                    'staff_id': row['staff_id'],
+                    'items': sold_items[row['id']]
+                } for row in order_rows if row['id'] in sold_items])
+
+            for row in order_rows:
+                event_bus.emit(session, 'orders.created', {
+                    'id': row['id'],
+                    'order_number': row['order_number'],
+                    'total_amount': row['total_amount'],
+                    'status': row['status'].value,
+                    'source': 'batch'
+                })
+
+        return results
+
+    def _batch_result(self, index, client_reference, status, order_id=None, order_number=None, errors=None):
+        return {
+            'index': index,
+            'clientReference': client_reference,
+            'status': status,
+            'orderId': order_id,
+            'orderNumber': order_number,
+            'errors': errors or []
+        }
 
     def get_orders_by_filters(self, id=None, user_id=None, status=None, all=False, start_and_end=None):
         with session_scope() as session:
-            from sqlalchemy.orm import joinedload
             query = session.query(Order).options(joinedload(Order.order_items))
             query = query.order_by(Order.created_at.desc())
 
@@ -0,0 +1,172 @@
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from sqlalchemy import insert, update, values, column, Numeric
+from sqlalchemy.dialects.postgresql import UUID
+
+from orm.db_init import session_scope
+from orm.models.model_recipe_items import RecipeItem
+from orm.models.model_menu import MenuItem
+from orm.models.model_inventory import InventoryItem
+from orm.models.model_stock_movements import StockMovement, MovementType
+from orm.controllers.controller_stock_alerts import StockAlertController
+from services.event_bus import event_bus
+
+
+class RecipeController:
+    def __init__(self):
+        self.stock_alert_controller = StockAlertController()
+
+    def get_recipe(self, menu_item_id):
+        with session_scope() as session:
+            if not session.query(MenuItem.id).filter(MenuItem.id == menu_item_id).first():
+                return None
+            rows = session.query(RecipeItem, InventoryItem.name, InventoryItem.unit).join(
+                InventoryItem, InventoryItem.id == RecipeItem.inventory_item_id
+            ).filter(RecipeItem.menu_item_id == menu_item_id).order_by(InventoryItem.name.asc()).all()
+            return [self.recipe_item_format(recipe_item, name, unit) for recipe_item, name, unit in rows]
+
+    def set_recipe(self, menu_item_id, ingredients):
+        """
+        Replace the bill of materials of a menu item
+
+        Args:
+            menu_item_id (str): Menu item the recipe belongs to
+            ingredients (list): Dicts with 'inventory_item_id' and 'quantity' per unit sold
+
+        Returns:
+            list: The stored recipe, or None if the menu item doesn't exist
+        """
+        with session_scope() as session:
+            if not session.query(MenuItem.id).filter(MenuItem.id == menu_item_id).first():
+                return None
+
+            inventory_item_ids = {str(ingredient['inventory_item_id']) for ingredient in ingredients}
+            if inventory_item_ids:
+                found = {
+                    str(item_id) for (item_id,) in session.query(InventoryItem.id).filter(
+                        InventoryItem.id.in_(inventory_item_ids)
+                    ).all()
+                }
+                missing = sorted(inventory_item_ids - found)
+                if missing:
+                    raise ValueError(f"Inventory items not found: {', '.join(missing)}")
+
+            session.query(RecipeItem).filter(RecipeItem.menu_item_id == menu_item_id).delete(synchronize_session=False)
+            if ingredients:
+                session.execute(insert(RecipeItem), [{
+                    'id': str(uuid.uuid4()),
+                    'menu_item_id': menu_item_id,
+                    'inventory_item_id': str(ingredient['inventory_item_id']),
+                    'quantity': ingredient['quantity']
+                } for ingredient in ingredients])
+        return self.get_recipe(menu_item_id)
+
+    def consume_ingredients(self, session, sales):
+        """
+        Decrement inventory for sold menu items inside the caller's transaction
+
+        The affected inventory rows are locked in id order first, so concurrent orders
+        sharing ingredients queue up instead of deadlocking, then all of them are updated
+        by one UPDATE ... FROM (VALUES ...) statement and the matching usage movements
+        are written with one bulk insert.
+
+        Stock is allowed to go below zero: a sale has already happened, and refusing it
+        because the counted stock is off would only lose the order. The shortfall stays
+        visible as the negative new_stock of the usage movement and the item's open
+        out-of-stock alert, and is corrected by the next stock take.
+
+        Args:
+            session: Session of the transaction that records the sales
+            sales (list): Dicts with 'order_id', 'order_number', 'staff_id' and
+                          'items' as (menu_item_id, quantity) pairs
+
+        Returns:
+            list: Ids of the inventory items whose stock changed
+        """
+        menu_item_ids = {str(menu_item_id) for sale in sales for menu_item_id, _ in sale['items']}
+        if not menu_item_ids:
+            return []
+
+        recipes = defaultdict(list)
+        for menu_item_id, inventory_item_id, quantity in session.query(
+                RecipeItem.menu_item_id, RecipeItem.inventory_item_id, RecipeItem.quantity
+        ).filter(RecipeItem.menu_item_id.in_(menu_item_ids)).all():
+            recipes[str(menu_item_id)].append((str(inventory_item_id), quantity))
+        if not recipes:
+            return []
+
+        # Usage per sale and inventory item, in sale order
+        sale_usage = []
+        total_usage = defaultdict(int)
+        for sale in sales:
+            usage = defaultdict(int)
+            for menu_item_id, quantity in sale['items']:
+                for inventory_item_id, per_unit in recipes.get(str(menu_item_id), []):
+                    usage[inventory_item_id] += per_unit * quantity
+            for inventory_item_id, quantity in usage.items():
+                total_usage[inventory_item_id] += quantity
+            sale_usage.append(usage)
+
+        # Lock in a fixed order; the UPDATE below would lock rows in whatever order the planner picks
+        session.query(InventoryItem.id).filter(
+            InventoryItem.id.in_(list(total_usage.keys()))
+        ).order_by(InventoryItem.id).with_for_update().all()
+
+        now = datetime.now(timezone.utc)
+        consumed = values(
+            column('inventory_item_id', UUID(as_uuid=True)),
+            column('quantity', Numeric(10, 3)),
+            name='consumed'
+        ).data([(uuid.UUID(inventory_item_id), quantity) for inventory_item_id, quantity in total_usage.items()])
+        new_stock = dict(session.execute(
+            update(InventoryItem)
+            .where(InventoryItem.id == consumed.c.inventory_item_id)
+            .values(current_stock=InventoryItem.current_stock - consumed.c.quantity, updated_at=now)
+            .returning(InventoryItem.id, InventoryItem.current_stock)
+            .execution_options(synchronize_session=False)
+        ).all())
+
+        # Walk the sales forward from the pre-sale stock so each movement has its own running balance
+        running_stock = {
+            str(inventory_item_id): stock + total_usage[str(inventory_item_id)]
+            for inventory_item_id, stock in new_stock.items()
+        }
+        movement_rows = []
+        for sale, usage in zip(sales, sale_usage):
+            for inventory_item_id, quantity in usage.items():
+                if inventory_item_id not in running_stock:
+                    continue
+                previous_stock = running_stock[inventory_item_id]
+                running_stock[inventory_item_id] = previous_stock - quantity
+                movement_rows.append({
+                    'id': str(uuid.uuid4()),
+                    'inventory_item_id': inventory_item_id,
+                    'type': MovementType.usage,
+                    'quantity': -quantity,
+                    'previous_stock': previous_stock,
+                    'new_stock': previous_stock - quantity,
+                    'reason': f"Sale {sale['order_number']}",
+                    'staff_id': sale['staff_id'],
+                    'reference_order_id': sale['order_id'],
+                    'created_at': now
+                })
+        if movement_rows:
+            session.execute(insert(StockMovement), movement_rows)
+        self.stock_alert_controller.evaluate_items(session, list(running_stock.keys()))
+        event_bus.emit(session, 'inventory.changed', {
+            'inventoryItemIds': list(running_stock.keys()),
+            'source': 'sale'
+        })
+
+        return list(running_stock.keys())
+
+    def recipe_item_format(self, recipe_item, inventory_item_name=None, unit=None):
+        return {
+            'id': str(recipe_item.id),
+            'menuItemId': str(recipe_item.menu_item_id),
+            'inventoryItemId': str(recipe_item.inventory_item_id),
+            'inventoryItemName': inventory_item_name,
+            'unit': unit,
+            'quantity': float(recipe_item.quantity)
+        }
@@ -0,0 +1,175 @@
+import uuid
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from orm.db_init import session_scope
+from orm.models.model_inventory import InventoryItem
+from orm.models.model_stock_alerts import StockAlert, AlertType, AlertSeverity
+from services.event_bus import event_bus
+
+STOCK_LEVEL_ALERTS = (AlertType.low_stock, AlertType.out_of_stock)
+EXPIRY_ALERTS = (AlertType.expiring_soon, AlertType.expired)
+
+ALERT_SEVERITIES = {
+    AlertType.out_of_stock: AlertSeverity.critical,
+    AlertType.expired: AlertSeverity.high,
+    AlertType.low_stock: AlertSeverity.medium,
+    AlertType.expiring_soon: AlertSeverity.low
+}
+
+
+class StockAlertController:
+    def evaluate_items(self, session, inventory_item_ids=None):
+        """
+        Bring the open low/out-of-stock alerts of inventory items in line with their stock
+
+        Called inside the transaction that changed the stock, so only the touched
+        items are read. Passing None re-evaluates the whole inventory.
+
+        Args:
+            session: Session of the transaction that changed the stock
+            inventory_item_ids (list): Items to evaluate, or None for all items
+        """
+        if inventory_item_ids is not None and not inventory_item_ids:
+            return
+
+        query = session.query(
+            InventoryItem.id, InventoryItem.name, InventoryItem.unit,
+            InventoryItem.current_stock, InventoryItem.min_stock_level
+        )
+        if inventory_item_ids is not None:
+            query = query.filter(InventoryItem.id.in_(inventory_item_ids))
+
+        wanted = {}
+        for item in query.all():
+            if item.current_stock <= 0:
+                wanted[item.id] = (AlertType.out_of_stock, f"{item.name} is out of stock")
+            elif item.current_stock <= item.min_stock_level:
+                wanted[item.id] = (AlertType.low_stock,
+                                   f"{item.name} is low on stock ({float(item.current_stock)} {item.unit} left, "
+                                   f"minimum {float(item.min_stock_level)})")
+            else:
+                wanted[item.id] = None
+
+        self._reconcile(session, wanted, STOCK_LEVEL_ALERTS)
+
+    def sweep_expiry(self, warning_days=3):
+        """
+        Raise expiring-soon and expired alerts, resolving those whose item was restocked or removed
+
+        Only items inside the warning window are read, through the index on expiry_date.
+
+        Returns:
+            int: Number of items with an open expiry alert
+        """
+        with session_scope() as session:
+            # expiry_date is naive UTC; an aware value would be compared in the session's time zone
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            expiring = session.query(
+                InventoryItem.id, InventoryItem.name, InventoryItem.expiry_date,
+                (InventoryItem.expiry_date < now).label('is_expired')
+            ).filter(InventoryItem.expiry_date <= now + timedelta(days=warning_days)).all()
+
+            wanted = {
+                item.id: (AlertType.expired, f"{item.name} expired on {item.expiry_date.date().isoformat()}")
+                if item.is_expired else
+                (AlertType.expiring_soon, f"{item.name} expires on {item.expiry_date.date().isoformat()}")
+                for item in expiring
+            }
+            # Items that left the window since the last sweep
+            for (inventory_item_id,) in session.query(StockAlert.inventory_item_id).filter(
+                    StockAlert.resolved == False,
+                    StockAlert.type.in_(EXPIRY_ALERTS)
+            ).all():
+                wanted.setdefault(inventory_item_id, None)
+
+            self._reconcile(session, wanted, EXPIRY_ALERTS)
+            return sum(1 for alert in wanted.values() if alert)
+
+    def _reconcile(self, session, wanted, alert_types):
+        """Resolve open alerts that no longer apply and open the missing ones, one statement each"""
+        if not wanted:
+            return
+        now = datetime.now(timezone.utc)
+
+        stale = [
+            alert_id for alert_id, inventory_item_id, alert_type in session.query(
+                StockAlert.id, StockAlert.inventory_item_id, StockAlert.type
+            ).filter(
+                StockAlert.inventory_item_id.in_(list(wanted.keys())),
+                StockAlert.type.in_(alert_types),
+                StockAlert.resolved == False
+            ).all()
+            if not wanted[inventory_item_id] or wanted[inventory_item_id][0] != alert_type
+        ]
+        if stale:
+            session.execute(
+                update(StockAlert)
+                .where(StockAlert.id.in_(stale))
+                .values(resolved=True, resolved_at=now, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+
+        new_alerts = [{
+            'id': uuid.uuid4(),
+            'inventory_item_id': inventory_item_id,
+            'type': alert[0],
+            'message': alert[1],
+            'severity': ALERT_SEVERITIES[alert[0]],
+            'acknowledged': False,
+            'resolved': False,
+            'created_at': now,
+            'updated_at': now
+        } for inventory_item_id, alert in wanted.items() if alert]
+        if new_alerts:
+            # Alerts that are already open are kept as they are by the partial unique index
+            opened = session.scalars(
+                pg_insert(StockAlert).values(new_alerts).on_conflict_do_nothing().returning(StockAlert)
+            ).all()
+            for alert in opened:
+                event_bus.emit(session, 'alerts.new', self.stock_alert_format(alert))
+
+    def get_stock_alerts(self, alert_type=None, include_resolved=False):
+        with session_scope() as session:
+            query = session.query(StockAlert, InventoryItem.name).join(
+                InventoryItem, InventoryItem.id == StockAlert.inventory_item_id
+            ).order_by(StockAlert.created_at.desc())
+
+            if alert_type:
+                query = query.filter(StockAlert.type == AlertType(alert_type))
+            if not include_resolved:
+                query = query.filter(StockAlert.resolved == False)
+
+            return [self.stock_alert_format(alert, name) for alert, name in query.all()]
+
+    def count_open_alerts(self, alert_types=STOCK_LEVEL_ALERTS, name=None, category=None, status=None):
+        """Count items with an open alert of the given types, among the items matching the inventory filters"""
+        with session_scope() as session:
+            query = session.query(StockAlert.inventory_item_id).filter(
+                StockAlert.resolved == False,
+                StockAlert.type.in_(alert_types)
+            )
+            if name or category or status:
+                query = query.join(InventoryItem, InventoryItem.id == StockAlert.inventory_item_id)
+                if name:
+                    query = query.filter(InventoryItem.name.ilike(f'%{name}%'))
+                if category:
+                    query = query.filter(InventoryItem.category == category)
+                if status:
+                    query = query.filter(InventoryItem.status == status)
+            return query.distinct().count()
+
+    def stock_alert_format(self, alert, inventory_item_name=None):
+        return {
+            'id': str(alert.id),
+            'inventoryItemId': str(alert.inventory_item_id),
+            'inventoryItemName': inventory_item_name,
+            'type': alert.type.value,
+            'message': alert.message,
+            'severity': alert.severity.value,
+            'acknowledged': alert.acknowledged,
+            'resolved': alert.resolved,
+            'resolvedAt': alert.resolved_at.isoformat() if alert.resolved_at else None,
+            'createdAt': alert.created_at.isoformat() if alert.created_at else None
+        }
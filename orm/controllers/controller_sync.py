@@ -0,0 +1,82 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime, timezone, timedelta
+from decouple import config
+
+from orm.db_init import session_scope
+from orm.models.model_sync_tombstones import SyncTombstone
+
+# Rows committed by a transaction that started just before a sync are still picked up by the next one
+SYNC_OVERLAP = timedelta(seconds=config('SYNC_OVERLAP_SECONDS', default=5, cast=int))
+# Deletions are kept this long; clients with older tokens get a full snapshot instead
+TOMBSTONE_RETENTION = timedelta(days=config('SYNC_TOMBSTONE_DAYS', default=30, cast=int))
+
+
+class SyncController:
+    def record_deletion(self, session, entity, entity_id):
+        """Record a deleted record inside the deleting transaction so delta syncs can report it"""
+        session.add(SyncTombstone(id=uuid.uuid4(), entity=entity, entity_id=entity_id))
+
+    def get_changes(self, model, entity, format_item, since_token=None):
+        """
+        Get the records of a model changed since a sync token
+
+        Args:
+            model: Model with an indexed updated_at column
+            entity (str): Entity name used in the tombstones, e.g. 'menu_items'
+            format_item: Function formatting one record
+            since_token (str): Token returned by the previous sync, or None for a full snapshot
+
+        Returns:
+            dict: 'changed' records, 'deleted' ids, the next 'syncToken' and whether it is a 'full' snapshot
+
+        Raises:
+            ValueError: If the token is malformed
+        """
+        now = datetime.now(timezone.utc)
+        since = self.decode_token(since_token) if since_token else None
+        full = since is None or since < now - TOMBSTONE_RETENTION
+
+        with session_scope() as session:
+            query = session.query(model).order_by(model.updated_at.asc(), model.id.asc())
+            deleted = []
+            if not full:
+                window_start = since - SYNC_OVERLAP
+                query = query.filter(model.updated_at > window_start)
+                deleted = [
+                    str(entity_id) for (entity_id,) in session.query(SyncTombstone.entity_id).filter(
+                        SyncTombstone.entity == entity,
+                        SyncTombstone.deleted_at > window_start
+                    ).all()
+                ]
+
+            return {
+                'changed': [format_item(item) for item in query.all()],
+                'deleted': deleted,
+                'syncToken': self.encode_token(now),
+                'full': full
+            }
+
+    def purge_tombstones(self):
+        """Delete tombstones older than the retention period, returning how many were removed"""
+        with session_scope() as session:
+            return session.query(SyncTombstone).filter(
+                SyncTombstone.deleted_at < datetime.now(timezone.utc) - TOMBSTONE_RETENTION
+            ).delete(synchronize_session=False)
+
+    def encode_token(self, timestamp):
+        payload = json.dumps({'v': 1, 't': timestamp.isoformat()}).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+    def decode_token(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            timestamp = datetime.fromisoformat(payload['t'])
+        except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+            raise ValueError("Invalid sync token")
+        if timestamp.tzinfo is None:
+            raise ValueError("Invalid sync token")
+        return timestamp
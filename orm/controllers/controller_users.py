@@ -11,6 +11,49 @@ from orm.models.model_user_permissions import UserPermission
 
 
 class UserController:
+    # Resolved once per process; the system user is never deleted once records reference it
+    _system_user_id = None
+
+    def get_or_create_system_user(self, session):
+        """Get or create a system user for records without a valid staff_id"""
+        if UserController._system_user_id:
+            return UserController._system_user_id
+
+        # Try to find an existing admin user
+        system_user = session.query(User.id).filter(User.username == 'admin').first()
+        if not system_user:
+            # Try to find any admin user
+            system_user = session.query(User.id).filter(User.role == UserRole.admin).first()
+        if system_user:
+            UserController._system_user_id = str(system_user.id)
+            return UserController._system_user_id
+            
+        # Create a system user if none exists (not cached until a later lookup finds it committed)
+        system_user_id = str(uuid.uuid4())
+        new_user = User(
+            id=system_user_id,
+            username='system',
+            first_name='System',
+            last_name='User',
+            email='system@cafepos.com',
+            role=UserRole.admin,
+            password_hash='system',  # Placeholder
+            is_active=True
+        )
+        session.add(new_user)
+        session.flush()
+        return system_user_id
+
+    def resolve_staff_id(self, session, staff_id):
+        """Return staff_id if it belongs to an existing user, otherwise the system user id"""
+        if staff_id:
+            try:
+                if session.query(User.id).filter(User.id == uuid.UUID(str(staff_id))).first():
+                    return str(staff_id)
+            except ValueError:
+                pass
+        return self.get_or_create_system_user(session)
+
     def create_user(self, username, password, first_name, last_name, email, role=UserRole.cashier, pin_code=None, is_active=True):
         with session_scope() as session:
             user_id = str(uuid.uuid4())
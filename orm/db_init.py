@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine, event
+import logging
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, Session
 from decouple import config
 from .base import Base
@@ -18,15 +20,58 @@ from orm.models.model_users import User
 from orm.models.model_orders import Order
 from orm.models.model_order_items import OrderItem
 from orm.models.model_order_discounts import OrderDiscount
+from orm.models.model_idempotency_keys import IdempotencyKey
+from orm.models.model_recipe_items import RecipeItem
+from orm.models.model_sync_tombstones import SyncTombstone
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = config('DATABASE_URL')
 
+# pg_trgm GIN indexes, which let ILIKE '%term%' filters and similarity ranking use an index.
+# They need the extension, so they are created by initialize_trigram_indexes() instead of
+# being declared on the models, and skipped on servers without it.
+TRIGRAM_INDEXES = {
+    'ix_menu_items_name_trgm': ('menu_items', 'name'),
+    'ix_menu_items_category_trgm': ('menu_items', 'category'),
+    'ix_menu_items_description_trgm': ('menu_items', 'description'),
+    'ix_inventory_items_name_trgm': ('inventory_items', 'name'),
+    'ix_users_username_trgm': ('users', 'username'),
+}
+trigram_search_enabled = False
+
 Session = sessionmaker()
 engine = create_engine(DATABASE_URL)
 Session.configure(bind=engine)
 
 def initialize_database():
+    global trigram_search_enabled
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so indexes added to existing models are created here
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    trigram_search_enabled = initialize_trigram_indexes()
+
+def initialize_trigram_indexes():
+    """Install pg_trgm and its indexes if possible, returning whether trigram search is available"""
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except SQLAlchemyError:
+        pass  # Not shipped with this server, lacking the privilege, or created concurrently by another worker
+
+    try:
+        with engine.begin() as connection:
+            if connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is None:
+                logger.warning("pg_trgm is not available; menu search falls back to substring matching")
+                return False
+            for name, (table, column) in TRIGRAM_INDEXES.items():
+                connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"))
+        return True
+    except SQLAlchemyError as e:
+        logger.warning(f"Could not create trigram indexes: {e}")
+        return False
 
 initialize_database()
 
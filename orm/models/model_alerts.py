@@ -11,7 +11,7 @@ class Alerts(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     inventory_item_id = Column(UUID(as_uuid=True), ForeignKey('inventory_items.id'), nullable=False)
-    alert_time = Column(DateTime, default=datetime.now(timezone.utc))
+    alert_time = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     alert_type = Column(String(100), nullable=False) # e.g., "low_stock"
     notification_sent = Column(Boolean, default=False)
     notification_method = Column(String(50))
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, DateTime, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime, timezone
+from ..base import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String(50), primary_key=True)  # e.g., 'orders.batch'
+    key = Column(String(255), primary_key=True)   # Client-supplied key, unique per scope
+    resource_id = Column(UUID(as_uuid=True), nullable=True)  # Record created by the first request
+    response_status = Column(Integer, nullable=True)  # Stored once the first request has responded
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, DECIMAL, DateTime, Text, Enum as SQLEnum, func
+from sqlalchemy import Column, String, DECIMAL, DateTime, Text, Index, case, text, Enum as SQLEnum, func
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.dialects.postgresql import UUID
 from datetime import datetime, timezone
 import uuid
@@ -15,6 +16,11 @@ class InventoryStatus(enum.Enum):
 
 class InventoryItem(Base):
     __tablename__ = "inventory_items"
+    __table_args__ = (
+        Index('ix_inventory_items_category_name', 'category', 'name'),
+        # Small index covering the reorder screen, which only lists items at or below their minimum
+        Index('ix_inventory_items_below_minimum', 'name', postgresql_where=text('current_stock <= min_stock_level')),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), nullable=False)
@@ -26,20 +32,36 @@ class InventoryItem(Base):
     cost_per_unit = Column(DECIMAL(10, 4), nullable=False, default=0)
     supplier = Column(String(100), nullable=True)
     last_restocked = Column(DateTime, nullable=True)
-    expiry_date = Column(DateTime, nullable=True)
+    expiry_date = Column(DateTime, nullable=True, index=True)
     barcode = Column(String(50), nullable=True)
     description = Column(Text, nullable=True)
     location = Column(String(100), nullable=True)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), index=True)
     
-    @property
+    @hybrid_property
     def status(self):
-        if self.expiry_date and self.expiry_date < datetime.now(timezone.utc):
-            return InventoryStatus.expired.value
-        elif self.current_stock <= 0:
+        if self.expiry_date:
+            # expiry_date is stored as naive UTC
+            now = datetime.now(timezone.utc)
+            if self.expiry_date.tzinfo is None:
+                now = now.replace(tzinfo=None)
+            if self.expiry_date < now:
+                return InventoryStatus.expired.value
+        if self.current_stock <= 0:
             return InventoryStatus.out_of_stock.value
         elif self.current_stock <= self.min_stock_level:
             return InventoryStatus.low_stock.value
         else:
             return InventoryStatus.in_stock.value
+
+    @status.inplace.expression
+    @classmethod
+    def _status_expression(cls):
+        return case(
+            # expiry_date is naive UTC, so compare it with the current UTC time, not the session's time zone
+            (cls.expiry_date < func.timezone('UTC', func.now()), InventoryStatus.expired.value),
+            (cls.current_stock <= 0, InventoryStatus.out_of_stock.value),
+            (cls.current_stock <= cls.min_stock_level, InventoryStatus.low_stock.value),
+            else_=InventoryStatus.in_stock.value
+        )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DECIMAL, Boolean, DateTime, Text, Integer
+from sqlalchemy import Column, String, DECIMAL, Boolean, DateTime, Text, Integer, Index, func
 from sqlalchemy.dialects.postgresql import UUID
 from datetime import datetime, timezone
 import uuid
@@ -17,5 +17,13 @@ class MenuItem(Base):
     image_url = Column(String(500), nullable=True)
     is_active = Column(Boolean, default=True)
     sort_order = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), index=True)
+
+
+# Prefix lookups for search typeahead: lower(name) LIKE 'la%'
+Index(
+    'ix_menu_items_name_prefix',
+    func.lower(MenuItem.name).label('name_lower'),
+    postgresql_ops={'name_lower': 'varchar_pattern_ops'}
+)
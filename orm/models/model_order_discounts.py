@@ -22,7 +22,7 @@ class OrderDiscount(Base):
     discount_amount = Column(DECIMAL(10, 2), nullable=False)
     reason = Column(String(255), nullable=False)
     staff_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    applied_at = Column(DateTime, default=datetime.now(timezone.utc))
+    applied_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     order = relationship("Order", back_populates="order_discounts")
     staff = relationship("User")
\ No newline at end of file
@@ -18,7 +18,7 @@ class OrderItem(Base):
     quantity = Column(Integer, nullable=False)
     line_total = Column(DECIMAL(10, 2), nullable=False)   # unit_price * quantity
     notes = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     order = relationship("Order", back_populates="order_items")
     menu_item = relationship("MenuItem")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DECIMAL, DateTime, ForeignKey, Integer, Text, Enum as SQLEnum
+from sqlalchemy import Column, String, DECIMAL, DateTime, ForeignKey, Integer, Text, Sequence, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
@@ -18,6 +18,10 @@ class OrderStatus(enum.Enum):
     voided = "voided"
 
 
+# Order number counter; never reused, so numbers can't collide even across days
+order_number_seq = Sequence('order_number_seq', metadata=Base.metadata)
+
+
 class Order(Base):
     __tablename__ = "orders"
 
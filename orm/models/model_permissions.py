@@ -10,4 +10,4 @@ class Permission(Base):
     name = Column(String(100), nullable=False)
     category = Column(String(50), nullable=False)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
\ No newline at end of file
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, DECIMAL, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+import uuid
+from ..base import Base
+
+
+class RecipeItem(Base):
+    __tablename__ = "recipe_items"
+    __table_args__ = (
+        UniqueConstraint('menu_item_id', 'inventory_item_id', name='uq_recipe_items_menu_item_inventory_item'),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    menu_item_id = Column(UUID(as_uuid=True), ForeignKey('menu_items.id', ondelete='CASCADE'), nullable=False, index=True)
+    inventory_item_id = Column(UUID(as_uuid=True), ForeignKey('inventory_items.id', ondelete='CASCADE'), nullable=False)
+    quantity = Column(DECIMAL(10, 3), nullable=False)  # Inventory units consumed per menu item sold
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    menu_item = relationship("MenuItem")
+    inventory_item = relationship("InventoryItem")
@@ -10,7 +10,7 @@ class RolePermission(Base):
 
     role_id = Column(UUID(as_uuid=True), ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True)
     permission_id = Column(String(50), ForeignKey('permissions.id', ondelete='CASCADE'), primary_key=True)
-    granted_at = Column(DateTime, default=datetime.now(timezone.utc))
+    granted_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     granted_by = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
 
     role = relationship("Role")
@@ -12,5 +12,5 @@ class Role(Base):
     name = Column(String(50), unique=True, nullable=False)
     description = Column(Text, nullable=True)
     is_system_role = Column(Boolean, default=False)  # Cannot be deleted
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
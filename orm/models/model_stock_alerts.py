@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, Boolean, Text, Enum as SQLEnum
+from sqlalchemy import Column, String, ForeignKey, DateTime, Boolean, Text, Index, text, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
@@ -23,6 +23,11 @@ class AlertSeverity(enum.Enum):
 
 class StockAlert(Base):
     __tablename__ = "stock_alerts"
+    __table_args__ = (
+        # At most one open alert of each type per item, so re-evaluating an item never duplicates alerts
+        Index('uq_stock_alerts_open_item_type', 'inventory_item_id', 'type', unique=True,
+              postgresql_where=text('resolved = false')),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     inventory_item_id = Column(UUID(as_uuid=True), ForeignKey('inventory_items.id', ondelete='CASCADE'), nullable=False)
@@ -35,8 +40,8 @@ class StockAlert(Base):
     resolved = Column(Boolean, default=False)
     resolved_by = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
     resolved_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     inventory_item = relationship("InventoryItem")
     acknowledged_by_user = relationship("User", foreign_keys=[acknowledged_by])
@@ -29,7 +29,7 @@ class StockMovement(Base):
     supplier = Column(String(100), nullable=True)
     reference_order_id = Column(UUID(as_uuid=True), ForeignKey('orders.id', ondelete='SET NULL'), nullable=True)
     notes = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     inventory_item = relationship("InventoryItem")
     staff = relationship("User")
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime, timezone
+import uuid
+from ..base import Base
+
+
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    entity = Column(String(50), nullable=False)  # e.g., 'menu_items', 'inventory_items'
+    entity_id = Column(UUID(as_uuid=True), nullable=False)  # Id of the deleted record
+    deleted_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
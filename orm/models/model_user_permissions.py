@@ -11,7 +11,7 @@ class UserPermission(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
     permission_id = Column(String(50), ForeignKey('permissions.id', ondelete='CASCADE'), primary_key=True)
     granted = Column(Boolean, default=True)  # TRUE = grant, FALSE = revoke
-    granted_at = Column(DateTime, default=datetime.now(timezone.utc))
+    granted_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     granted_by = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
 
     user = relationship("User", foreign_keys=[user_id])
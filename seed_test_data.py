@@ -4,10 +4,13 @@ Test Data Seeder for CafePOS Backend
 Seeds comprehensive test data using existing controllers
 """
 
+import argparse
+import random
 import sys
 import os
+import uuid
 from decimal import Decimal
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 # Add the project root to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -16,7 +19,17 @@ from orm.controllers.controller_menu import MenuController
 from orm.controllers.controller_users import UserController
 from orm.controllers.controller_inventory import InventoryController
 from orm.controllers.controller_roles import RoleController
-from orm.models.model_users import UserRole
+from orm.models.model_users import User, UserRole
+from orm.models.model_menu import MenuItem
+from orm.models.model_orders import Order, PaymentMethod, OrderStatus, order_number_seq
+from orm.models.model_order_items import OrderItem
+from orm.db_init import session_scope
+from sqlalchemy import func, insert, select
+
+ORDER_BATCH_SIZE = 5000
+TAX_RATE = Decimal('0.10')
+# Relative order volume by hour of day, peaking at the morning and lunch rushes
+HOURLY_WEIGHTS = {7: 8, 8: 14, 9: 12, 10: 8, 11: 9, 12: 13, 13: 10, 14: 6, 15: 6, 16: 5, 17: 4, 18: 3}
 
 def seed_menu_items():
     """Seed menu items with comprehensive coffee shop offerings"""
@@ -239,17 +252,99 @@ def seed_roles():
     except ImportError:
         print("Role controller not available, skipping role seeding")
 
-def main():
+def seed_orders(count, days=365):
+    """
+    Seed a large order history for benchmarking, spread over the last days days
+
+    Orders and their items are inserted in batches of ORDER_BATCH_SIZE with
+    multi-row INSERTs, bypassing the order controller (and so stock movements
+    and events), which would take hours for hundreds of thousands of orders.
+    Order numbers are drawn from order_number_seq, so they never collide with
+    orders taken by the server.
+    """
+    print(f"Seeding {count} orders over the last {days} days...")
+    with session_scope() as session:
+        menu_items = session.query(MenuItem.id, MenuItem.name, MenuItem.size, MenuItem.price).filter(
+            MenuItem.is_active == True
+        ).all()
+        staff_ids = session.scalars(select(User.id).where(User.is_active == True)).all()
+    if not menu_items or not staff_ids:
+        print("Menu items and users are needed to seed orders; seed them first")
+        return
+
+    # Popular items sell far more often than the rest
+    item_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(menu_items))]
+    hours, hour_weights = zip(*HOURLY_WEIGHTS.items())
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    created_count = 0
+    while created_count < count:
+        batch_size = min(ORDER_BATCH_SIZE, count - created_count)
+        with session_scope() as session:
+            counters = session.scalars(
+                select(order_number_seq.next_value()).select_from(func.generate_series(1, batch_size))
+            ).all()
+            orders, order_items = [], []
+            for counter in counters:
+                created_at = (today - timedelta(days=random.randrange(days))).replace(
+                    hour=random.choices(hours, hour_weights)[0], minute=random.randrange(60), second=random.randrange(60)
+                )
+                order_id = uuid.uuid4()
+                subtotal = Decimal('0.00')
+                for item in random.choices(menu_items, item_weights, k=random.choice((1, 1, 1, 2, 2, 3, 4))):
+                    quantity = random.choice((1, 1, 1, 2))
+                    line_total = item.price * quantity
+                    subtotal += line_total
+                    order_items.append({
+                        'id': uuid.uuid4(),
+                        'order_id': order_id,
+                        'menu_item_id': item.id,
+                        'menu_item_name': item.name,
+                        'menu_item_size': item.size,
+                        'unit_price': item.price,
+                        'quantity': quantity,
+                        'line_total': line_total,
+                        'created_at': created_at
+                    })
+                tax_amount = (subtotal * TAX_RATE).quantize(Decimal('0.01'))
+                total = subtotal + tax_amount
+                payment_method = random.choice((PaymentMethod.card, PaymentMethod.card, PaymentMethod.cash))
+                orders.append({
+                    'id': order_id,
+                    'order_number': f"ORD{created_at.strftime('%y%m%d')}{counter:06d}",
+                    'subtotal': subtotal,
+                    'discount_amount': Decimal('0.00'),
+                    'tax_amount': tax_amount,
+                    'total_amount': total,
+                    'payment_method': payment_method,
+                    'cash_received': total if payment_method == PaymentMethod.cash else Decimal('0.00'),
+                    'change_amount': Decimal('0.00'),
+                    'status': OrderStatus.refunded if random.random() < 0.01 else OrderStatus.completed,
+                    'staff_id': random.choice(staff_ids),
+                    'created_at': created_at,
+                    'updated_at': created_at
+                })
+            session.execute(insert(Order), orders)
+            session.execute(insert(OrderItem), order_items)
+        created_count += batch_size
+        print(f"  {created_count}/{count} orders")
+
+    print(f"Created {created_count} orders")
+
+def main(order_count=0, order_days=365, orders_only=False):
     """Run all seeders"""
     print("Starting CafePOS Test Data Seeding...")
     print("=" * 50)
     
     try:
         # Seed in order of dependencies
-        seed_roles()
-        seed_users()
-        seed_menu_items()
-        seed_inventory()
+        if not orders_only:
+            seed_roles()
+            seed_users()
+            seed_menu_items()
+            seed_inventory()
+        if order_count:
+            seed_orders(order_count, order_days)
         
         print("=" * 50)
         print("Seeding completed successfully!")
@@ -258,6 +353,8 @@ def main():
         print("* 5 Users with different roles (admin, manager, cashiers, trainee)")
         print("* 20+ Inventory items with realistic stock levels")
         print("* Some low-stock items for testing alerts")
+        if order_count:
+            print(f"* {order_count} historical orders over the last {order_days} days")
         print("\nTest Login Credentials:")
         print("* Admin: username='admin', password='password123', pin='1234'")
         print("* Manager: username='manager', password='password123', pin='2345'")
@@ -269,4 +366,9 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Seed CafePOS test data")
+    parser.add_argument('--orders', type=int, default=0, help="also seed this many historical orders, e.g. 300000 for benchmarks")
+    parser.add_argument('--days', type=int, default=365, help="spread the seeded orders over this many days")
+    parser.add_argument('--orders-only', action='store_true', help="only seed orders, into an already seeded database")
+    args = parser.parse_args()
+    main(args.orders, args.days, args.orders_only)
\ No newline at end of file
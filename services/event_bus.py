@@ -0,0 +1,148 @@
+"""
+Event Bus for CafePOS
+Cross-process publish/subscribe over Postgres LISTEN/NOTIFY, so every server
+worker sees the changes committed by the others without extra infrastructure
+"""
+
+import json
+import logging
+import uuid
+from collections import defaultdict
+from decouple import config
+from sqlalchemy import event, text
+from tornado.ioloop import IOLoop
+from orm.db_init import Session, engine
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads must stay below 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+
+# Dispatched locally after the LISTEN connection is re-established, as events may have been missed
+RECONNECTED_TOPIC = 'bus.reconnected'
+
+
+class EventBus:
+    def __init__(self):
+        self.channel = config('EVENT_BUS_CHANNEL', default='cafepos_events')
+        self.reconnect_seconds = config('EVENT_BUS_RECONNECT_SECONDS', default=5, cast=int)
+        self.origin = uuid.uuid4().hex  # Identifies this process in the events it emits
+        self._subscribers = defaultdict(list)  # topic or '*' -> callbacks
+        self._connection = None
+        self._io_loop = None
+        self._has_connected = False
+
+    @property
+    def connected(self):
+        """Whether the LISTEN connection is up, so changes from other workers are being received"""
+        return self._connection is not None
+
+    def subscribe(self, topic, callback):
+        """
+        Call callback(topic, data, origin) on the IOLoop for every event of a topic
+
+        Subscribing to '*' receives every topic.
+        """
+        self._subscribers[topic].append(callback)
+
+    def emit(self, session, topic, data):
+        """
+        Queue an event on the session's transaction
+
+        The queued events are sent with one pg_notify statement just before the
+        transaction commits; Postgres only delivers them to other workers if the
+        commit succeeds. Subscribers in this process get them right after the commit.
+        """
+        payload = json.dumps({"topic": topic, "data": data, "origin": self.origin}, default=str)
+        if len(payload.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+            # Too big for NOTIFY; subscribers re-read what they need by id
+            reference = {'id': data.get('id')} if isinstance(data, dict) and data.get('id') else {}
+            payload = json.dumps({"topic": topic, "data": {**reference, "truncated": True}, "origin": self.origin})
+        session.info.setdefault('bus_events', []).append((topic, data, payload))
+
+    def start(self):
+        """Open the dedicated LISTEN connection and watch it from the current IOLoop"""
+        self._io_loop = IOLoop.current()
+        try:
+            import psycopg2.extensions
+            cargs, cparams = engine.dialect.create_connect_args(engine.url)
+            connection = engine.dialect.connect(*cargs, **cparams)
+            connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+        except Exception as e:
+            logger.error(f"Event bus failed to connect, retrying in {self.reconnect_seconds}s: {e}")
+            self._io_loop.call_later(self.reconnect_seconds, self.start)
+            return
+
+        self._connection = connection
+        self._io_loop.add_handler(connection.fileno(), self._on_readable, IOLoop.READ)
+        logger.info(f"Event bus listening on channel {self.channel}")
+        if self._has_connected:
+            self._dispatch(RECONNECTED_TOPIC, {}, self.origin)
+        self._has_connected = True
+
+    def stop(self):
+        if self._connection is not None:
+            self._io_loop.remove_handler(self._connection.fileno())
+            self._connection.close()
+            self._connection = None
+
+    def _on_readable(self, fd, events):
+        try:
+            self._connection.poll()
+        except Exception as e:
+            logger.error(f"Event bus connection lost, reconnecting in {self.reconnect_seconds}s: {e}")
+            self._io_loop.remove_handler(fd)
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+            self._io_loop.call_later(self.reconnect_seconds, self.start)
+            return
+
+        while self._connection.notifies:
+            notify = self._connection.notifies.pop(0)
+            try:
+                message = json.loads(notify.payload)
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring malformed event: {notify.payload[:200]}")
+                continue
+            if message.get('origin') == self.origin:
+                continue  # Already dispatched locally after the commit
+            self._dispatch(message.get('topic'), message.get('data'), message.get('origin'))
+
+    def _dispatch(self, topic, data, origin):
+        for callback in self._subscribers.get(topic, []) + self._subscribers.get('*', []):
+            try:
+                callback(topic, data, origin)
+            except Exception as e:
+                logger.error(f"Event subscriber failed for {topic}: {e}")
+
+
+# Global event bus instance
+event_bus = EventBus()
+
+
+@event.listens_for(Session, 'before_commit')
+def _notify_queued_events(session):
+    events = session.info.pop('bus_events', None)
+    if events:
+        session.execute(
+            text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+            {'channel': event_bus.channel, 'payloads': [payload for _, _, payload in events]}
+        )
+        session.info['bus_committing'] = events
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_committed_events(session):
+    for topic, data, _ in session.info.pop('bus_committing', []):
+        event_bus._dispatch(topic, data, event_bus.origin)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_queued_events(session):
+    session.info.pop('bus_events', None)
+    session.info.pop('bus_committing', None)
@@ -0,0 +1,167 @@
+"""
+Health Service for CafePOS
+Probes the database, connection pool, printer, scheduler and background
+queues for the health endpoints, caching the results briefly so frequent
+load balancer probes stay cheap
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from decouple import config
+from sqlalchemy import text
+from orm.db_init import engine
+from services.email_service import email_service
+from services.event_bus import event_bus
+from services.image_service import image_service
+from services.printer_service import printer_service
+from services.scheduler_service import scheduler_service
+
+logger = logging.getLogger(__name__)
+
+# Check statuses, from best to worst
+OK = 'ok'
+DISABLED = 'disabled'
+DEGRADED = 'degraded'
+DOWN = 'down'
+
+
+class HealthService:
+    def __init__(self):
+        self.cache_seconds = config('HEALTH_CACHE_SECONDS', default=2.0, cast=float)
+        self.db_timeout_ms = config('HEALTH_DB_TIMEOUT_MS', default=1000, cast=int)
+        self.printer_timeout_ms = config('HEALTH_PRINTER_TIMEOUT_MS', default=500, cast=int)
+        # Workers with this fraction of their connection pool checked out report themselves as not ready
+        self.pool_saturation_limit = config('HEALTH_POOL_SATURATION_LIMIT', default=0.9, cast=float)
+        self.image_backlog_limit = config('HEALTH_IMAGE_BACKLOG_LIMIT', default=50, cast=int)
+        self.started_at = time.monotonic()
+        self._report = None
+        self._report_at = 0
+        self._pending = None
+
+    def liveness(self):
+        """The process is up and its IOLoop is running; never touches dependencies"""
+        return {
+            'status': OK,
+            'pid': os.getpid(),
+            'uptimeSeconds': round(time.monotonic() - self.started_at, 1),
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+
+    async def readiness(self):
+        """
+        Check every dependency, reusing the previous result for cache_seconds
+
+        Concurrent callers share one round of checks. The worker is ready when
+        the database answers and its connection pool has headroom; the other
+        checks only mark it degraded.
+
+        Returns:
+            dict: 'ready', 'status', 'checks' (each with 'status' and 'latencyMs') and 'timestamp'
+        """
+        if self._report is not None and time.monotonic() - self._report_at < self.cache_seconds:
+            return self._report
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._run_checks())
+        pending = self._pending
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            if self._pending is pending and pending.done():
+                self._pending = None
+
+    async def _run_checks(self):
+        database, printer = await asyncio.gather(self._check_database(), self._check_printer())
+        checks = {
+            'database': database,
+            'connectionPool': self._check_pool(),
+            'printer': printer,
+            'scheduler': self._check_scheduler(),
+            'eventBus': self._check_event_bus(),
+            'imageProcessing': self._check_image_backlog(),
+            'email': {'status': OK if email_service.postmark_token else DISABLED}
+        }
+        ready = checks['database']['status'] == OK and checks['connectionPool']['status'] == OK
+        degraded = any(check['status'] in (DEGRADED, DOWN) for check in checks.values())
+        self._report = {
+            'ready': ready,
+            'status': DOWN if not ready else DEGRADED if degraded else OK,
+            'checks': checks,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        self._report_at = time.monotonic()
+        if not ready:
+            logger.warning(f"Worker not ready: {checks}")
+        return self._report
+
+    async def _check_database(self):
+        def select_one():
+            with engine.connect() as connection:
+                with connection.begin():
+                    connection.execute(text(f"SET LOCAL statement_timeout = {int(self.db_timeout_ms)}"))
+                    connection.execute(text("SELECT 1"))
+
+        started = time.perf_counter()
+        try:
+            # In a thread, so a hung connection attempt can't stall the IOLoop
+            await asyncio.wait_for(asyncio.to_thread(select_one), self.db_timeout_ms / 1000)
+            return {'status': OK, 'latencyMs': elapsed_ms(started)}
+        except asyncio.TimeoutError:
+            return {'status': DOWN, 'latencyMs': elapsed_ms(started), 'error': f"No response within {self.db_timeout_ms}ms"}
+        except Exception as e:
+            return {'status': DOWN, 'latencyMs': elapsed_ms(started), 'error': str(e)}
+
+    def _check_pool(self):
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            return {'status': OK}
+        capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+        checked_out = pool.checkedout()
+        saturation = checked_out / capacity if capacity else 0
+        return {
+            'status': OK if saturation < self.pool_saturation_limit else DEGRADED,
+            'checkedOut': checked_out,
+            'capacity': capacity,
+            'saturation': round(saturation, 2)
+        }
+
+    async def _check_printer(self):
+        if not printer_service.printer_enabled:
+            return {'status': DISABLED}
+        started = time.perf_counter()
+        if printer_service.printer_type != 'network' or printer_service.test_mode:
+            status = OK if printer_service.is_printer_available() else DEGRADED
+            return {'status': status, 'type': printer_service.printer_type}
+
+        host = printer_service.printer_config['network_ip']
+        port = printer_service.printer_config['network_port']
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.printer_timeout_ms / 1000)
+            writer.close()
+            return {'status': OK, 'type': 'network', 'latencyMs': elapsed_ms(started)}
+        except Exception as e:
+            return {'status': DEGRADED, 'type': 'network', 'latencyMs': elapsed_ms(started), 'error': str(e) or type(e).__name__}
+
+    def _check_scheduler(self):
+        heartbeat = scheduler_service.last_heartbeat
+        return {
+            'status': OK if scheduler_service.is_alive() else DEGRADED,
+            'lastHeartbeat': heartbeat.isoformat() if heartbeat else None
+        }
+
+    def _check_event_bus(self):
+        return {'status': OK if event_bus.connected else DEGRADED}
+
+    def _check_image_backlog(self):
+        backlog = image_service.backlog
+        return {'status': OK if backlog < self.image_backlog_limit else DEGRADED, 'backlog': backlog}
+
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+# Global health service instance
+health_service = HealthService()
@@ -0,0 +1,76 @@
+"""
+Idempotency Service for CafePOS
+Stores responses for client-supplied Idempotency-Key headers so retried
+requests are answered from the first response instead of being re-executed
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from decouple import config
+from orm.controllers.controller_idempotency import IdempotencyController
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyService:
+    def __init__(self):
+        self.cache_size = config('IDEMPOTENCY_CACHE_SIZE', default=2048, cast=int)
+        # Keys (and their stored responses) are purged after this long; offline tills must
+        # replay their order batches within it, or the replayed orders are created again
+        self.key_ttl = timedelta(hours=config('IDEMPOTENCY_KEY_TTL_HOURS', default=168, cast=int))
+        self.idempotency_controller = IdempotencyController()
+        # (scope, key) -> (status, body, claimed at); most recently used last
+        self._responses = OrderedDict()
+
+    def get_response(self, scope, key):
+        """
+        Get the stored response for a key
+
+        Returns:
+            tuple: (status, body) if the first request has responded, otherwise None
+        """
+        cached = self._responses.get((scope, key))
+        if cached is not None:
+            status, body, claimed_at = cached
+            if datetime.now(timezone.utc) - claimed_at < self.key_ttl:
+                self._responses.move_to_end((scope, key))
+                return status, body
+            # The key may have been purged by now, possibly by another worker; ask the database
+            del self._responses[(scope, key)]
+
+        record = self.idempotency_controller.get_idempotency_key(scope, key)
+        if not record or record['responseStatus'] is None:
+            return None
+
+        claimed_at = datetime.fromisoformat(record['createdAt']) if record['createdAt'] else datetime.now(timezone.utc)
+        if claimed_at.tzinfo is None:
+            claimed_at = claimed_at.replace(tzinfo=timezone.utc)  # Stored as naive UTC
+        self._remember(scope, key, (record['responseStatus'], record['responseBody'], claimed_at))
+        return record['responseStatus'], record['responseBody']
+
+    def store_response(self, scope, key, status, body):
+        """Persist the response of the request that claimed the key"""
+        self._remember(scope, key, (status, body, datetime.now(timezone.utc)))
+        try:
+            self.idempotency_controller.store_response(scope, key, status, body)
+        except Exception as e:
+            # The key itself was committed with the order, so retries are still deduplicated
+            logger.error(f"Failed to store idempotent response for {scope}/{key}: {e}")
+
+    def purge_expired(self):
+        """Delete keys older than the TTL, and this process's cached responses for them, returning how many were removed"""
+        expired_before = datetime.now(timezone.utc) - self.key_ttl
+        for cache_key in [cache_key for cache_key, (_, _, claimed_at) in self._responses.items() if claimed_at <= expired_before]:
+            del self._responses[cache_key]
+        return self.idempotency_controller.purge_expired(self.key_ttl)
+
+    def _remember(self, scope, key, response):
+        self._responses[(scope, key)] = response
+        self._responses.move_to_end((scope, key))
+        while len(self._responses) > self.cache_size:
+            self._responses.popitem(last=False)
+
+
+# Global idempotency service instance
+idempotency_service = IdempotencyService()
@@ -0,0 +1,333 @@
+"""
+Image Service for CafePOS
+Runs image decoding, resizing and encoding in a process pool so uploads
+never block the IOLoop, with bounded concurrency per server process.
+Uploads are stored under their sha256 digest, so an image uploaded for
+several menu items is stored and processed once.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+from PIL import Image, features
+from orm.controllers.controller_menu import MenuController
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (300, 300)
+VARIANT_WIDTHS = tuple(int(w) for w in config('IMAGE_VARIANT_WIDTHS', default='160,320,640,1024').split(','))
+VARIANT_FORMATS = ('avif', 'webp', 'jpeg') if config('IMAGE_AVIF', default=True, cast=bool) and features.check('avif') \
+    else ('webp', 'jpeg')
+VARIANT_EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+VARIANT_CONTENT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+VARIANT_SAVE_OPTIONS = {
+    'avif': {'quality': 60, 'speed': 8},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True}
+}
+MANIFEST_FILENAME = 'manifest.json'
+# Spellings of the same format, stored under one name so their content is deduplicated
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+
+def _init_worker():
+    # Forked workers must never use the database connections inherited from the server
+    from orm.db_init import engine
+    engine.dispose(close=False)
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), daemon=True).start()
+
+
+def _exit_with_parent(parent_pid):
+    # The workers share the task pipe, so they never see it close if the server is killed
+    while os.getppid() == parent_pid:
+        time.sleep(2)
+    os._exit(0)
+
+
+def process_image(original_path, thumbnail_path, variants_dir, max_size=THUMBNAIL_SIZE):
+    """
+    Create the thumbnail and the responsive variants of an image file
+
+    The image is decoded once. Each variant width no wider than the original is
+    encoded in every format of VARIANT_FORMATS, and a manifest describing them is
+    written to variants_dir. Runs in a worker process, so it only takes and
+    returns picklable values.
+
+    Returns:
+        tuple: (thumbnail path, manifest dict), with None for whichever couldn't be made
+    """
+    try:
+        with Image.open(original_path) as img:
+            img.load()
+            # Convert to RGB if necessary (for PNG with transparency)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            original_width, original_height = img.size
+
+            # Create thumbnail (300x300 max, maintaining aspect ratio)
+            thumbnail = img.copy()
+            thumbnail.thumbnail(max_size, Image.Resampling.LANCZOS)
+            thumbnail.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
+
+            os.makedirs(variants_dir, exist_ok=True)
+            widths = sorted({w for w in VARIANT_WIDTHS if w < original_width} | {min(original_width, max(VARIANT_WIDTHS))})
+            variants = []
+            for width in widths:
+                height = max(1, round(original_height * width / original_width))
+                resized = img.resize((width, height), Image.Resampling.LANCZOS) if width != original_width else img
+                for image_format in VARIANT_FORMATS:
+                    filename = f"{width}.{VARIANT_EXTENSIONS[image_format]}"
+                    resized.save(os.path.join(variants_dir, filename), image_format.upper(), **VARIANT_SAVE_OPTIONS[image_format])
+                    variants.append({
+                        'width': width,
+                        'height': height,
+                        'format': image_format,
+                        'filename': filename,
+                        'bytes': os.path.getsize(os.path.join(variants_dir, filename))
+                    })
+
+        # Written last, and atomically: an image is only reused once its manifest exists
+        manifest = {'width': original_width, 'height': original_height, 'variants': variants}
+        manifest_path = os.path.join(variants_dir, MANIFEST_FILENAME)
+        with open(f"{manifest_path}.{os.getpid()}", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_path}.{os.getpid()}", manifest_path)
+        return thumbnail_path, manifest
+    except Exception as e:
+        logger.error(f"Failed to process image {original_path}: {e}")
+        return None, None
+
+
+def content_filename(digest, ext):
+    """Storage name of an upload: its sha256 digest, under a directory named after the first two hex digits"""
+    ext = ext.lower()
+    return f"{digest[:2]}/{digest}{EXTENSION_ALIASES.get(ext, ext)}"
+
+
+def variants_dir_for(upload_dir, filename):
+    """Directory holding the responsive variants of an uploaded image"""
+    return os.path.join(upload_dir, 'variants', os.path.splitext(os.path.basename(filename))[0])
+
+
+def read_manifest(variants_dir):
+    """Read the variant manifest of an image, or None if it has no variants"""
+    try:
+        with open(os.path.join(variants_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def choose_variant(manifest, width=None, accept=''):
+    """
+    Pick the variant to serve for a requested width and Accept header
+
+    The narrowest variant at least as wide as requested is used (the widest one when
+    no width is given), in the most compact format the client accepts.
+    """
+    formats = [f for f in VARIANT_FORMATS if f == 'jpeg' or VARIANT_CONTENT_TYPES[f] in accept]
+    candidates = [v for v in manifest['variants'] if v['format'] in formats]
+    if not candidates:
+        return None
+    widths = sorted({v['width'] for v in candidates})
+    chosen_width = widths[-1] if width is None else next((w for w in widths if w >= width), widths[-1])
+    for image_format in formats:
+        for variant in candidates:
+            if variant['width'] == chosen_width and variant['format'] == image_format:
+                return variant
+    return None
+
+
+class ImageService:
+    def __init__(self):
+        self.max_workers = config('IMAGE_WORKERS', default=os.cpu_count() or 2, cast=int)
+        # Images in flight per server process; bounds memory as well as CPU
+        self.max_concurrency = config('IMAGE_MAX_CONCURRENCY', default=self.max_workers * 2, cast=int)
+        self.upload_dir = config('UPLOAD_DIR', default='uploads')
+        self.menu_controller = MenuController()
+        self._pool = None
+        self._semaphore = None
+        self._in_flight = {}  # content filename -> future storing it
+
+    def start(self):
+        """
+        Start the worker processes
+
+        Called once at startup, before the server has started any threads or
+        listens on its port, as the workers are forked from it.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker
+            )
+            # Forked workers are all started on the first submission
+            self._pool.submit(os.getpid)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self.start()
+        return self._pool
+
+    @property
+    def backlog(self):
+        """Uploads being processed or waiting for a worker in this process"""
+        return len(self._in_flight)
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def save_upload(self, upload_path, original_path, thumbnail_path, variants_dir):
+        """
+        Store an uploaded image and create its thumbnail and variants without blocking the IOLoop
+
+        The spooled upload is moved into place on a thread and the image is processed
+        in the process pool.
+
+        Returns:
+            tuple: (thumbnail path, variant manifest), with None for whichever couldn't be made
+        """
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            await loop.run_in_executor(None, os.replace, upload_path, original_path)
+            try:
+                return await loop.run_in_executor(self.pool, process_image, original_path, thumbnail_path, variants_dir)
+            except Exception as e:
+                logger.error(f"Image worker failed for {original_path}: {e}")
+                return None, None
+
+    async def store_upload(self, upload_path, digest, ext):
+        """
+        Store an uploaded image under its content hash, processing it only if it is new
+
+        Uploads of an image that is already stored, or being stored by another
+        request of this process, reuse it; their spooled file is left for the
+        caller to clean up.
+
+        Returns:
+            dict: 'filename' under uploads/menu_items, 'thumbnail_path' and variant 'manifest'
+                (None if processing failed), and whether the image was 'deduplicated'
+        """
+        filename = content_filename(digest, ext)
+        stored = self._in_flight.get(filename)
+        if stored is not None:
+            return {**await asyncio.shield(stored), 'deduplicated': True}
+
+        stored = asyncio.ensure_future(self._store(filename, upload_path))
+        self._in_flight[filename] = stored
+        stored.add_done_callback(lambda _: self._in_flight.pop(filename, None))
+        return await asyncio.shield(stored)
+
+    async def _store(self, filename, upload_path):
+        loop = asyncio.get_running_loop()
+        original_path = os.path.join(self.upload_dir, 'menu_items', filename)
+        thumbnail_path = os.path.join(self.upload_dir, 'thumbnails', filename)
+        variants_dir = variants_dir_for(self.upload_dir, filename)
+
+        manifest = await loop.run_in_executor(None, self._reuse_stored, original_path, thumbnail_path, variants_dir)
+        if manifest is not None:
+            return {'filename': filename, 'thumbnail_path': thumbnail_path, 'manifest': manifest, 'deduplicated': True}
+
+        for directory in (os.path.dirname(original_path), os.path.dirname(thumbnail_path)):
+            await loop.run_in_executor(None, lambda d=directory: os.makedirs(d, exist_ok=True))
+        thumbnail_path, manifest = await self.save_upload(upload_path, original_path, thumbnail_path, variants_dir)
+        return {'filename': filename, 'thumbnail_path': thumbnail_path, 'manifest': manifest, 'deduplicated': False}
+
+    def _reuse_stored(self, original_path, thumbnail_path, variants_dir):
+        manifest = read_manifest(variants_dir)
+        if manifest is None or not os.path.exists(original_path) or not os.path.exists(thumbnail_path):
+            return None
+        # Restarts the garbage collector's grace period for the image about to be referenced again
+        os.utime(original_path)
+        return manifest
+
+    async def collect_unreferenced_images(self, grace_seconds):
+        """Remove the stored images whose reference count from MenuItem.image_url has dropped to zero"""
+        prefix = '/uploads/menu_items/'
+        referenced = {
+            image_url[len(prefix):] for image_url in self.menu_controller.get_image_reference_counts()
+            if image_url.startswith(prefix)
+        }
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.collect_garbage, referenced, grace_seconds
+        )
+
+    def collect_garbage(self, referenced_filenames, grace_seconds):
+        """
+        Remove stored images that no menu item references
+
+        Files modified within the grace period are kept, so images whose upload is
+        still being saved are never collected. Thumbnails, variants and spooled
+        uploads left behind without an original are removed as well. Blocking; run
+        it off the IOLoop.
+
+        Args:
+            referenced_filenames (set): Filenames under uploads/menu_items in use
+            grace_seconds (int): Minimum age of the files to remove
+
+        Returns:
+            int: Number of stored images removed
+        """
+        cutoff = time.time() - grace_seconds
+        originals_dir = os.path.join(self.upload_dir, 'menu_items')
+
+        def expired(path):
+            try:
+                return os.path.getmtime(path) < cutoff
+            except OSError:
+                return False
+
+        def files_under(directory):
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    yield path, os.path.relpath(path, directory)
+
+        removed = 0
+        kept_stems = set()
+        for path, filename in files_under(originals_dir):
+            if filename in referenced_filenames or not expired(path):
+                kept_stems.add(os.path.splitext(os.path.basename(filename))[0])
+                continue
+            os.remove(path)
+            removed += 1
+
+        for path, filename in files_under(os.path.join(self.upload_dir, 'thumbnails')):
+            if os.path.splitext(os.path.basename(filename))[0] not in kept_stems and expired(path):
+                os.remove(path)
+
+        variants_root = os.path.join(self.upload_dir, 'variants')
+        if os.path.isdir(variants_root):
+            for stem in os.listdir(variants_root):
+                variants_dir = os.path.join(variants_root, stem)
+                if stem not in kept_stems and expired(variants_dir):
+                    shutil.rmtree(variants_dir, ignore_errors=True)
+
+        for path, _ in files_under(os.path.join(self.upload_dir, 'tmp')):
+            if expired(path):
+                os.remove(path)
+
+        if removed:
+            logger.info(f"Removed {removed} unreferenced images")
+        return removed
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Global image service instance
+image_service = ImageService()
@@ -0,0 +1,65 @@
+"""
+Menu Cache Service for CafePOS
+Keeps the serialized, precompressed menu catalog in memory so tills can
+fetch it without touching the database, and revalidate it with an ETag
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from orm.controllers.controller_menu import MenuController
+from services.event_bus import event_bus, RECONNECTED_TOPIC
+
+logger = logging.getLogger(__name__)
+
+
+class MenuCacheService:
+    def __init__(self):
+        self.menu_controller = MenuController()
+        self.version = 0  # Bumped on every menu change
+        self._catalog = None
+        # Changes committed by any worker, or missed while the bus was reconnecting
+        event_bus.subscribe('menu.changed', self._on_menu_changed)
+        event_bus.subscribe(RECONNECTED_TOPIC, self._on_menu_changed)
+
+    def get_catalog(self):
+        """
+        Get the menu catalog response, building it on first use after a change
+
+        Returns:
+            dict: 'version', 'etag', 'body' and 'gzip_body' of the full menu response
+        """
+        if self._catalog is not None and self._catalog['version'] == self.version:
+            return self._catalog
+
+        version = self.version
+        menu_items = self.menu_controller.get_menu_items_by_filters(all=True) or {"menu_items": [], "amount": 0}
+        data = json.dumps(menu_items, default=str, sort_keys=True)
+        # Derived from the content, so every worker hands out the same ETag for the same menu
+        etag = f'"{hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]}"'
+        body = json.dumps({
+            "data": menu_items,
+            "errors": [],
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }, default=str).encode('utf-8')
+
+        self._catalog = {
+            'version': version,
+            'etag': etag,
+            'body': body,
+            'gzip_body': gzip.compress(body, compresslevel=6)
+        }
+        return self._catalog
+
+    def invalidate(self):
+        self.version += 1
+        self._catalog = None
+
+    def _on_menu_changed(self, topic, data, origin):
+        self.invalidate()
+
+
+# Global menu cache service instance
+menu_cache_service = MenuCacheService()
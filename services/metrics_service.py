@@ -0,0 +1,161 @@
+"""
+Metrics Service for CafePOS
+Records request latency, status codes, database time and query counts, and
+response serialization time per route, and renders them in the Prometheus
+text exposition format
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from decouple import config
+from sqlalchemy import event
+from orm.db_init import engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+# Metrics of the request being handled in the current task, read by the cursor listeners
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class RequestMetrics:
+    """Timings collected while handling one request"""
+
+    def __init__(self, handler_name):
+        self.handler_name = handler_name
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.serialize_seconds = 0.0
+        self.query_shapes = Counter()  # Normalized statement -> executions, kept by the query diagnostics
+
+    def server_timing(self, total_seconds):
+        """Server-Timing header value, with durations in milliseconds"""
+        return ', '.join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f'serialize;dur={self.serialize_seconds * 1000:.1f}',
+            f'total;dur={total_seconds * 1000:.1f}'
+        ])
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            base = format_labels(label_names, labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+def format_labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class MetricsService:
+    ROUTE_LABELS = ('handler', 'method')
+
+    def __init__(self):
+        self.enabled = config('METRICS_ENABLED', default=True, cast=bool)
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(
+            'cafepos_http_request_duration_seconds', 'Time spent handling requests.', LATENCY_BUCKETS
+        )
+        self.db_duration = Histogram(
+            'cafepos_http_request_db_duration_seconds', 'Time spent in database queries per request.', LATENCY_BUCKETS
+        )
+        self.db_queries = Histogram(
+            'cafepos_http_request_db_queries', 'Database queries issued per request.', QUERY_COUNT_BUCKETS
+        )
+        self.serialize_duration = Histogram(
+            'cafepos_http_response_serialization_seconds', 'Time spent serializing response bodies per request.', LATENCY_BUCKETS
+        )
+        self.requests_total = defaultdict(int)  # (handler, method, status) -> count
+        self.db_queries_outside_requests = 0
+        if self.enabled:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def start_request(self, handler_name):
+        """Start collecting timings for the request handled by the current task"""
+        if not self.enabled:
+            return None
+        request_metrics = RequestMetrics(handler_name)
+        current_request.set(request_metrics)
+        return request_metrics
+
+    def finish_request(self, handler_name, method, status, duration, request_metrics):
+        if request_metrics is None:
+            return
+        labels = (handler_name, method)
+        with self._lock:
+            self.requests_total[(handler_name, method, str(status))] += 1
+            self.request_duration.observe(labels, duration)
+            self.db_duration.observe(labels, request_metrics.db_seconds)
+            self.db_queries.observe(labels, request_metrics.db_queries)
+            self.serialize_duration.observe(labels, request_metrics.serialize_seconds)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# HELP cafepos_http_requests_total Requests handled, by handler, method and status code.",
+                "# TYPE cafepos_http_requests_total counter"
+            ]
+            for labels, count in sorted(self.requests_total.items()):
+                lines.append(f"cafepos_http_requests_total{{{format_labels(self.ROUTE_LABELS + ('status',), labels)}}} {count}")
+            for histogram in (self.request_duration, self.db_duration, self.db_queries, self.serialize_duration):
+                lines.extend(histogram.render(self.ROUTE_LABELS))
+            lines.extend([
+                "# HELP cafepos_db_queries_outside_requests_total Database queries issued by background tasks.",
+                "# TYPE cafepos_db_queries_outside_requests_total counter",
+                f"cafepos_db_queries_outside_requests_total {self.db_queries_outside_requests}",
+                "# HELP cafepos_process_start_time_seconds Start time of the process since the epoch.",
+                "# TYPE cafepos_process_start_time_seconds gauge",
+                f"cafepos_process_start_time_seconds {self.started_at:.3f}"
+            ])
+        return '\n'.join(lines) + '\n'
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metrics_started_at = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'metrics_started_at', None)
+        request_metrics = current_request.get()
+        if started is None:
+            return
+        if request_metrics is None:
+            self.db_queries_outside_requests += 1
+            return
+        request_metrics.db_seconds += time.perf_counter() - started
+        request_metrics.db_queries += 1
+
+
+# Global metrics service instance
+metrics_service = MetricsService()
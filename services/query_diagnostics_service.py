@@ -0,0 +1,199 @@
+"""
+Query Diagnostics Service for CafePOS
+Logs slow SQL statements with their parameters, detects the same statement
+shape being issued over and over within one request (N+1 queries), and can
+sample EXPLAIN ANALYZE plans of slow SELECTs
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decouple import config
+from sqlalchemy import event, text
+from orm.db_init import engine
+from services.metrics_service import current_request
+
+logger = logging.getLogger(__name__)
+
+MAX_PARAMETER_LENGTH = 200
+MAX_SHAPES_TRACKED = 500
+# Parameters whose values are never logged
+REDACTED_PARAMETER_PATTERN = re.compile(r'password|pin|token|secret|hash', re.IGNORECASE)
+
+
+def statement_shape(statement):
+    """
+    Normalize a statement so executions differing only in their values compare equal
+
+    Bound parameters and literals become '?', expanded IN lists (with or
+    without casts) collapse to a single '(?)' and whitespace is squeezed.
+    """
+    shape = re.sub(r'%\(\w+\)s|%s|\$\d+|\?', '?', statement)
+    shape = re.sub(r"'(?:[^']|'')*'", '?', shape)
+    shape = re.sub(r'\b\d+(?:\.\d+)?\b', '?', shape)
+    shape = re.sub(r'\(\s*\?(?:::\w+)?(?:\s*,\s*\?(?:::\w+)?)*\s*\)', '(?)', shape)
+    return re.sub(r'\s+', ' ', shape).strip()
+
+
+def loggable_parameters(parameters):
+    """Parameters with secrets redacted and long values truncated"""
+    def clean(key, value):
+        if key is not None and REDACTED_PARAMETER_PATTERN.search(str(key)):
+            return '[REDACTED]'
+        value = repr(value)
+        return value if len(value) <= MAX_PARAMETER_LENGTH else value[:MAX_PARAMETER_LENGTH] + '...'
+
+    if isinstance(parameters, dict):
+        return {key: clean(key, value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return [loggable_parameters(row) for row in parameters[:5]]
+        return [clean(None, value) for value in parameters]
+    return parameters
+
+
+class QueryDiagnosticsService:
+    def __init__(self):
+        self.enabled = config('QUERY_DIAGNOSTICS_ENABLED', default=True, cast=bool)
+        self.slow_query_ms = config('SLOW_QUERY_MS', default=200, cast=float)
+        self.log_parameters = config('SLOW_QUERY_LOG_PARAMETERS', default=True, cast=bool)
+        # A statement shape repeated this many times within one request is reported as an N+1
+        self.repeated_query_threshold = config('REPEATED_QUERY_THRESHOLD', default=10, cast=int)
+        # Fraction of slow SELECTs re-run under EXPLAIN ANALYZE on a separate connection
+        self.explain_sample_rate = config('QUERY_EXPLAIN_SAMPLE_RATE', default=0.0, cast=float)
+        self.explain_timeout_ms = config('QUERY_EXPLAIN_TIMEOUT_MS', default=5000, cast=int)
+        history_size = config('QUERY_DIAGNOSTICS_HISTORY', default=100, cast=int)
+
+        self._lock = threading.Lock()
+        self.slow_queries = deque(maxlen=history_size)
+        self.repeated_queries = deque(maxlen=history_size)
+        self.slow_shapes = {}  # shape -> {'count', 'totalMs', 'maxMs'}
+        self._explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='query-explain')
+        self._explain_pending = False
+        if self.enabled:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def finish_request(self, handler_name, method, path, request_metrics):
+        """Report statement shapes the request repeated at least repeated_query_threshold times"""
+        if not self.enabled or request_metrics is None:
+            return
+        for shape, count in request_metrics.query_shapes.items():
+            if count < self.repeated_query_threshold:
+                continue
+            logger.warning(f"Repeated query in {handler_name} {method} {path}: {count} times: {shape}")
+            with self._lock:
+                self.repeated_queries.append({
+                    'handler': handler_name,
+                    'method': method,
+                    'path': path,
+                    'count': count,
+                    'statement': shape,
+                    'timestamp': datetime.now(timezone.utc).isoformat()
+                })
+
+    def get_report(self):
+        with self._lock:
+            slow_shapes = sorted(
+                ({'statement': shape, **stats} for shape, stats in self.slow_shapes.items()),
+                key=lambda entry: -entry['totalMs']
+            )
+            return {
+                'settings': {
+                    'enabled': self.enabled,
+                    'slowQueryMs': self.slow_query_ms,
+                    'repeatedQueryThreshold': self.repeated_query_threshold,
+                    'explainSampleRate': self.explain_sample_rate
+                },
+                'slowStatements': slow_shapes,
+                'slowQueries': list(reversed(self.slow_queries)),
+                'repeatedQueries': list(reversed(self.repeated_queries))
+            }
+
+    def reset(self):
+        with self._lock:
+            self.slow_queries.clear()
+            self.repeated_queries.clear()
+            self.slow_shapes.clear()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.diagnostics_started_at = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'diagnostics_started_at', None)
+        if started is None or conn.info.get('query_diagnostics_explain'):
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        request_metrics = current_request.get()
+        if request_metrics is None and duration_ms < self.slow_query_ms:
+            return
+
+        shape = statement_shape(statement)
+        if request_metrics is not None:
+            request_metrics.query_shapes[shape] += 1
+        if duration_ms >= self.slow_query_ms:
+            self._record_slow_query(statement, shape, parameters, executemany, duration_ms, request_metrics)
+
+    def _record_slow_query(self, statement, shape, parameters, executemany, duration_ms, request_metrics):
+        entry = {
+            'statement': statement,
+            'parameters': loggable_parameters(parameters) if self.log_parameters else None,
+            'durationMs': round(duration_ms, 2),
+            'handler': request_metrics.handler_name if request_metrics is not None else None,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'explain': None
+        }
+        logger.warning(f"Slow query ({duration_ms:.1f}ms) in {entry['handler'] or 'background task'}: {statement} {entry['parameters']}")
+
+        with self._lock:
+            self.slow_queries.append(entry)
+            stats = self.slow_shapes.get(shape)
+            if stats is None and len(self.slow_shapes) < MAX_SHAPES_TRACKED:
+                stats = self.slow_shapes[shape] = {'count': 0, 'totalMs': 0.0, 'maxMs': 0.0}
+            if stats is not None:
+                stats['count'] += 1
+                stats['totalMs'] = round(stats['totalMs'] + duration_ms, 2)
+                stats['maxMs'] = round(max(stats['maxMs'], duration_ms), 2)
+
+            explain = (
+                self.explain_sample_rate > 0
+                and not executemany
+                and not self._explain_pending
+                and shape.upper().startswith('SELECT')
+                and ' FOR UPDATE' not in shape.upper()
+                and random.random() < self.explain_sample_rate
+            )
+            if explain:
+                self._explain_pending = True
+        if explain:
+            self._explain_executor.submit(self._explain, entry, statement, parameters)
+
+    def _explain(self, entry, statement, parameters):
+        """Re-run a slow SELECT under EXPLAIN ANALYZE in a rolled back transaction, one at a time"""
+        try:
+            with engine.connect() as connection:
+                connection.info['query_diagnostics_explain'] = True
+                transaction = connection.begin()
+                try:
+                    connection.execute(text(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}"))
+                    plan = connection.exec_driver_sql(
+                        f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters or {}
+                    ).scalars().all()
+                finally:
+                    transaction.rollback()
+                    connection.info.pop('query_diagnostics_explain', None)
+            entry['explain'] = '\n'.join(plan)
+        except Exception as e:
+            logger.warning(f"Could not EXPLAIN slow query: {e}")
+        finally:
+            self._explain_pending = False
+
+
+# Global query diagnostics service instance
+query_diagnostics_service = QueryDiagnosticsService()
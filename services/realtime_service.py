@@ -0,0 +1,72 @@
+"""
+Realtime Service for CafePOS
+Pushes order, inventory and alert events to subscribed WebSocket clients
+so kitchen displays and dashboards no longer need to poll the REST API
+"""
+
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from decouple import config
+from services.event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ('orders.created', 'inventory.changed', 'alerts.new')
+
+
+class RealtimeService:
+    def __init__(self):
+        # Messages a client may have queued before it is dropped as a slow consumer
+        self.max_pending_messages = config('REALTIME_MAX_PENDING_MESSAGES', default=100, cast=int)
+        self._subscribers = defaultdict(set)  # topic -> connections
+        # Committed events reach the hub of every worker through the event bus
+        for topic in TOPICS:
+            event_bus.subscribe(topic, self._on_event)
+
+    def subscribe(self, connection, topics):
+        """Subscribe a connection to topics, returning the topics that were accepted"""
+        accepted = [topic for topic in topics if topic in TOPICS]
+        for topic in accepted:
+            self._subscribers[topic].add(connection)
+        return accepted
+
+    def unsubscribe(self, connection, topics=None):
+        for topic in (topics or TOPICS):
+            self._subscribers[topic].discard(connection)
+
+    def subscriber_count(self, topic=None):
+        if topic:
+            return len(self._subscribers[topic])
+        return len(set().union(*self._subscribers.values())) if self._subscribers else 0
+
+    def _on_event(self, topic, data, origin):
+        self.publish(topic, data)
+
+    def publish(self, topic, data):
+        """
+        Send an event to every subscriber of a topic
+
+        Called by the event bus on the IOLoop. A connection that can't keep up is
+        closed by its own send() instead of slowing down the publisher.
+        """
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return 0
+
+        message = json.dumps({
+            "topic": topic,
+            "data": data,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }, default=str)
+
+        delivered = 0
+        for connection in list(subscribers):
+            if connection.send(message):
+                delivered += 1
+        return delivered
+
+
+# Global realtime service instance
+realtime_service = RealtimeService()
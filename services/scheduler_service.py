@@ -4,15 +4,28 @@ from datetime import datetime, time, timedelta
 from decouple import config
 from services.email_service import email_service
 from orm.controllers.controller_orders import OrderController
+from orm.controllers.controller_stock_alerts import StockAlertController
+from orm.controllers.controller_sync import SyncController
+from orm.db_init import session_scope
+from services.image_service import image_service
+from services.idempotency_service import idempotency_service
 
 logger = logging.getLogger(__name__)
 
 class SchedulerService:
     def __init__(self):
         self.running = False
+        self.tasks = []
+        self.last_heartbeat = None  # Updated by the email loop every 30-60 seconds
         self.email_recipients = config('DAILY_EMAIL_RECIPIENTS', default='').split(',')
         self.email_time = config('DAILY_EMAIL_TIME', default='07:00')  # Format: HH:MM
+        self.expiry_sweep_minutes = config('EXPIRY_SWEEP_INTERVAL_MINUTES', default=60, cast=int)
+        self.expiry_warning_days = config('EXPIRY_WARNING_DAYS', default=3, cast=int)
+        # Unreferenced images younger than this are kept, as their upload may still be in progress
+        self.image_gc_grace_minutes = config('IMAGE_GC_GRACE_MINUTES', default=30, cast=int)
         self.order_controller = OrderController()
+        self.stock_alert_controller = StockAlertController()
+        self.sync_controller = SyncController()
         
     def parse_time(self, time_str):
         """Parse time string HH:MM to time object"""
@@ -98,6 +111,7 @@ class SchedulerService:
         logger.info(f"Email scheduler started - will send daily reports at {target_time}")
         
         while self.running:
+            self.last_heartbeat = datetime.now()
             try:
                 now = datetime.now()
                 current_time = now.time()
@@ -119,6 +133,41 @@ class SchedulerService:
                 logger.error(f"Error in scheduler loop: {str(e)}")
                 await asyncio.sleep(60)  # Wait a minute before retrying
     
+    async def schedule_expiry_sweeps(self):
+        """Scheduler loop for the inventory expiry sweep and other hourly housekeeping"""
+        logger.info(f"Expiry sweep started - will run every {self.expiry_sweep_minutes} minutes")
+
+        try:
+            # Stock-level alerts are kept current per movement; bring them in line once on startup
+            with session_scope() as session:
+                self.stock_alert_controller.evaluate_items(session)
+        except Exception as e:
+            logger.error(f"Error evaluating stock alerts: {str(e)}")
+
+        while self.running:
+            try:
+                alerted = self.stock_alert_controller.sweep_expiry(self.expiry_warning_days)
+                logger.info(f"Expiry sweep completed - {alerted} items expired or expiring soon")
+            except Exception as e:
+                logger.error(f"Error in expiry sweep: {str(e)}")
+            try:
+                purged = self.sync_controller.purge_tombstones()
+                if purged:
+                    logger.info(f"Purged {purged} expired sync tombstones")
+            except Exception as e:
+                logger.error(f"Error purging sync tombstones: {str(e)}")
+            try:
+                purged = idempotency_service.purge_expired()
+                if purged:
+                    logger.info(f"Purged {purged} expired idempotency keys")
+            except Exception as e:
+                logger.error(f"Error purging idempotency keys: {str(e)}")
+            try:
+                await image_service.collect_unreferenced_images(self.image_gc_grace_minutes * 60)
+            except Exception as e:
+                logger.error(f"Error collecting unreferenced images: {str(e)}")
+            await asyncio.sleep(self.expiry_sweep_minutes * 60)
+
     async def start(self):
         """Start the scheduler service"""
         if self.running:
@@ -129,7 +178,16 @@ class SchedulerService:
         logger.info("Starting scheduler service...")
         
         # Create task for daily email scheduling
-        asyncio.create_task(self.schedule_daily_emails())
+        self.tasks = [
+            asyncio.create_task(self.schedule_daily_emails()),
+            asyncio.create_task(self.schedule_expiry_sweeps())
+        ]
+    
+    def is_alive(self, max_heartbeat_age=timedelta(minutes=3)):
+        """Whether the scheduler loops are still running and the email loop has ticked recently"""
+        if not self.running or not self.tasks or any(task.done() for task in self.tasks):
+            return False
+        return self.last_heartbeat is not None and datetime.now() - self.last_heartbeat < max_heartbeat_age
     
     def stop(self):
         """Stop the scheduler service"""
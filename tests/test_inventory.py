@@ -1,6 +1,14 @@
 import requests
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from orm.db_init import engine
+from orm.controllers.controller_inventory import InventoryController
+from orm.models.model_inventory import InventoryItem
 
 BASE_URL = "http://127.0.0.1:8880"
 
@@ -38,6 +46,9 @@ def test_inventory():
     print(f"Response: {response.json()}")
     assert response.status_code == 200
     assert len(response.json()['data']['inventory']) > 0
+    # Without limit or offset the whole inventory comes back unpaginated
+    assert 'pagination' not in response.json()['data']
+    assert response.json()['data']['totalItems'] == len(response.json()['data']['inventory'])
 
     # 3. Retrieve the created inventory item by ID
     print(f"\nRetrieving inventory item with ID: {created_inventory_id}...")
@@ -56,7 +67,102 @@ def test_inventory():
     assert response.status_code == 200
     # Note: Inventory management may use different mechanisms for stock updates
 
-    # 5. Delete the created inventory item
+    # 5. Adjust stock atomically and record the movement
+    print(f"\nAdjusting stock of inventory item with ID: {created_inventory_id}...")
+    response = requests.get(f"{BASE_URL}/inventory/{created_inventory_id}")
+    starting_stock = response.json()['data']['inventory_item']['currentStock']
+    response = requests.post(f"{BASE_URL}/inventory/{created_inventory_id}/adjust",
+                             json={"adjustment": 5, "reason": "RESTOCK", "reference": "PO-1"})
+    print(f"POST /inventory/{created_inventory_id}/adjust Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    assert response.status_code == 200
+    adjustment = response.json()['data']['adjustment']
+    assert adjustment['previousStock'] == starting_stock
+    assert adjustment['newStock'] == starting_stock + 5
+    assert response.json()['data']['inventory']['currentStock'] == starting_stock + 5
+
+    response = requests.post(f"{BASE_URL}/inventory/{created_inventory_id}/adjust",
+                             json={"adjustment": -(starting_stock + 6), "reason": "WASTE"})
+    assert response.status_code == 400
+    assert response.json()['errorCode'] == "INVALID_ADJUSTMENT"
+
+    # Bulk adjustments are all-or-nothing
+    response = requests.post(f"{BASE_URL}/inventory/adjust", json={"adjustments": [
+        {"inventoryItemId": created_inventory_id, "adjustment": -2, "reason": "WASTE"}
+    ]})
+    print(f"POST /inventory/adjust Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()['data']['inventory'][0]['currentStock'] == starting_stock + 3
+
+    response = requests.post(f"{BASE_URL}/inventory/adjust", json={"adjustments": [
+        {"inventoryItemId": created_inventory_id, "adjustment": 1},
+        {"inventoryItemId": "00000000-0000-0000-0000-000000000000", "adjustment": 1}
+    ]})
+    assert response.status_code == 404
+    response = requests.get(f"{BASE_URL}/inventory/{created_inventory_id}")
+    assert response.json()['data']['inventory_item']['currentStock'] == starting_stock + 3
+
+    # Malformed ids and the same id in another case are validation errors, not server errors
+    for entries in ([{"inventoryItemId": "abc", "adjustment": 1}],
+                    [{"inventoryItemId": created_inventory_id, "adjustment": 1},
+                     {"inventoryItemId": created_inventory_id.upper(), "adjustment": 1}]):
+        response = requests.post(f"{BASE_URL}/inventory/adjust", json={"adjustments": entries})
+        assert response.status_code == 400
+        assert response.json()['errorCode'] == "VALIDATION_ERROR"
+        counts = [{"inventoryItemId": entry['inventoryItemId'], "countedStock": 1} for entry in entries]
+        response = requests.post(f"{BASE_URL}/inventory/stocktake", json={"counts": counts})
+        assert response.status_code == 400
+        assert response.json()['errorCode'] == "VALIDATION_ERROR"
+
+    # Stock take sets the counted quantity and reports the variance
+    response = requests.post(f"{BASE_URL}/inventory/stocktake", json={"counts": [
+        {"inventoryItemId": created_inventory_id, "countedStock": starting_stock}
+    ]})
+    print(f"POST /inventory/stocktake Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    assert response.status_code == 200
+    variance = response.json()['data']['variances'][0]
+    assert variance['previousStock'] == starting_stock + 3
+    assert variance['variance'] == -3
+    response = requests.get(f"{BASE_URL}/inventory/{created_inventory_id}")
+    assert response.json()['data']['inventory_item']['currentStock'] == starting_stock
+
+    # Emptying the item raises a single out-of-stock alert
+    response = requests.post(f"{BASE_URL}/inventory/stocktake", json={"counts": [
+        {"inventoryItemId": created_inventory_id, "countedStock": 0}
+    ]})
+    assert response.status_code == 200
+    response = requests.get(f"{BASE_URL}/inventory/alerts")
+    print(f"GET /inventory/alerts Status Code: {response.status_code}")
+    assert response.status_code == 200
+    item_alerts = [a for a in response.json()['data']['alerts'] if a['inventoryItemId'] == created_inventory_id]
+    assert [a['type'] for a in item_alerts] == ['out_of_stock']
+    assert requests.get(f"{BASE_URL}/inventory").json()['data']['lowStockItems'] >= 1
+    # The count follows the same filters as the listed items
+    emptied_name = requests.get(f"{BASE_URL}/inventory/{created_inventory_id}").json()['data']['inventory_item']['name']
+    assert requests.get(f"{BASE_URL}/inventory", params={"name": emptied_name}).json()['data']['lowStockItems'] == 1
+    assert requests.get(f"{BASE_URL}/inventory", params={"name": emptied_name, "status": "in_stock"}).json()['data']['lowStockItems'] == 0
+
+    # Restocking resolves it
+    response = requests.post(f"{BASE_URL}/inventory/{created_inventory_id}/adjust",
+                             json={"adjustment": 500, "reason": "RESTOCK"})
+    assert response.status_code == 200
+    response = requests.get(f"{BASE_URL}/inventory/alerts")
+    assert not [a for a in response.json()['data']['alerts'] if a['inventoryItemId'] == created_inventory_id]
+
+    # Status is filtered in SQL alongside name with server-side pagination
+    created_name = requests.get(f"{BASE_URL}/inventory/{created_inventory_id}").json()['data']['inventory_item']['name']
+    response = requests.get(f"{BASE_URL}/inventory", params={"status": "in_stock", "name": created_name, "limit": 1})
+    print(f"GET /inventory?status=in_stock Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert [item['id'] for item in response.json()['data']['inventory']] == [created_inventory_id]
+    assert response.json()['data']['pagination']['limit'] == 1
+    response = requests.get(f"{BASE_URL}/inventory", params={"status": "low_stock", "name": created_name})
+    assert response.json()['data']['inventory'] == []
+    response = requests.get(f"{BASE_URL}/inventory", params={"status": "unknown"})
+    assert response.status_code == 400
+
+    # 6. Delete the created inventory item
     print(f"\nDeleting inventory item with ID: {created_inventory_id}...")
     response = requests.delete(f"{BASE_URL}/inventory/{created_inventory_id}")
     print(f"DELETE /inventory/{created_inventory_id} Status Code: {response.status_code}")
@@ -78,5 +184,64 @@ def test_inventory():
 
     print("\n--- Inventory Tests Completed ---")
 
+def test_expired_status_in_any_session_time_zone():
+    print("\n--- Testing Expired Status Across Time Zones ---")
+
+    inventory_controller = InventoryController()
+    item = inventory_controller.create_inventory_item(f"Cream_{int(time.time() * 1000)}", "Dairy", 10, unit="liters")
+    # Expired two hours ago, stored as naive UTC
+    expired_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=2)
+    inventory_controller.update_inventory_item(item['id'], expiry_date=expired_at)
+
+    # 1. The SQL status agrees with the Python one even when the session is hours behind UTC
+    with engine.connect() as connection:
+        connection.execute(text("SET TIME ZONE 'America/New_York'"))
+        with Session(bind=connection) as session:
+            inventory_item = session.get(InventoryItem, item['id'])
+            sql_status = session.query(InventoryItem.status).filter(InventoryItem.id == item['id']).scalar()
+            print(f"Status in SQL: {sql_status}, in Python: {inventory_item.status}")
+            assert sql_status == inventory_item.status == 'expired'
+        connection.rollback()
+
+    # Clean up
+    inventory_controller.delete_inventory_item(item['id'])
+
+    print("\n--- Expired Status Tests Completed ---")
+
+
+def test_concurrent_bulk_adjustments():
+    print("\n--- Testing Concurrent Bulk Adjustments ---")
+
+    inventory_controller = InventoryController()
+    timestamp = str(int(time.time() * 1000))
+    item_ids = [
+        inventory_controller.create_inventory_item(f"{name}_{timestamp}", "Bakery", 100, unit="pieces")['id']
+        for name in ("Croissant", "Muffin", "Scone")
+    ]
+
+    def adjust(index):
+        # Overlapping item sets, listed in opposite orders
+        ordered = item_ids if index % 2 else list(reversed(item_ids))
+        return requests.post(f"{BASE_URL}/inventory/adjust", json={"adjustments": [
+            {"inventoryItemId": item_id, "adjustment": 1, "reason": "RESTOCK"} for item_id in ordered
+        ]})
+
+    # 1. Every adjustment is applied exactly once
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        responses = list(executor.map(adjust, range(30)))
+    print(f"Concurrent POST /inventory/adjust Status Codes: {sorted({response.status_code for response in responses})}")
+    assert all(response.status_code == 200 for response in responses)
+    for item_id in item_ids:
+        assert inventory_controller.get_inventory_items_by_filters(id=item_id)['currentStock'] == 130
+
+    # Clean up
+    for item_id in item_ids:
+        inventory_controller.delete_inventory_item(item_id)
+
+    print("\n--- Concurrent Bulk Adjustment Tests Completed ---")
+
+
 if __name__ == "__main__":
     test_inventory()
+    test_expired_status_in_any_session_time_zone()
+    test_concurrent_bulk_adjustments()
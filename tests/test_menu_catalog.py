@@ -0,0 +1,162 @@
+import http.client
+import requests
+import time
+from urllib.parse import urlparse
+
+BASE_URL = "http://127.0.0.1:8880"
+
+
+def test_menu_catalog_etag():
+    print("\n--- Testing Menu Catalog Cache ---")
+
+    # 1. The catalog carries an ETag and revalidates to 304 while unchanged
+    response = requests.get(f"{BASE_URL}/menu_items")
+    print(f"GET /menu_items Status Code: {response.status_code}")
+    assert response.status_code == 200
+    etag = response.headers['Etag']
+    assert 'menu_items' in response.json()['data']
+
+    response = requests.get(f"{BASE_URL}/menu_items", headers={"If-None-Match": etag})
+    print(f"GET /menu_items (If-None-Match) Status Code: {response.status_code}")
+    assert response.status_code == 304
+
+    # 2. Creating an item changes the catalog, and it is visible immediately
+    menu_item_data = {"name": f"CatalogMocha_{int(time.time() * 1000)}", "size": "Large", "price": 4.25}
+    response = requests.post(f"{BASE_URL}/menu_items", json=menu_item_data)
+    assert response.status_code == 201
+    menu_item_id = response.json()['data']['id']
+
+    response = requests.get(f"{BASE_URL}/menu_items", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers['Etag'] != etag
+    assert menu_item_id in [item['id'] for item in response.json()['data']['menu_items']]
+
+    # Clean up
+    requests.delete(f"{BASE_URL}/menu_items/{menu_item_id}")
+    response = requests.get(f"{BASE_URL}/menu_items")
+    assert menu_item_id not in [item['id'] for item in response.json()['data']['menu_items']]
+
+    print("\n--- Menu Catalog Cache Tests Completed ---")
+
+
+def test_menu_changes_since_token():
+    print("\n--- Testing Menu Delta Sync ---")
+
+    # 1. Without a token the full menu is returned with a sync token
+    response = requests.get(f"{BASE_URL}/menu_items/changes")
+    print(f"GET /menu_items/changes Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()['data']['full'] is True
+    token = response.json()['data']['syncToken']
+
+    # 2. A change made afterwards shows up in the next delta
+    menu_item_data = {"name": f"DeltaFlatWhite_{int(time.time() * 1000)}", "size": "Small", "price": 3.10}
+    response = requests.post(f"{BASE_URL}/menu_items", json=menu_item_data)
+    assert response.status_code == 201
+    menu_item_id = response.json()['data']['id']
+
+    response = requests.get(f"{BASE_URL}/menu_items/changes", params={"since": token})
+    assert response.status_code == 200
+    delta = response.json()['data']
+    assert delta['full'] is False
+    assert menu_item_id in [item['id'] for item in delta['changed']]
+
+    # 3. Deletions are reported as tombstones
+    requests.delete(f"{BASE_URL}/menu_items/{menu_item_id}")
+    response = requests.get(f"{BASE_URL}/menu_items/changes", params={"since": delta['syncToken']})
+    assert menu_item_id in response.json()['data']['deleted']
+
+    response = requests.get(f"{BASE_URL}/menu_items/changes", params={"since": "not-a-token"})
+    assert response.status_code == 400
+
+    print("\n--- Menu Delta Sync Tests Completed ---")
+
+
+def test_menu_bulk_import():
+    print("\n--- Testing Menu Bulk Import ---")
+
+    suffix = str(int(time.time() * 1000))
+    csv_content = (
+        "name,description,category,size_name,size_price\n"
+        f"ImportCortado_{suffix},Short,Coffee,Small,2.80\n"
+        f"ImportCortado_{suffix},Short,Coffee,Large,3.40\n"
+        f"importcortado_{suffix},Dup,Coffee,small,9.99\n"
+        ",Missing name,Coffee,Small,1.00\n"
+    )
+
+    def import_csv(**params):
+        return requests.post(f"{BASE_URL}/menu_items/bulk-import", data=params,
+                             files={"file": ("menu.csv", csv_content, "text/csv")})
+
+    # 1. A dry run reports the plan without writing
+    response = import_csv(dryRun="true")
+    print(f"POST /menu_items/bulk-import (dry run) Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    assert response.status_code == 200
+    assert response.json()['data']['created'] == 2
+    assert response.json()['data']['errors'] == 2
+    names = [item['name'] for item in requests.get(f"{BASE_URL}/menu_items").json()['data']['menu_items']]
+    assert f"ImportCortado_{suffix}" not in names
+
+    # 2. The import creates the new items, a re-import updates them
+    response = import_csv()
+    assert response.json()['data']['created'] == 2
+    response = import_csv(updateExisting="true")
+    assert response.json()['data']['updated'] == 2
+    assert response.json()['data']['created'] == 0
+
+    # 3. The file is required, and oversized uploads are refused before the body is read
+    response = requests.post(f"{BASE_URL}/menu_items/bulk-import", files={"other": ("menu.csv", csv_content, "text/csv")})
+    assert response.status_code == 400
+    connection = http.client.HTTPConnection(urlparse(BASE_URL).netloc)
+    connection.request("POST", "/menu_items/bulk-import", body=b"x",
+                       headers={"Content-Type": "multipart/form-data; boundary=x", "Content-Length": str(1024 ** 3)})
+    assert connection.getresponse().status == 413
+    connection.close()
+
+    # Clean up
+    for item in requests.get(f"{BASE_URL}/menu_items").json()['data']['menu_items']:
+        if item['name'] == f"ImportCortado_{suffix}":
+            requests.delete(f"{BASE_URL}/menu_items/{item['id']}")
+
+    print("\n--- Menu Bulk Import Tests Completed ---")
+
+
+def test_menu_search():
+    print("\n--- Testing Menu Search ---")
+
+    suffix = int(time.time() * 1000)
+    created = []
+    for name, category in ((f"Searchlatte{suffix}", "Coffee"), (f"Iced Searchlatte{suffix}", "Cold Drinks")):
+        response = requests.post(f"{BASE_URL}/menu_items", json={"name": name, "size": "Medium", "price": 3.60, "category": category})
+        assert response.status_code == 201
+        created.append(response.json()['data'])
+
+    # 1. A name prefix finds both, the item it starts ranked first
+    response = requests.get(f"{BASE_URL}/menu_items/search", params={"q": f"searchlatte{suffix}"[:-3]})
+    print(f"GET /menu_items/search Status Code: {response.status_code}")
+    assert response.status_code == 200
+    results = response.json()['data']['results']
+    assert [item['id'] for item in results[:2]] == [created[0]['id'], created[1]['id']]
+    assert results[0]['score'] > results[1]['score']
+
+    # 2. Filters and validation
+    response = requests.get(f"{BASE_URL}/menu_items/search", params={"q": f"searchlatte{suffix}", "category": "Cold Drinks"})
+    assert [item['id'] for item in response.json()['data']['results']] == [created[1]['id']]
+    response = requests.get(f"{BASE_URL}/menu_items/search", params={"q": "100%_"})
+    assert response.status_code == 200
+    response = requests.get(f"{BASE_URL}/menu_items/search", params={"q": " "})
+    assert response.status_code == 400
+
+    # Clean up
+    for item in created:
+        requests.delete(f"{BASE_URL}/menu_items/{item['id']}")
+
+    print("\n--- Menu Search Tests Completed ---")
+
+
+if __name__ == "__main__":
+    test_menu_catalog_etag()
+    test_menu_changes_since_token()
+    test_menu_bulk_import()
+    test_menu_search()
@@ -1,6 +1,7 @@
 import requests
 import json
 import time
+import uuid
 
 BASE_URL = "http://127.0.0.1:8880"
 
@@ -109,5 +110,217 @@ def test_orders():
 
     print("\n--- Orders and Order Items Tests Completed ---")
 
+def test_orders_batch():
+    print("\n--- Testing Offline Order Batch Ingestion ---")
+
+    timestamp = str(int(time.time() * 1000))
+    menu_item_data = {"name": f"BatchCoffee_{timestamp}", "size": "Small", "price": 3.00}
+    response = requests.post(f"{BASE_URL}/menu_items", json=menu_item_data)
+    assert response.status_code == 201
+    test_menu_item_id = response.json()['data']['id']
+
+    def offline_order(reference):
+        return {
+            "clientReference": reference,
+            "subtotal": 3.00,
+            "taxAmount": 0.30,
+            "total": 3.30,
+            "paymentMethod": "card",
+            "items": [{"productId": test_menu_item_id, "productName": "BatchCoffee", "size": "Small", "quantity": 1, "price": 3.00}]
+        }
+
+    batch = {"orders": [
+        offline_order(f"till1-{timestamp}-1"),
+        offline_order(f"till1-{timestamp}-2"),
+        {"clientReference": f"till1-{timestamp}-3", "items": []}
+    ]}
+
+    # 1. First replay creates the valid orders and reports the invalid one
+    response = requests.post(f"{BASE_URL}/orders/batch", json=batch)
+    print(f"POST /orders/batch Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    assert response.status_code == 200
+    data = response.json()['data']
+    assert data['summary'] == {"received": 3, "created": 2, "duplicates": 0, "failed": 1}
+    created_ids = [r['orderId'] for r in data['results'] if r['status'] == 'created']
+    assert len(set(r['orderNumber'] for r in data['results'][:2])) == 2
+
+    # 2. Replaying the same batch must not create the orders again
+    response = requests.post(f"{BASE_URL}/orders/batch", json=batch)
+    assert response.status_code == 200
+    data = response.json()['data']
+    assert data['summary']['created'] == 0
+    assert data['summary']['duplicates'] == 2
+    assert [r['orderId'] for r in data['results'][:2]] == created_ids
+
+    # 3. Created orders are readable with their items
+    for order_id in created_ids:
+        response = requests.get(f"{BASE_URL}/orders/{order_id}")
+        assert response.status_code == 200
+        assert len(response.json()['data']['order']['items']) == 1
+
+    # 4. An order for a menu item deleted while the till was offline fails alone
+    stale_order = offline_order(f"till1-{timestamp}-4")
+    stale_order['items'].append({"productId": str(uuid.uuid4()), "productName": "Gone", "quantity": 1, "price": 2.00})
+    malformed_order = offline_order(f"till1-{timestamp}-5")
+    malformed_order['items'][0]['productId'] = "not-a-uuid"
+    response = requests.post(f"{BASE_URL}/orders/batch", json={"orders": [
+        stale_order, malformed_order, offline_order(f"till1-{timestamp}-6")
+    ]})
+    print(f"POST /orders/batch (stale product) Response: {response.json()}")
+    assert response.status_code == 200
+    data = response.json()['data']
+    assert [r['status'] for r in data['results']] == ['failed', 'failed', 'created']
+    assert 'Unknown menu item' in data['results'][0]['errors'][0]
+    created_ids.append(data['results'][2]['orderId'])
+
+    # Clean up
+    for order_id in created_ids:
+        requests.delete(f"{BASE_URL}/orders/{order_id}")
+    requests.delete(f"{BASE_URL}/menu_items/{test_menu_item_id}")
+
+    print("\n--- Offline Order Batch Tests Completed ---")
+
+def test_order_numbers_past_six_digits():
+    print("\n--- Testing Order Numbers Past 999999 ---")
+    from sqlalchemy import text
+    from orm.db_init import engine
+
+    # The sequence is never reset, so it eventually outgrows the 6-digit padding
+    with engine.begin() as connection:
+        connection.execute(text("SELECT setval('order_number_seq', GREATEST(last_value, 1000000)) FROM order_number_seq"))
+
+    response = requests.post(f"{BASE_URL}/menu_items", json={"name": f"SeqCoffee_{int(time.time() * 1000)}", "size": "Small", "price": 3.00})
+    assert response.status_code == 201
+    menu_item_id = response.json()['data']['id']
+    order = {
+        "subtotal": 3.00,
+        "taxAmount": 0.30,
+        "total": 3.30,
+        "paymentMethod": "card",
+        "items": [{"productId": menu_item_id, "productName": "SeqCoffee", "size": "Small", "quantity": 1, "price": 3.00}]
+    }
+
+    # 1. Single orders get distinct, untruncated numbers
+    order_ids, order_numbers = [], []
+    for _ in range(3):
+        response = requests.post(f"{BASE_URL}/orders", json=order)
+        print(f"POST /orders Status Code: {response.status_code}")
+        assert response.status_code == 201
+        order_ids.append(response.json()['data']['order']['id'])
+        order_numbers.append(response.json()['data']['order']['orderNumber'])
+
+    # 2. Batched orders are numbered the same way
+    response = requests.post(f"{BASE_URL}/orders/batch", json={"orders": [
+        {**order, "clientReference": f"seq-{time.time()}-{i}"} for i in range(2)
+    ]})
+    assert response.status_code == 200
+    for result in response.json()['data']['results']:
+        order_ids.append(result['orderId'])
+        order_numbers.append(result['orderNumber'])
+
+    print(f"Order numbers: {order_numbers}")
+    assert len(set(order_numbers)) == len(order_numbers)
+    for number in order_numbers:
+        assert len(number) >= 3 + 6 + 7
+        assert int(number[9:]) >= 1000000
+
+    # Clean up
+    for order_id in order_ids:
+        requests.delete(f"{BASE_URL}/orders/{order_id}")
+    requests.delete(f"{BASE_URL}/menu_items/{menu_item_id}")
+
+    print("\n--- Order Number Tests Completed ---")
+
+def test_orders_idempotency_key():
+    print("\n--- Testing Idempotent Order Creation ---")
+
+    timestamp = str(int(time.time() * 1000))
+    menu_item_data = {"name": f"RetryCoffee_{timestamp}", "size": "Small", "price": 3.00}
+    response = requests.post(f"{BASE_URL}/menu_items", json=menu_item_data)
+    assert response.status_code == 201
+    test_menu_item_id = response.json()['data']['id']
+
+    order_data = {
+        "subtotal": 3.00,
+        "taxAmount": 0.30,
+        "total": 3.30,
+        "paymentMethod": "cash",
+        "items": [{"productId": test_menu_item_id, "productName": "RetryCoffee", "quantity": 1, "price": 3.00}]
+    }
+    headers = {"Idempotency-Key": f"till1-{timestamp}"}
+
+    # 1. First request creates the order
+    response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=headers)
+    print(f"POST /orders Status Code: {response.status_code}")
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    first_order = response.json()['data']['order']
+
+    # 2. A retry with the same key replays the stored response
+    response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=headers)
+    print(f"Retry POST /orders Status Code: {response.status_code}")
+    assert response.status_code == 201
+    assert response.headers.get("Idempotent-Replayed") == "true"
+    assert response.json()['data']['order']['id'] == first_order['id']
+    assert response.json()['data']['order']['orderNumber'] == first_order['orderNumber']
+
+    # 3. A key claimed without an order (or whose order is gone) is released and the order created
+    from sqlalchemy import text
+    from orm.db_init import engine
+    stale_key = f"till1-{timestamp}-stale"
+    with engine.begin() as connection:
+        connection.execute(
+            text("INSERT INTO idempotency_keys (scope, key, created_at) VALUES ('orders.create', :key, now())"),
+            {"key": stale_key}
+        )
+    response = requests.post(f"{BASE_URL}/orders", json=order_data, headers={"Idempotency-Key": stale_key})
+    print(f"POST /orders (stale key) Status Code: {response.status_code}")
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    stale_order = response.json()['data']['order']
+    response = requests.post(f"{BASE_URL}/orders", json=order_data, headers={"Idempotency-Key": stale_key})
+    assert response.json()['data']['order']['id'] == stale_order['id']
+
+    # Clean up
+    for order_id in (first_order['id'], stale_order['id']):
+        requests.delete(f"{BASE_URL}/orders/{order_id}")
+    requests.delete(f"{BASE_URL}/menu_items/{test_menu_item_id}")
+
+    print("\n--- Idempotent Order Creation Tests Completed ---")
+
+def test_idempotency_cache_expiry():
+    print("\n--- Testing Idempotency Response Cache Expiry ---")
+
+    from datetime import datetime, timedelta, timezone
+    from services.idempotency_service import IdempotencyService
+
+    service = IdempotencyService()
+    key = f"cache-{uuid.uuid4()}"
+
+    # 1. A stored response is served from memory while its key is within the TTL
+    service.store_response('tests.cache', key, 201, {"data": {"id": key}})
+    assert service.get_response('tests.cache', key) == (201, {"data": {"id": key}})
+
+    # 2. Past the TTL the cached copy is ignored; the key has no row left, so there is no response
+    service.key_ttl = timedelta(0)
+    assert service.get_response('tests.cache', key) is None
+    assert ('tests.cache', key) not in service._responses
+
+    # 3. Purging drops expired cached responses along with the database rows
+    service.key_ttl = timedelta(hours=168)
+    service.store_response('tests.cache', key, 201, {"data": {"id": key}})
+    status, body, _ = service._responses[('tests.cache', key)]
+    service._responses[('tests.cache', key)] = (status, body, datetime.now(timezone.utc) - timedelta(hours=169))
+    service.purge_expired()
+    assert ('tests.cache', key) not in service._responses
+
+    print("\n--- Idempotency Response Cache Expiry Tests Completed ---")
+
+
 if __name__ == "__main__":
     test_orders()
+    test_orders_batch()
+    test_order_numbers_past_six_digits()
+    test_orders_idempotency_key()
+    test_idempotency_cache_expiry()
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import requests
+import tornado.websocket
+
+BASE_URL = "http://127.0.0.1:8880"
+WS_URL = "ws://127.0.0.1:8880/ws"
+
+
+async def receive_order_created_event():
+    connection = await tornado.websocket.websocket_connect(f"{WS_URL}?topics=orders.created")
+    try:
+        subscribed = json.loads(await connection.read_message())
+        print(f"Subscription: {subscribed}")
+        assert subscribed['topics'] == ['orders.created']
+
+        order_data = {
+            "subtotal": 3.50,
+            "taxAmount": 0.35,
+            "total": 3.85,
+            "paymentMethod": "cash",
+            "items": [{"productName": "Espresso", "quantity": 1, "price": 3.50}]
+        }
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: requests.post(f"{BASE_URL}/orders", json=order_data)
+        )
+        assert response.status_code == 201
+        order_id = response.json()['data']['order']['id']
+
+        event = json.loads(await asyncio.wait_for(connection.read_message(), timeout=5))
+        print(f"Event: {event}")
+        assert event['topic'] == 'orders.created'
+        assert event['data']['id'] == order_id
+
+        connection.write_message(json.dumps({"action": "subscribe", "topics": ["nope"]}))
+        reply = json.loads(await connection.read_message())
+        assert reply['errors'] == ["Unknown topic: nope"]
+        return order_id
+    finally:
+        connection.close()
+
+
+def test_realtime_orders_created():
+    print("\n--- Testing Realtime Hub ---")
+
+    order_id = asyncio.run(receive_order_created_event())
+    requests.delete(f"{BASE_URL}/orders/{order_id}")
+
+    print("\n--- Realtime Hub Tests Completed ---")
+
+
+if __name__ == "__main__":
+    test_realtime_orders_created()
@@ -0,0 +1,130 @@
+import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from orm.db_init import session_scope
+from orm.controllers.controller_inventory import InventoryController
+from orm.models.model_stock_movements import StockMovement
+
+BASE_URL = "http://127.0.0.1:8880"
+
+
+def test_recipe_consumption_on_sale():
+    print("\n--- Testing Recipe Inventory Consumption ---")
+
+    inventory_controller = InventoryController()
+    timestamp = str(int(time.time() * 1000))
+
+    # Create a menu item and the inventory it consumes
+    menu_item_data = {"name": f"RecipeLatte_{timestamp}", "size": "Medium", "price": 4.50}
+    response = requests.post(f"{BASE_URL}/menu_items", json=menu_item_data)
+    assert response.status_code == 201
+    test_menu_item_id = response.json()['data']['id']
+
+    milk = inventory_controller.create_inventory_item(f"Milk_{timestamp}", "Dairy", 10, unit="liters")
+    beans = inventory_controller.create_inventory_item(f"Beans_{timestamp}", "Coffee", 2, unit="kg")
+
+    # 1. Store the recipe
+    recipe = {"ingredients": [
+        {"inventoryItemId": milk['id'], "quantity": 0.25},
+        {"inventoryItemId": beans['id'], "quantity": 0.018}
+    ]}
+    response = requests.put(f"{BASE_URL}/menu_items/{test_menu_item_id}/recipe", json=recipe)
+    print(f"PUT /menu_items/{test_menu_item_id}/recipe Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert len(response.json()['data']['ingredients']) == 2
+
+    response = requests.put(f"{BASE_URL}/menu_items/{test_menu_item_id}/recipe",
+                            json={"ingredients": [{"inventoryItemId": milk['id'], "quantity": -1}]})
+    assert response.status_code == 422
+
+    # 2. Selling two lattes consumes the recipe twice
+    order_data = {
+        "subtotal": 9.00,
+        "taxAmount": 0.90,
+        "total": 9.90,
+        "paymentMethod": "card",
+        "items": [{"productId": test_menu_item_id, "productName": "RecipeLatte", "quantity": 2, "price": 4.50}]
+    }
+    response = requests.post(f"{BASE_URL}/orders", json=order_data)
+    assert response.status_code == 201
+    assert response.json()['data']['inventoryUpdated'] is True
+    order_id = response.json()['data']['order']['id']
+
+    assert inventory_controller.get_inventory_items_by_filters(id=milk['id'])['currentStock'] == 9.5
+    assert inventory_controller.get_inventory_items_by_filters(id=beans['id'])['currentStock'] == 1.964
+
+    # 3. Each ingredient has a usage movement referencing the order
+    with session_scope() as session:
+        movements = session.query(StockMovement).filter(StockMovement.reference_order_id == order_id).all()
+        assert len(movements) == 2
+        milk_movement = next(m for m in movements if str(m.inventory_item_id) == milk['id'])
+        assert float(milk_movement.previous_stock) == 10
+        assert float(milk_movement.new_stock) == 9.5
+
+    # Clean up
+    requests.delete(f"{BASE_URL}/orders/{order_id}")
+    requests.delete(f"{BASE_URL}/menu_items/{test_menu_item_id}")
+    inventory_controller.delete_inventory_item(milk['id'])
+    inventory_controller.delete_inventory_item(beans['id'])
+
+    print("\n--- Recipe Inventory Consumption Tests Completed ---")
+
+
+def test_concurrent_sales_share_ingredients():
+    print("\n--- Testing Concurrent Sales Sharing Ingredients ---")
+
+    inventory_controller = InventoryController()
+    timestamp = str(int(time.time() * 1000))
+
+    # Two drinks made from the same two ingredients
+    milk = inventory_controller.create_inventory_item(f"SharedMilk_{timestamp}", "Dairy", 5, unit="liters")
+    beans = inventory_controller.create_inventory_item(f"SharedBeans_{timestamp}", "Coffee", 1, unit="kg")
+    menu_item_ids = []
+    for name in ("Flat", "Cortado"):
+        response = requests.post(f"{BASE_URL}/menu_items", json={"name": f"Shared{name}_{timestamp}", "size": "Small", "price": 3.00})
+        assert response.status_code == 201
+        menu_item_ids.append(response.json()['data']['id'])
+        response = requests.put(f"{BASE_URL}/menu_items/{menu_item_ids[-1]}/recipe", json={"ingredients": [
+            {"inventoryItemId": beans['id'], "quantity": 0.02},
+            {"inventoryItemId": milk['id'], "quantity": 0.2}
+        ]})
+        assert response.status_code == 200
+
+    def sell(index):
+        first, second = menu_item_ids if index % 2 else reversed(menu_item_ids)
+        return requests.post(f"{BASE_URL}/orders", json={
+            "subtotal": 6.00,
+            "taxAmount": 0.60,
+            "total": 6.60,
+            "paymentMethod": "card",
+            "items": [
+                {"productId": first, "productName": "Shared", "quantity": 1, "price": 3.00},
+                {"productId": second, "productName": "Shared", "quantity": 1, "price": 3.00}
+            ]
+        })
+
+    # 1. Concurrent orders all go through, and every unit sold is consumed exactly once
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        responses = list(executor.map(sell, range(30)))
+    print(f"Concurrent POST /orders Status Codes: {sorted({response.status_code for response in responses})}")
+    assert all(response.status_code == 201 for response in responses)
+
+    # 2. Stock goes below zero rather than refusing the sales
+    assert inventory_controller.get_inventory_items_by_filters(id=milk['id'])['currentStock'] == -7
+    assert inventory_controller.get_inventory_items_by_filters(id=beans['id'])['currentStock'] == -0.2
+
+    # Clean up
+    for response in responses:
+        requests.delete(f"{BASE_URL}/orders/{response.json()['data']['order']['id']}")
+    for menu_item_id in menu_item_ids:
+        requests.delete(f"{BASE_URL}/menu_items/{menu_item_id}")
+    inventory_controller.delete_inventory_item(milk['id'])
+    inventory_controller.delete_inventory_item(beans['id'])
+
+    print("\n--- Concurrent Sales Tests Completed ---")
+
+
+if __name__ == "__main__":
+    test_recipe_consumption_on_sale()
+    test_concurrent_sales_share_ingredients()
@@ -0,0 +1,130 @@
+import time
+import requests
+
+BASE_URL = "http://127.0.0.1:8880"
+
+
+def test_metrics():
+    print("\n--- Testing Request Metrics ---")
+
+    # 1. Responses carry Server-Timing with database and serialization time
+    response = requests.get(f"{BASE_URL}/orders", params={"limit": 5})
+    print(f"GET /orders Server-Timing: {response.headers.get('Server-Timing')}")
+    assert response.status_code == 200
+    server_timing = response.headers['Server-Timing']
+    assert 'db;dur=' in server_timing
+    assert 'serialize;dur=' in server_timing
+    assert 'total;dur=' in server_timing
+
+    # 2. The request is counted at /metrics
+    response = requests.get(f"{BASE_URL}/metrics")
+    print(f"GET /metrics Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain')
+    metrics = response.text
+    assert '# TYPE cafepos_http_request_duration_seconds histogram' in metrics
+    assert 'cafepos_http_requests_total{handler="OrdersHandler",method="GET",status="200"}' in metrics
+    assert 'cafepos_http_request_db_queries_count{handler="OrdersHandler",method="GET"}' in metrics
+    assert 'cafepos_http_request_duration_seconds_bucket{handler="OrdersHandler",method="GET",le="+Inf"}' in metrics
+
+    print("\n--- Request Metrics Tests Completed ---")
+
+
+def login_as(role):
+    """Create a user with the given role and log in, returning (user id, auth headers)"""
+    timestamp = str(int(time.time() * 1000))
+    response = requests.post(f"{BASE_URL}/users", json={
+        "username": f"diag_{role}_{timestamp}",
+        "password": "password123",
+        "firstName": "Diag",
+        "lastName": role.title(),
+        "email": f"diag_{role}_{timestamp}@example.com",
+        "role": role
+    })
+    assert response.status_code == 201
+    user_id = response.json()['data']['id']
+    response = requests.post(f"{BASE_URL}/auth/login", json={"username": f"diag_{role}_{timestamp}", "password": "password123"})
+    assert response.status_code == 200
+    return user_id, {"Authorization": f"Bearer {response.json()['data']['token']}"}
+
+
+def test_query_diagnostics():
+    print("\n--- Testing Query Diagnostics ---")
+
+    admin_id, admin_headers = login_as("admin")
+    cashier_id, cashier_headers = login_as("cashier")
+
+    # 1. The report holds SQL and parameters, so it needs an admin token
+    response = requests.get(f"{BASE_URL}/diagnostics/queries")
+    print(f"GET /diagnostics/queries (no token) Status Code: {response.status_code}")
+    assert response.status_code == 401
+    response = requests.get(f"{BASE_URL}/diagnostics/queries", headers=cashier_headers)
+    assert response.status_code == 403
+    response = requests.delete(f"{BASE_URL}/diagnostics/queries")
+    assert response.status_code == 401
+
+    # 2. The report lists slow and repeated queries along with the thresholds in use
+    requests.get(f"{BASE_URL}/orders", params={"limit": 5})
+    response = requests.get(f"{BASE_URL}/diagnostics/queries", headers=admin_headers)
+    print(f"GET /diagnostics/queries Status Code: {response.status_code}")
+    assert response.status_code == 200
+    report = response.json()['data']
+    assert report['settings']['slowQueryMs'] > 0
+    assert report['settings']['repeatedQueryThreshold'] > 1
+    for key in ('slowStatements', 'slowQueries', 'repeatedQueries'):
+        assert isinstance(report[key], list)
+    for query in report['slowQueries']:
+        assert query['durationMs'] >= report['settings']['slowQueryMs']
+
+    # 3. Clearing empties the report
+    response = requests.delete(f"{BASE_URL}/diagnostics/queries", headers=admin_headers)
+    assert response.status_code == 200
+    report = requests.get(f"{BASE_URL}/diagnostics/queries", headers=admin_headers).json()['data']
+    assert report['slowStatements'] == []
+    assert report['repeatedQueries'] == []
+
+    # Clean up
+    for user_id in (admin_id, cashier_id):
+        requests.delete(f"{BASE_URL}/users/{user_id}")
+
+    print("\n--- Query Diagnostics Tests Completed ---")
+
+
+def test_health():
+    print("\n--- Testing Health Endpoints ---")
+
+    # 1. Liveness doesn't depend on anything
+    response = requests.get(f"{BASE_URL}/health/live")
+    print(f"GET /health/live Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()['data']['status'] == 'ok'
+
+    # 2. Readiness reports each dependency it checked
+    response = requests.get(f"{BASE_URL}/health/ready")
+    print(f"GET /health/ready Status Code: {response.status_code}")
+    assert response.status_code == 200
+    report = response.json()['data']
+    assert report['ready'] is True
+    assert report['checks']['database']['status'] == 'ok'
+    assert report['checks']['database']['latencyMs'] >= 0
+    assert report['checks']['connectionPool']['capacity'] > 0
+    for check in ('printer', 'scheduler', 'eventBus', 'imageProcessing', 'email'):
+        assert report['checks'][check]['status'] in ('ok', 'disabled', 'degraded', 'down')
+
+    # 3. Results are cached between probes
+    response = requests.get(f"{BASE_URL}/health/ready")
+    assert response.json()['data']['timestamp'] == report['timestamp']
+
+    # 4. The summary endpoint reflects the same checks
+    response = requests.get(f"{BASE_URL}/health")
+    print(f"GET /health Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()['data']['services']['database'] == 'connected'
+
+    print("\n--- Health Endpoint Tests Completed ---")
+
+
+if __name__ == "__main__":
+    test_metrics()
+    test_query_diagnostics()
+    test_health()
@@ -0,0 +1,104 @@
+import io
+import time
+import requests
+from PIL import Image
+
+BASE_URL = "http://127.0.0.1:8880"
+
+
+def make_image(color, size=(800, 600)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def test_streamed_uploads():
+    print("\n--- Testing Streamed Image Uploads ---")
+
+    menu_item_data = {"name": f"UploadLatte_{int(time.time() * 1000)}", "size": "Medium", "price": 3.80}
+    response = requests.post(f"{BASE_URL}/menu_items", json=menu_item_data)
+    assert response.status_code == 201
+    menu_item = response.json()['data']
+
+    # 1. A single upload is stored with its thumbnail and variants
+    image = make_image((120, 80, 40))
+    response = requests.post(
+        f"{BASE_URL}/upload/image",
+        data={"menu_item_id": menu_item['id']},
+        files={"image": ("latte.jpg", image, "image/jpeg")}
+    )
+    print(f"POST /upload/image Status Code: {response.status_code}")
+    assert response.status_code == 200
+    upload = response.json()['data']
+    assert upload['file_size'] == len(image)
+    assert upload['thumbnail_url'] is not None
+    assert upload['variants']
+
+    response = requests.get(f"{BASE_URL}{upload['image_url']}", params={"original": "true"})
+    assert response.status_code == 200
+    assert response.content == image
+    assert 'immutable' in response.headers['Cache-Control']
+
+    # 2. The same image uploaded for another item is stored once
+    response = requests.post(f"{BASE_URL}/menu_items", json={**menu_item_data, "size": "Large"})
+    assert response.status_code == 201
+    large_item = response.json()['data']
+    response = requests.post(
+        f"{BASE_URL}/upload/image",
+        data={"menu_item_id": large_item['id']},
+        files={"image": ("latte_large.jpeg", image, "image/jpeg")}
+    )
+    print(f"POST /upload/image (duplicate) Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()['data']['deduplicated'] is True
+    assert response.json()['data']['image_url'] == upload['image_url']
+
+    # 3. Oversized requests are refused from their Content-Length
+    response = requests.post(
+        f"{BASE_URL}/upload/image",
+        data={"menu_item_id": menu_item['id']},
+        files={"image": ("huge.jpg", b"\0" * (11 * 1024 * 1024), "image/jpeg")}
+    )
+    print(f"POST /upload/image (11MB) Status Code: {response.status_code}")
+    assert response.status_code == 413
+
+    # 4. Bulk uploads match files to menu items by name and size, and report the ones that don't match
+    files = [
+        ("images", (f"{menu_item['name']}.jpg", make_image((30, 60, 90)), "image/jpeg")),
+        ("images", (f"{menu_item['name']}-L.jpg", make_image((90, 60, 30)), "image/jpeg")),
+        ("images", ("no_such_item_anywhere.jpg", make_image((10, 10, 10)), "image/jpeg")),
+        ("images", ("notes.txt", b"not an image", "text/plain"))
+    ]
+    response = requests.post(f"{BASE_URL}/upload/bulk-images", files=files)
+    print(f"POST /upload/bulk-images Status Code: {response.status_code}")
+    assert response.status_code == 200
+    bulk = response.json()['data']
+    assert bulk['uploaded'] == 2
+    assert bulk['failed'] == 2
+    results = {result['filename']: result for result in bulk['results']}
+    assert set(results[f"{menu_item['name']}.jpg"]['menu_item_ids']) == {menu_item['id'], large_item['id']}
+    assert results[f"{menu_item['name']}-L.jpg"]['menu_item_ids'] == [large_item['id']]
+    assert results[f"{menu_item['name']}-L.jpg"]['candidates'][0]['score'] == 1.0
+
+    response = requests.get(f"{BASE_URL}/menu_items/{large_item['id']}")
+    assert response.json()['data']['imageUrl'] == results[f"{menu_item['name']}-L.jpg"]['image_url']
+
+    # 5. A truncated body is rejected
+    response = requests.post(
+        f"{BASE_URL}/upload/bulk-images",
+        data=b"--abc\r\nContent-Disposition: form-data; name=\"images\"; filename=\"a.jpg\"\r\n\r\nabc",
+        headers={"Content-Type": "multipart/form-data; boundary=abc"}
+    )
+    print(f"POST /upload/bulk-images (truncated) Status Code: {response.status_code}")
+    assert response.status_code == 400
+
+    # Clean up
+    for item in (menu_item, large_item):
+        requests.delete(f"{BASE_URL}/images/management/{item['id']}")
+        requests.delete(f"{BASE_URL}/menu_items/{item['id']}")
+
+    print("\n--- Streamed Image Upload Tests Completed ---")
+
+
+if __name__ == "__main__":
+    test_streamed_uploads()